@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 # @@@ 모듈 방식 실행을 할 경우 .... 상대경로 import 대신 app.으로 변경해도 문제없음
 from app.schemas.translation import TranslationRequest, TranslationResponse, BatchTranslationRequest, BatchTranslationResponse, HealthResponse
 from app.services.translation_service import TranslationService
+from app.services.inference_executor import InferenceOverloadedError
 from app.core.deps import CurrentUser, DBDep
 # from app.db.session import get_db
 # from app.db.models.user import User
@@ -32,7 +33,10 @@ async def translate_text(
 
     """한국어를 영어로 번역합니다"""
     try:
-        return TranslationService.translate_ko_to_en(request, current_user.username)
+        return await TranslationService.translate_ko_to_en(request, current_user.username)
+    except InferenceOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        # 추론 대기열이 가득 찬 경우 503 Service Unavailable + Retry-After 헤더로 재시도 시점 안내
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
         # FastAPI의 HTTPException은 Error Response를 더 쉽게 보낼 수 있도록 하는 Class로
@@ -60,7 +64,9 @@ async def batch_translate_text(
 ):
     """한국어 문장들을 영어로 번역합니다"""
     try:
-        return TranslationService.batch_translate_ko_to_en(request)
+        return await TranslationService.batch_translate_ko_to_en(request)
+    except InferenceOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
         # FastAPI의 HTTPException은 Error Response를 더 쉽게 보낼 수 있도록 하는 Class로
@@ -57,6 +57,97 @@ class Settings:
     DEVICE: str = "cuda" if torch.cuda.is_available() else "cpu"
 
     BATCH_SIZE: int = int(_cfg.get("BATCH_SIZE", 1))
+    # 단일 문장 요청 micro-batching: BATCH_SIZE개가 모이거나 첫 요청 후 BATCH_MAX_WAIT_MS가 지나면 batch 실행
+    # # BATCH_SIZE가 1이면 micro-batching 사용 안함
+    BATCH_MAX_WAIT_MS: float = float(_cfg.get("BATCH_MAX_WAIT_MS", 5))
+    # 복수 문장 번역 시 길이순 bucket 하나의 최대 (문장 수 x padding 포함 source 토큰 길이)
+    MAX_TOKENS_PER_BATCH: int = int(_cfg.get("MAX_TOKENS_PER_BATCH", 4096))
+
+    # 모델 양자화 방식: "none" 또는 "dynamic_int8" (nn.Linear weight int8 + 실행 시 activation int8 변환, CPU 전용)
+    QUANTIZATION: str = _cfg.get("QUANTIZATION", "none")
+    # 모델 weight/연산 정밀도: "fp32" 또는 "bf16" (LayerNorm, positional encoding, softmax는 float32 유지)
+    PRECISION: str = _cfg.get("PRECISION", "fp32")
+    # embedding table 양자화: "none", "int8" 또는 "int4" (행별 scale로 저장하고 lookup한 행만 float로 변환)
+    # # @@@ ffc가 embedding weight를 공유(weight tying)하면 ffc도 int8 per-channel dynamic quantized Linear로 교체 (CPU, fp32 전용)
+    EMBED_QUANTIZATION: str = _cfg.get("EMBED_QUANTIZATION", "none")
+
+    # greedy decoding 실행 backend: "torch" 또는 "onnx" (tools/export_onnx.py로 export한 graph를 ONNX Runtime CPU로 실행)
+    # # @@@ onnx 사용 시 continuous batching 엔진 대신 ONNX Runtime 경로로 greedy 번역 (onnxruntime 설치 필요)
+    INFERENCE_BACKEND: str = _cfg.get("INFERENCE_BACKEND", "torch")
+    ONNX_ENCODER_PATH: str = _cfg.get("ONNX_ENCODER_PATH", "models/onnx/encoder.onnx")
+    ONNX_DECODER_PATH: str = _cfg.get("ONNX_DECODER_PATH", "models/onnx/decoder_step.onnx")
+    # ONNX Runtime intra-op 스레드 수 (0이면 기본값)
+    ONNX_THREADS: int = int(_cfg.get("ONNX_THREADS", 0))
+
+    # encoder forward와 decoding 1 step을 torch.compile로 컴파일할지 여부와 torch.compile mode
+    COMPILE_MODEL: bool = bool(_cfg.get("COMPILE_MODEL", False))
+    COMPILE_MODE: str = _cfg.get("COMPILE_MODE", "default")
+    # 서버 시작 시 warmup할 batch 크기, source 길이 목록과 warmup decoding step 수 (목록이 비어 있으면 warmup 안함)
+    WARMUP_BATCH_SIZES: list = list(_cfg.get("WARMUP_BATCH_SIZES", [1, 8]))
+    WARMUP_SRC_LENS: list = list(_cfg.get("WARMUP_SRC_LENS", [16, 64]))
+    WARMUP_DECODE_STEPS: int = int(_cfg.get("WARMUP_DECODE_STEPS", 4))
+
+    # source 토큰 수로 정하는 문장별 최대 생성 길이 (eos 제외 토큰 수): min(요청 max_length, ceil(source 토큰 수 * DECODE_LEN_RATIO) + DECODE_LEN_OFFSET)
+    # # greedy decoding은 문장별로, beam search 등은 bucket의 가장 긴 문장 기준으로 적용 (DECODE_LEN_RATIO가 0이면 사용 안함)
+    DECODE_LEN_RATIO: float = float(_cfg.get("DECODE_LEN_RATIO", 2.0))
+    DECODE_LEN_OFFSET: int = int(_cfg.get("DECODE_LEN_OFFSET", 10))
+
+    # greedy decoding n-gram 반복 루프 검출: 길이 1 ~ REPEAT_MAX_PERIOD인 n-gram이 max(REPEAT_MIN_REPEATS, ceil(REPEAT_MIN_SPAN / n))번
+    # # 연속으로 반복되면 첫 n-gram만 남기고 문장 종료 (REPEAT_MAX_PERIOD가 0이면 사용 안함)
+    # @@@ 번역 결과를 바꾸는 기능이므로 기본값은 0 (사용 안함), 켤 때는 8 정도 사용
+    REPEAT_MAX_PERIOD: int = int(_cfg.get("REPEAT_MAX_PERIOD", 0))
+    REPEAT_MIN_REPEATS: int = int(_cfg.get("REPEAT_MIN_REPEATS", 3))
+    REPEAT_MIN_SPAN: int = int(_cfg.get("REPEAT_MIN_SPAN", 12))
+    # 반복 루프로 판정된 문장 여부를 응답의 repetition_detected 필드로 반환
+    REPEAT_FLAG_IN_RESPONSE: bool = bool(_cfg.get("REPEAT_FLAG_IN_RESPONSE", False))
+
+    # greedy decoding 시 decoder self-attention KV cache 사용 여부
+    USE_KV_CACHE: bool = bool(_cfg.get("USE_KV_CACHE", True))
+    # pad 토큰을 제거한 packed 입력으로 encoder 실행 여부
+    PACKED_ENCODER: bool = bool(_cfg.get("PACKED_ENCODER", True))
+    # beam search length normalization 계수 (GNMT ((5 + len) / 6) ** alpha)
+    LENGTH_PENALTY: float = float(_cfg.get("LENGTH_PENALTY", 0.6))
+    # greedy decoding을 shallow self-draft speculative decoding으로 실행할지 여부
+    # # SPEC_DRAFT_BLOCKS: draft로 사용할 앞쪽 decoding block 수, SPEC_NUM_DRAFT: 검증 1번당 draft 토큰 수
+    # # @@@ 사용 시 continuous batching 엔진 대신 speculative decoding 경로로 greedy 번역
+    SPECULATIVE_DECODING: bool = bool(_cfg.get("SPECULATIVE_DECODING", False))
+    SPEC_DRAFT_BLOCKS: int = int(_cfg.get("SPEC_DRAFT_BLOCKS", 2))
+    SPEC_NUM_DRAFT: int = int(_cfg.get("SPEC_NUM_DRAFT", 4))
+    # 번역 메모리: 이전 greedy 번역 결과를 저장해두고 비슷한 source 문장의 번역을 draft로 검증 (결과는 greedy와 동일)
+    # # TM_MAX_ENTRIES: 저장할 최대 문장 수, TM_MIN_SIMILARITY: draft로 사용할 source 토큰열 최소 유사도 (0~1)
+    # # @@@ 사용 시 continuous batching 엔진 대신 번역 메모리 경로로 greedy 번역
+    TRANSLATION_MEMORY: bool = bool(_cfg.get("TRANSLATION_MEMORY", False))
+    TM_MAX_ENTRIES: int = int(_cfg.get("TM_MAX_ENTRIES", 10000))
+    TM_MIN_SIMILARITY: float = float(_cfg.get("TM_MIN_SIMILARITY", 0.8))
+    # 비슷한 문장 후보 검색에 사용할 토큰의 최대 출현 문장 수 (이보다 흔한 토큰은 후보 검색에서 제외)
+    TM_MAX_POSTING: int = int(_cfg.get("TM_MAX_POSTING", 256))
+
+    # greedy decoding의 ffc / argmax를 source 토큰별 후보 target 토큰들에 대해서만 계산하는 shortlist 파일 (빈 문자열이면 사용 안함)
+    # # tools/build_shortlist.py로 병렬 코퍼스에서 생성, SHORTLIST_CHECK_RATE: 전체 vocab argmax와 불일치 비율을 측정할 batch 비율 (0~1)
+    # # @@@ 사용 시 continuous batching 엔진 대신 shortlist 경로로 greedy 번역
+    VOCAB_SHORTLIST_PATH: str = _cfg.get("VOCAB_SHORTLIST_PATH", "")
+    SHORTLIST_CHECK_RATE: float = float(_cfg.get("SHORTLIST_CHECK_RATE", 0.0))
+
+    # greedy decoding의 다음 토큰을 ffc 행 k-means clustering 기반 근사 MIPS index로 검색할지 여부
+    # # MIPS_CLUSTERS: cluster 수, MIPS_PROBE: step마다 정확히 계산할 cluster 수
+    # # MIPS_TOLERANCE: 검색하지 않은 cluster의 logits 상한 허용 오차 (0이면 전체 ffc argmax와 동일한 결과, 검증 실패 시 전체 ffc로 재계산)
+    # # @@@ 사용 시 continuous batching 엔진 대신 MIPS 경로로 greedy 번역 (VOCAB_SHORTLIST_PATH가 설정되어 있으면 shortlist 우선)
+    MIPS_INDEX: bool = bool(_cfg.get("MIPS_INDEX", False))
+    MIPS_CLUSTERS: int = int(_cfg.get("MIPS_CLUSTERS", 256))
+    MIPS_PROBE: int = int(_cfg.get("MIPS_PROBE", 8))
+    MIPS_TOLERANCE: float = float(_cfg.get("MIPS_TOLERANCE", 0.0))
+
+    # continuous batching 엔진 사용 여부와 엔진 batch의 최대 row(문장) 수
+    CONTINUOUS_BATCHING: bool = bool(_cfg.get("CONTINUOUS_BATCHING", True))
+    ENGINE_MAX_ROWS: int = int(_cfg.get("ENGINE_MAX_ROWS", 64))
+    # continuous batching 엔진 대기열 최대 문장 수 (넘으면 503)
+    ENGINE_MAX_QUEUE: int = int(_cfg.get("ENGINE_MAX_QUEUE", 256))
+
+    # event loop 밖 추론 executor 설정
+    # # 동시 추론 스레드 수, 추론 대기열 크기 (가득 차면 503 + Retry-After 헤더)
+    INFERENCE_WORKERS: int = int(_cfg.get("INFERENCE_WORKERS", 1))
+    INFERENCE_QUEUE_SIZE: int = int(_cfg.get("INFERENCE_QUEUE_SIZE", 8))
+    RETRY_AFTER_SECONDS: int = int(_cfg.get("RETRY_AFTER_SECONDS", 1))
 
 
     SECRET_KEY: str = _cfg.get("SECRET_KEY", "use openssl rand -base64 64 to create a key")
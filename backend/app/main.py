@@ -18,6 +18,9 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from app.api.v1.routes import translate, auth, users, viz
 from app.core.config import settings
+from app.ml.translator import translator
+from app.services.micro_batcher import micro_batcher
+from app.services.inference_executor import inference_executor
 
 # from app.db.models.user import User
 # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
@@ -39,9 +42,23 @@ async def lifespan(app: FastAPI):
         shutil.rmtree(VIZ_DIR)
     os.makedirs(VIZ_DIR, exist_ok=True)
     print(f"{VIZ_DIR} cleared and recreated")
+
+    # ===== 대표 shape들로 모델 warmup (torch.compile 컴파일 포함) =====
+    translator.warmup()
+
+    # ===== continuous batching 엔진 스레드 시작 =====
+    translator.start_engine()
+
+    # ===== 단일 문장 요청 micro-batching task 시작 =====
+    await micro_batcher.start()
     
     yield  # 서버 실행 중 yield
     
+    # ===== micro-batching task, continuous batching 엔진 스레드 종료 =====
+    await micro_batcher.stop()
+    translator.stop_engine()
+    inference_executor.shutdown()
+
     # ===== 서버 종료 시점 폴더 정리 =====
     print(f"Cleaning up {VIZ_DIR}...")
     if os.path.exists(VIZ_DIR):
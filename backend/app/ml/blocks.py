@@ -6,8 +6,140 @@ import numpy as np
 import math
 
 
+class KVCache:
+    # incremental decoding 시 decoder self-attention의 이전 step key/value를 저장하는 cache
+    # 매 step마다 ys 전체를 다시 계산하는 대신 새 토큰의 key/value만 계산해서 이어붙인다
+    def __init__(self, capacity=None):
+        self.K = None
+        self.V = None
+        # (b, head_num, cached_len, head_dim)
+
+        # capacity가 주어지면 첫 append 시 (b, head_num, capacity, head_dim) buffer를 할당하고
+        # # 이후 append는 buffer의 다음 위치에 새 key/value만 쓴 뒤 self.K, self.V를 앞쪽 view로 갱신
+        # # ==> step마다 torch.cat으로 cache 전체를 새로 할당/복사하지 않는다
+        # @@@ capacity를 넘으면 더 큰 buffer를 새로 할당해서 복사
+        self.capacity = capacity
+        self._K_buf = None
+        self._V_buf = None
+
+    def __len__(self):
+        return 0 if self.K is None else self.K.size(2)
+
+    def append(self, K_, V_):
+        # K_, V_: (b, head_num, new_len, head_dim)
+        if self.capacity is None:
+            if self.K is not None:
+                K_ = torch.cat([self.K, K_], dim=2)
+                V_ = torch.cat([self.V, V_], dim=2)
+            self.K = K_
+            self.V = V_
+            # (b, head_num, cached_len + new_len, head_dim)
+            return K_, V_
+
+        return self._append_buffer(K_, V_)
+
+    @torch.compiler.disable
+    def _append_buffer(self, K_, V_):
+        # capacity buffer에 이어쓰기
+        # @@@ buffer 크기(capacity)와 현재 길이로 자르는 view는 step마다 달라지는 값이라 torch.compile graph 안에서
+        #     추적하면 shape guard가 깨져서 컴파일된 decode_step이 실패한다 ==> 이 부분만 graph 밖에서 eager 실행
+        length = len(self)
+        new_len = K_.size(2)
+        if self._K_buf is None or length + new_len > self._K_buf.size(2):
+            self._alloc(K_, V_, max(self.capacity, 2 * (length + new_len) if self._K_buf is not None else length + new_len))
+
+        self._K_buf[:, :, length:length + new_len] = K_
+        self._V_buf[:, :, length:length + new_len] = V_
+        self.K = self._K_buf[:, :, :length + new_len]
+        self.V = self._V_buf[:, :, :length + new_len]
+        # (b, head_num, cached_len + new_len, head_dim)
+        return self.K, self.V
+
+    def _alloc(self, K_, V_, size):
+        # (b, head_num, size, head_dim) buffer 할당 후 기존 cache 복사
+        b, h, _, d = K_.size()
+        K_buf = K_.new_empty(b, h, size, d)
+        V_buf = V_.new_empty(b, h, size, d)
+        if self.K is not None:
+            K_buf[:, :, :len(self)] = self.K
+            V_buf[:, :, :len(self)] = self.V
+        self._K_buf = K_buf
+        self._V_buf = V_buf
+
+    def _drop_buffer(self):
+        # self.K, self.V가 buffer 앞쪽 view가 아니게 되는 변경 후 호출 (다음 append에서 새 buffer 할당)
+        self._K_buf = None
+        self._V_buf = None
+
+    def reorder(self, index):
+        # beam search 등에서 batch 차원(dim=0)의 행을 index 순서로 재배열/선택
+        if self.K is not None:
+            self.K = self.K.index_select(0, index)
+            self.V = self.V.index_select(0, index)
+            self._drop_buffer()
+
+    def add_rows(self, n):
+        # batch 끝에 n개의 빈 row 추가 (continuous batching에서 새 요청 합류 시 사용)
+        # @@@ 새 row의 기존 위치 key/value는 0으로 채우고 attention mask로 가려야 한다
+        if self.K is not None and n > 0:
+            b, h, length, d = self.K.size()
+            self.K = torch.cat([self.K, self.K.new_zeros(n, h, length, d)], dim=0)
+            self.V = torch.cat([self.V, self.V.new_zeros(n, h, length, d)], dim=0)
+            self._drop_buffer()
+
+    def trim_front(self, n):
+        # 모든 row에서 더이상 쓰이지 않는 앞쪽 n개 위치 제거
+        if self.K is not None and n > 0:
+            self.K = self.K[:, :, n:]
+            self.V = self.V[:, :, n:]
+            self._drop_buffer()
+
+    def truncate(self, length):
+        # 앞쪽 length개 위치만 남기고 뒤쪽 제거 (speculative decoding에서 거절된 draft 토큰의 key/value 제거)
+        # @@@ buffer 앞쪽 view로 줄이기만 하므로 buffer는 그대로 재사용 (다음 append가 제거된 위치부터 덮어쓴다)
+        if self.K is not None and length < self.K.size(2):
+            self.K = self.K[:, :, :length]
+            self.V = self.V[:, :, :length]
+
+
+_CAUSAL_BUFFERS = {}
+# device별로 미리 만들어둔 lower-triangular bool 행렬 (필요한 크기보다 작으면 2배로 다시 생성)
+
+
+def causal_mask(q_len, k_len, offset, device):
+    # query i (key 위치로는 offset + i)가 key 0 ~ offset + i까지만 보도록 하는 (q_len, k_len) bool mask
+    # @@@ 매번 torch.ones + tril로 새로 만드는 대신 미리 만든 buffer를 잘라서(view) 반환
+    need = max(offset + q_len, k_len)
+    key = str(device)
+    buffer = _CAUSAL_BUFFERS.get(key)
+    if buffer is None or buffer.size(0) < need:
+        size = max(need, 512, 0 if buffer is None else 2 * buffer.size(0))
+        buffer = torch.ones(size, size, dtype=torch.bool, device=device).tril_()
+        _CAUSAL_BUFFERS[key] = buffer
+    return buffer[offset:offset + q_len, :k_len]
+
+
+class CausalMask:
+    # decoder masked self-attention mask를 (b, 1, query_len, key_len) 크기로 만들지 않고 compact 형태로 전달
+    # key_mask: (b, 1, 1, key_len) bool key padding mask (pad가 없으면 None)
+    # offset: 첫 query 앞에 있는 key 수 (KV cache 길이)
+    # @@@ MultiHeadAttention이 shape에 따라 is_causal / key_mask만 / causal buffer와 합친 mask 중 하나로 SDPA 실행
+    def __init__(self, key_mask=None, offset=0):
+        self.key_mask = key_mask
+        self.offset = offset
+
+    def dense(self, q_len, k_len, device):
+        # 기존 방식의 mask tensor ((q_len, k_len) 또는 (b, 1, q_len, k_len))
+        mask = causal_mask(q_len, k_len, self.offset, device)
+        return mask if self.key_mask is None else self.key_mask & mask
+
+
 class MultiHeadAttention(nn.Module):
-    def __init__(self, q_dim, k_dim, v_dim, head_num, drop_rate, visualization=False):
+    def __init__(self, q_dim, k_dim, v_dim, head_num, drop_rate, visualization=False, fused_qkv=False, head_dim=None):
+        # fused_qkv: self-attention 전용 (Q, K, V가 모두 같은 입력)
+        # # make_Q, make_K, make_V 대신 하나로 합친 make_QKV로 Q, K, V를 matmul 1번에 계산
+        # head_dim: head별 차원 (None이면 q_dim // head_num)
+        # # head pruning으로 head_num이 줄어든 모듈도 head별 차원은 원래 값(q_dim // 원래 head_num) 유지
         # EncodingBlock에서 input x와 MultiHeadAttention(x)을 더하는 residual connection이 존재
         # => MultiHeadAttention(x)은 x와 동일 차원이어야 한다
         # decoder안에서는 key와 value가 encoder에서 올 수도 있으므로
@@ -19,14 +151,25 @@ class MultiHeadAttention(nn.Module):
         self.k_dim = k_dim
         self.v_dim = v_dim
         self.head_num = head_num
-        self.head_dim = q_dim // head_num
+        self.head_dim = head_dim if head_dim is not None else q_dim // head_num
         # q_dim을 head_num으로 나누는 정수값이 없는 경우
         # multi-head attention 결과를 concat하였을 때 input인 q_dim과 달라질 수 있으나
         # concat한 결과를 FC layer를 한번 거쳐서 q_dim으로 맞춰준다
 
-        self.make_Q = nn.Linear(in_features=q_dim, out_features=self.head_num * self.head_dim)
-        self.make_K = nn.Linear(in_features=k_dim, out_features=self.head_num * self.head_dim)
-        self.make_V = nn.Linear(in_features=v_dim, out_features=self.head_num * self.head_dim)
+        self.fused_qkv = fused_qkv
+        if fused_qkv:
+            assert q_dim == k_dim == v_dim, "fused QKV projection is only for self-attention"
+            self.make_QKV = nn.Linear(in_features=q_dim, out_features=3 * self.head_num * self.head_dim)
+            # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+            # self-attention은 같은 입력에 Linear 3개를 따로 실행하므로 weight를 세로로 이어붙인
+            # # (3 * head_num * head_dim, q_dim) Linear 1개로 계산해도 결과는 동일
+            # ==> GEMM 호출 수가 1/3로 줄고 batch가 작은 decoding step에서 GEMM 효율이 좋아진다
+            # @@@ make_Q/make_K/make_V로 저장된 기존 체크포인트는 _load_from_state_dict에서 자동으로 합쳐서 로드
+            # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        else:
+            self.make_Q = nn.Linear(in_features=q_dim, out_features=self.head_num * self.head_dim)
+            self.make_K = nn.Linear(in_features=k_dim, out_features=self.head_num * self.head_dim)
+            self.make_V = nn.Linear(in_features=v_dim, out_features=self.head_num * self.head_dim)
         # 각 head가 (b, seq_length, d_model)을 받아 (b, seq_length, self.head_dim)인 q_h, k_h, v_h를 각각 생성하는 대신
         # 한꺼번에 계산해 (b, seq_length, self.head_num * self.head_dim)를 얻은 후
         # 이를 view로 (b, seq_length, self.head_num, self.head_dim) 변경하고 transpose로
@@ -65,15 +208,64 @@ class MultiHeadAttention(nn.Module):
 
     def _reset_parameters(self):
         # Original Transformer initialization, see PyTorch documentation
-        nn.init.xavier_uniform_(self.make_Q.weight)
-        self.make_Q.bias.data.fill_(0)
-        nn.init.xavier_uniform_(self.make_K.weight)
-        self.make_K.bias.data.fill_(0)
-        nn.init.xavier_uniform_(self.make_V.weight)
-        self.make_V.bias.data.fill_(0)
+        if self.fused_qkv:
+            # Q, K, V 부분을 각각 따로 초기화해야 분리된 Linear 3개와 같은 분포
+            for weight in self.make_QKV.weight.data.chunk(3, dim=0):
+                nn.init.xavier_uniform_(weight)
+            self.make_QKV.bias.data.fill_(0)
+        else:
+            nn.init.xavier_uniform_(self.make_Q.weight)
+            self.make_Q.bias.data.fill_(0)
+            nn.init.xavier_uniform_(self.make_K.weight)
+            self.make_K.bias.data.fill_(0)
+            nn.init.xavier_uniform_(self.make_V.weight)
+            self.make_V.bias.data.fill_(0)
         nn.init.xavier_uniform_(self.make_O.weight)
         self.make_O.bias.data.fill_(0)
 
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs):
+        # fused_qkv 모듈에 make_Q/make_K/make_V로 저장된 (기존) state_dict를 로드하는 경우
+        # # 세 Linear의 weight, bias를 Q, K, V 순서로 이어붙여 make_QKV key로 바꿔서 로드
+        if self.fused_qkv and prefix + "make_Q.weight" in state_dict:
+            for name in ("weight", "bias"):
+                parts = [state_dict.pop(f"{prefix}make_{x}.{name}") for x in "QKV"]
+                state_dict[f"{prefix}make_QKV.{name}"] = torch.cat(parts, dim=0)
+        super()._load_from_state_dict(state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
+
+    @torch.no_grad()
+    def prune_heads(self, keep):
+        # keep: 남길 head 번호 리스트 ==> make_Q/K/V(또는 make_QKV)의 출력 행과 make_O의 입력 열 중 나머지 head 부분을 실제로 제거
+        # @@@ head h의 출력은 make_O 입력의 [h * head_dim, (h + 1) * head_dim) 열에만 곱해지므로
+        #     해당 head의 행/열을 지우면 그 head를 0으로 masking한 것과 결과가 같다
+        # @@@ 양자화 / bf16 변환 전 float 모듈에서만 사용 (tools/prune_heads.py)
+        keep = sorted(keep)
+        index = torch.cat([torch.arange(h * self.head_dim, (h + 1) * self.head_dim) for h in keep]).to(self.make_O.weight.device)
+        # 남길 head들의 (head_num * head_dim) 차원 위치
+
+        def rows(linear, index):
+            new = nn.Linear(linear.in_features, index.numel(), bias=linear.bias is not None).to(linear.weight)
+            new.weight.copy_(linear.weight.index_select(0, index))
+            if linear.bias is not None:
+                new.bias.copy_(linear.bias.index_select(0, index))
+            return new
+
+        if self.fused_qkv:
+            width = self.head_num * self.head_dim
+            self.make_QKV = rows(self.make_QKV, torch.cat([index, index + width, index + 2 * width]))
+            # make_QKV 출력은 [Q | K | V] 순서이므로 세 부분에서 같은 head를 남긴다
+        else:
+            self.make_Q = rows(self.make_Q, index)
+            self.make_K = rows(self.make_K, index)
+            self.make_V = rows(self.make_V, index)
+
+        make_O = nn.Linear(index.numel(), self.make_O.out_features, bias=self.make_O.bias is not None).to(self.make_O.weight)
+        make_O.weight.copy_(self.make_O.weight.index_select(1, index))
+        if self.make_O.bias is not None:
+            make_O.bias.copy_(self.make_O.bias)
+        self.make_O = make_O
+
+        self.head_num = len(keep)
+
     def SDPA(self, Q, K, V, mask):
 
         # assert not torch.isnan(Q).any(), "Q value is NaN!"
@@ -91,6 +283,10 @@ class MultiHeadAttention(nn.Module):
         # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
         # if mask: 를 쓰면 mask가 None이 아닐 때
         # RuntimeError: Boolean value of Tensor with more than one value is ambiguous 발생
+        if isinstance(mask, CausalMask):
+            mask = mask.dense(Q.size(-2), K.size(-2), Q.device)
+            # 시각화용 직접 계산은 mask tensor가 필요
+
         if mask is not None:
             # attend = attend.masked_fill(mask=mask, value=float("-inf"))
             attend.masked_fill_(mask=(mask == 0), value=float("-inf"))
@@ -116,7 +312,8 @@ class MultiHeadAttention(nn.Module):
 
         # assert not torch.isnan(attend).any(), "pre-softmax attention value is NaN!"
 
-        attend = F.softmax(input=attend, dim=-1)
+        attend = F.softmax(input=attend, dim=-1, dtype=torch.float32)
+        # @@@ bf16 추론 시에도 softmax는 float32로 계산 (float32 추론에서는 결과 동일)
 
         # assert not torch.isnan(attend).any(), "attention value is NaN!"
 
@@ -141,33 +338,92 @@ class MultiHeadAttention(nn.Module):
         #     enable_math=True,        # Math 커널만 켜기
         #     enable_mem_efficient=False  # MemoryEfficient 끄기
         # ):
+        attn_mask, is_causal = self._dispatch_mask(mask, Q.size(-2), K.size(-2), Q.device)
         return F.scaled_dot_product_attention(
             query=Q, key=K, value=V,
-            attn_mask=(mask==1),  #bool 타입으로 변경
+            attn_mask=attn_mask,
             dropout_p=0.0 if not self.training else self.drop_rate,
+            is_causal=is_causal,
             scale=1.0 / np.sqrt(self.head_dim)
-        )       
+        )
 
-    def forward(self, Q, K, V, mask, testing=False):
-        b = Q.size(0)
-        q_len = Q.size(1)
+    @staticmethod
+    def _dispatch_mask(mask, q_len, k_len, device):
+        # mask를 F.scaled_dot_product_attention의 (attn_mask, is_causal)로 변환
+
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        # SDPA는 attn_mask 없이 is_causal=True인 경우 mask tensor를 읽지 않는 fused(flash) 커널을 사용할 수 있고
+        # # mask가 주어져도 (b, 1, 1, key_len) 같은 broadcast 가능한 compact mask는 그대로 사용
+        # 1. pad가 없는 정사각형 causal self-attention ==> is_causal=True (mask tensor 없음)
+        # 2. query 1개가 모든 key를 보는 decoding step ==> key padding mask만 사용
+        # 3. 그 외 (pad가 있는 causal, KV cache 뒤 여러 query) ==> 미리 만든 causal buffer와 key padding mask를 합쳐서 사용
+        # @@@ 이전에는 attention 호출마다 (mask==1)로 mask 전체를 새로 만들었으므로 bool이 아닌 mask만 변환
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        if isinstance(mask, CausalMask):
+            if q_len == 1 and mask.offset + 1 >= k_len:
+                return mask.key_mask, False
+            if mask.key_mask is None and mask.offset == 0 and q_len == k_len:
+                return None, True
+            return mask.dense(q_len, k_len, device), False
+
+        if mask is not None and mask.dtype != torch.bool:
+            mask = mask == 1
+        return mask, False
+
+    def project_kv(self, K, V):
+        # K, V를 key/value로 projection한 뒤 head별로 나누기
+        # (b, seq_length, k_dim) ==> (b, self.head_num, seq_length, self.head_dim)
+        # @@@ encoder-decoder attention의 K, V는 encoder output으로 decoding step 동안 변하지 않으므로
+        # @@@ encoder 실행 직후 1번만 계산해두고 forward의 static_kv로 재사용할 수 있다
+        assert not self.fused_qkv, "project_kv is only for encoder-decoder attention"
+        b = K.size(0)
         k_len = K.size(1)
         v_len = V.size(1)
 
-        Q_ = self.make_Q(Q)
         K_ = self.make_K(K)
         V_ = self.make_V(V)
         # (b, seq_length, self.head_num * self.head_dim)
-        # Q는 decoder, K,V는 encoder에서 오는 경우 seq_length가 다를 수 있다
 
-        Q_ = Q_.view(b, q_len, self.head_num, self.head_dim)
         K_ = K_.view(b, k_len, self.head_num, self.head_dim)
         V_ = V_.view(b, v_len, self.head_num, self.head_dim)
         # (b, seq_length, self.head_num, self.head_dim)
-        Q_ = Q_.permute(0, 2, 1, 3)
         K_ = K_.permute(0, 2, 1, 3)
         V_ = V_.permute(0, 2, 1, 3)
         # (b, self.head_num, seq_length, self.head_dim)
+        return K_, V_
+
+    def forward(self, Q, K, V, mask, testing=False, cache=None, static_kv=None):
+        # cache: KVCache (decoder self-attention incremental decoding 시에만 사용)
+        # # cache가 주어지면 Q, K, V는 새로 추가된 토큰들만 들어오고
+        # # K, V는 cache에 저장된 이전 토큰들의 key/value와 이어붙여서 attention 계산
+        # static_kv: project_kv로 미리 계산한 (K_, V_) (encoder-decoder attention에서만 사용)
+        # # static_kv가 주어지면 K, V 입력은 무시하고 make_K, make_V 계산을 건너뛴다
+        b = Q.size(0)
+        q_len = Q.size(1)
+
+        if self.fused_qkv:
+            # self-attention이므로 K, V 입력은 Q와 같은 tensor ==> Q만 사용
+            Q_, K_, V_ = self._split_qkv(self.make_QKV(Q), b, q_len)
+            # (b, self.head_num, seq_length, self.head_dim)
+        else:
+            Q_ = self.make_Q(Q)
+            # (b, seq_length, self.head_num * self.head_dim)
+            # Q는 decoder, K,V는 encoder에서 오는 경우 seq_length가 다를 수 있다
+
+            Q_ = Q_.view(b, q_len, self.head_num, self.head_dim)
+            # (b, seq_length, self.head_num, self.head_dim)
+            Q_ = Q_.permute(0, 2, 1, 3)
+            # (b, self.head_num, seq_length, self.head_dim)
+
+            if static_kv is not None:
+                K_, V_ = static_kv
+            else:
+                K_, V_ = self.project_kv(K, V)
+            # (b, self.head_num, seq_length, self.head_dim)
+
+        if cache is not None:
+            K_, V_ = cache.append(K_, V_)
+            # (b, self.head_num, cached_len + seq_length, self.head_dim)
 
         # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
         out = None
@@ -203,6 +459,53 @@ class MultiHeadAttention(nn.Module):
         return out
 
 
+    def forward_packed(self, x, pack_index, batch_shape, mask):
+        # pad 토큰을 제거한 packed 입력에 대한 self-attention
+        # x: (n_tokens, q_dim) batch 안의 실제 토큰들만 모은 tensor
+        # pack_index: (n_tokens,) 각 토큰의 (b * seq_length) 평탄화 위치
+        # batch_shape: (b, seq_length)
+        # @@@ Q, K, V, O projection은 실제 토큰 수만큼만 계산하고
+        # @@@ 문장 단위 연산인 attention만 (b, seq_length) 형태로 펼쳐서 계산
+        b, seq_len = batch_shape
+
+        if self.fused_qkv:
+            Q_, K_, V_ = self._split_qkv(self._unpack(self.make_QKV(x), pack_index, b, seq_len), b, seq_len)
+        else:
+            Q_ = self._unpack_heads(self.make_Q(x), pack_index, b, seq_len)
+            K_ = self._unpack_heads(self.make_K(x), pack_index, b, seq_len)
+            V_ = self._unpack_heads(self.make_V(x), pack_index, b, seq_len)
+        # (b, self.head_num, seq_length, self.head_dim)
+
+        out = self.SDPA_new(Q_, K_, V_, mask)
+        # (b, self.head_num, seq_length, self.head_dim)
+
+        out = out.permute(0, 2, 1, 3).reshape(b * seq_len, -1)
+        out = out.index_select(0, pack_index)
+        # (n_tokens, self.head_num * self.head_dim) 다시 실제 토큰들만 남기기
+
+        out = self.make_O(out)
+        out = self.dropout(out)
+
+        return out
+
+    def _unpack_heads(self, x, pack_index, b, seq_len):
+        # (n_tokens, self.head_num * self.head_dim) ==> (b, self.head_num, seq_length, self.head_dim)
+        # pad 위치는 0으로 채워지고 attention mask로 가려진다
+        out = self._unpack(x, pack_index, b, seq_len)
+        return out.view(b, seq_len, self.head_num, self.head_dim).permute(0, 2, 1, 3)
+
+    def _unpack(self, x, pack_index, b, seq_len):
+        # (n_tokens, dim) ==> (b, seq_length, dim) pad 위치는 0
+        return x.new_zeros(b * seq_len, x.size(-1)).index_copy_(0, pack_index, x).view(b, seq_len, -1)
+
+    def _split_qkv(self, qkv, b, seq_len):
+        # make_QKV 출력 (b, seq_length, 3 * self.head_num * self.head_dim)
+        # ==> Q_, K_, V_ 각각 (b, self.head_num, seq_length, self.head_dim)
+        # @@@ 복사 없이 view만 만들고 SDPA가 stride를 그대로 사용
+        qkv = qkv.view(b, seq_len, 3, self.head_num, self.head_dim).permute(2, 0, 3, 1, 4)
+        return qkv.unbind(0)
+
+
 class FeedForward(nn.Module):
     def __init__(self, in_dim, h_dim, drop_rate):
         super().__init__()
@@ -242,10 +545,10 @@ class FeedForward(nn.Module):
 
 
 class EncodingBlock(nn.Module):
-    def __init__(self, q_dim, h_dim, head_num, drop_rate, visualization=False):
+    def __init__(self, q_dim, h_dim, head_num, drop_rate, visualization=False, head_dim=None):
         super().__init__()
         self.MHA = MultiHeadAttention(
-            q_dim=q_dim, k_dim=q_dim, v_dim=q_dim, head_num=head_num, drop_rate=drop_rate, visualization=visualization
+            q_dim=q_dim, k_dim=q_dim, v_dim=q_dim, head_num=head_num, drop_rate=drop_rate, visualization=visualization, fused_qkv=True, head_dim=head_dim
         )
         # self attention
         # (b, seq_len, q_dim) => (b, seq_len, q_dim)
@@ -271,17 +574,27 @@ class EncodingBlock(nn.Module):
         out2 = out1 + self.FF(self.LN2(out1))
         return out2
 
+    def forward_packed(self, x, pack_index, batch_shape, mask):
+        # x: (n_tokens, q_dim) pad 토큰을 제거한 packed 입력
+        # LayerNorm, FeedForward는 토큰별 연산이므로 packed 상태 그대로 실제 토큰 수만큼만 계산
+        normalized = self.LN1(x)
+
+        out1 = x + self.MHA.forward_packed(normalized, pack_index, batch_shape, mask)
+        out2 = out1 + self.FF(self.LN2(out1))
+        return out2
+
 
 class DecodingBlock(nn.Module):
-    def __init__(self, q_dim, k_dim, v_dim, h_dim, head_num, drop_rate, visualization=False):
+    def __init__(self, q_dim, k_dim, v_dim, h_dim, head_num, drop_rate, visualization=False, cross_head_num=None, head_dim=None):
+        # cross_head_num: encoder-decoder attention head 수 (None이면 head_num, head pruning된 모델에서 self-attention과 다를 수 있음)
         super().__init__()
         self.MMHA = MultiHeadAttention(
-            q_dim=q_dim, k_dim=q_dim, v_dim=q_dim, head_num=head_num, drop_rate=drop_rate, visualization=visualization
+            q_dim=q_dim, k_dim=q_dim, v_dim=q_dim, head_num=head_num, drop_rate=drop_rate, visualization=visualization, fused_qkv=True, head_dim=head_dim
         )
         # Masked self-attention
 
         self.MHA = MultiHeadAttention(
-            q_dim=q_dim, k_dim=k_dim, v_dim=v_dim, head_num=head_num, drop_rate=drop_rate, visualization=visualization
+            q_dim=q_dim, k_dim=k_dim, v_dim=v_dim, head_num=cross_head_num or head_num, drop_rate=drop_rate, visualization=visualization, head_dim=head_dim
         )
         # Encoder-Decoder attention
         # Q는 위의 MMHA의 output, K,V는 encoder output
@@ -292,7 +605,9 @@ class DecodingBlock(nn.Module):
         self.LN2 = nn.LayerNorm(q_dim)
         self.LN3 = nn.LayerNorm(q_dim)
 
-    def forward(self, Q, K, V, tgt_mask, src_mask, testing=False):
+    def forward(self, Q, K, V, tgt_mask, src_mask, testing=False, cache=None, cross_kv=None):
+        # cache: masked self-attention용 KVCache (incremental decoding 시에만 사용)
+        # cross_kv: self.MHA.project_kv(K, V)로 미리 계산한 encoder-decoder attention의 (K_, V_)
         # out1 = self.LN1(Q + self.MMHA(Q, Q, Q, tgt_mask))
         # Masked self-attention이므로 query, key, value 모두 Q
 
@@ -305,9 +620,9 @@ class DecodingBlock(nn.Module):
 
         normalized = self.LN1(Q)
 
-        out1 = Q + self.MMHA(normalized, normalized, normalized, tgt_mask, testing)
+        out1 = Q + self.MMHA(normalized, normalized, normalized, tgt_mask, testing, cache=cache)
 
-        out2 = out1 + self.MHA(self.LN2(out1), K, V, src_mask, testing)
+        out2 = out1 + self.MHA(self.LN2(out1), K, V, src_mask, testing, static_kv=cross_kv)
 
         out3 = out2 + self.FF(self.LN3(out2))
 
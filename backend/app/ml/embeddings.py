@@ -10,9 +10,76 @@ class Embeddings(nn.Module):
         self.embed = nn.Embedding(num_embeddings=len_vocab, embedding_dim=embedding_dim, padding_idx=padding_idx)
         # nn.Embedding에 padding_idx로 지정된 토큰은
         # 임베딩 후에 embedding_dim개의 모든 엔트리가 0이 된다
+        # @@@ 추론 시 model_loader.quantize_embeddings가 QuantizedEmbedding으로 교체할 수 있다
         self.embeddding_dim = embedding_dim
 
     def forward(self, x):
         eb = self.embed(x)
         eb = eb * math.sqrt(self.embeddding_dim)
         return eb
+
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# 행(토큰)별 int8 / 4-bit embedding table (추론 전용)
+# # 행마다 절대값 최대를 기준으로 scale 1개 (symmetric, zero point 0)
+# # int8: q = round(w / scale), scale = max|w| / 127 ==> (len_vocab, embedding_dim) int8
+# # int4: q = round(w / scale), scale = max|w| / 7 ==> q + 8 (0 ~ 15) 2개를 uint8 1개에 저장 (len_vocab, embedding_dim / 2)
+# # ==> 64101 x 512 float32 table (약 131 MB)이 int8이면 약 33 MB, int4이면 약 16 MB (+ 행별 scale 256 KB)
+# lookup 시 batch에 나온 토큰 행만 골라서 float32로 되돌린다 (table 전체를 float로 만들지 않음)
+# @@@ 행별 scale이라 빈도가 낮아 값이 작은 토큰 행도 자기 크기에 맞는 해상도를 가진다
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+QUANT_LEVELS = {8: 127, 4: 7}
+# bit 수별 양자화 값 최대 크기
+
+
+def quantize_rows(weight: torch.Tensor, bits: int):
+    """(len_vocab, embedding_dim) weight의 행별 symmetric 양자화 ==> (q int8 (len_vocab, embedding_dim), scale float32 (len_vocab,))"""
+    weight = weight.detach().float()
+    scale = weight.abs().amax(dim=1).div(QUANT_LEVELS[bits]).clamp(min=1e-8)
+    # @@@ padding 행처럼 모두 0인 행도 0으로 나누지 않도록 최소값 지정 (q는 그대로 0)
+    q = weight.div(scale.unsqueeze(1)).round().clamp(-QUANT_LEVELS[bits], QUANT_LEVELS[bits]).to(torch.int8)
+    return q, scale
+
+
+class QuantizedEmbedding(nn.Module):
+    def __init__(self, q: torch.Tensor, scale: torch.Tensor, bits: int):
+        # q, scale: quantize_rows 결과
+        super().__init__()
+        if bits not in QUANT_LEVELS:
+            raise ValueError(f"Unsupported embedding quantization bits: {bits} (choose from {tuple(QUANT_LEVELS)})")
+        self.bits = bits
+        self.embedding_dim = q.size(1)
+
+        if bits == 4:
+            if self.embedding_dim % 2 != 0:
+                raise ValueError("4-bit embedding quantization needs an even embedding_dim")
+            q = (q + 8).to(torch.uint8)
+            q = q[:, 0::2] | (q[:, 1::2] << 4)
+            # 짝수 번째 값은 하위 4 bit, 홀수 번째 값은 상위 4 bit
+        self.register_buffer("qweight", q.contiguous())
+        self.register_buffer("scale", scale.float())
+
+    @classmethod
+    def from_float(cls, embed: nn.Embedding, bits: int) -> "QuantizedEmbedding":
+        """nn.Embedding weight를 행별 양자화한 QuantizedEmbedding 생성"""
+        q, scale = quantize_rows(embed.weight, bits)
+        return cls(q, scale, bits)
+
+    def _unpack(self, q):
+        # (n, embedding_dim / 2) uint8 ==> (n, embedding_dim) int8 (-8 ~ 7)
+        low = (q & 0xF).to(torch.int8) - 8
+        high = (q >> 4).to(torch.int8) - 8
+        return torch.stack([low, high], dim=-1).view(q.size(0), self.embedding_dim)
+
+    def dequantize(self, ids=None) -> torch.Tensor:
+        """ids (n,) 행만 (None이면 table 전체) float32로 되돌린 (n, embedding_dim)"""
+        q = self.qweight if ids is None else self.qweight.index_select(0, ids)
+        scale = self.scale if ids is None else self.scale.index_select(0, ids)
+        if self.bits == 4:
+            q = self._unpack(q)
+        return q.float() * scale.unsqueeze(1)
+
+    def forward(self, x):
+        # x: 토큰 id (...,) ==> (..., embedding_dim) float32
+        return self.dequantize(x.reshape(-1)).view(*x.shape, self.embedding_dim)
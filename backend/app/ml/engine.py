@@ -0,0 +1,300 @@
+# app/ml/engine.py
+# continuous (iteration-level) batching으로 greedy decoding 루프를 관리하는 엔진
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# Transformer.inference는 batch 전체가 함께 들어가서 가장 느린 문장이 끝날 때까지 루프를 돈다
+# # ==> 이미 끝난 문장도 계속 계산되고, 그 사이 들어온 요청은 batch 전체가 끝날 때까지 대기
+# 이 엔진은 별도 스레드에서 항상 돌아가는 하나의 batch를 가지고
+# # decoding step 사이마다 끝난 row는 batch에서 빼고 새로 들어온 요청은 batch에 합류시킨다
+# # row마다 decoding 위치가 다르므로 positional encoding은 row별 위치를 사용하고
+# # 합류 전 위치의 self-attention key/value는 0으로 채운 뒤 mask로 가린다
+# @@@ repeat(RepetitionDetector)가 주어지면 반복 루프로 판정된 row도 eos처럼 바로 batch에서 뺀다
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+import torch.nn.functional as F
+
+from typing import List, Optional
+
+from app.ml.repetition import RepetitionDetector
+
+
+class _EngineRequest:
+    def __init__(self, src_ids: List[int], max_len: int, future: Future):
+        self.src_ids = src_ids
+        # special token이 포함된 source 토큰 id들
+        self.max_len = max_len
+        # 최대 생성 토큰 수
+        self.future = future
+        # (생성된 토큰 id 리스트(eos 포함), 반복 루프 판정 여부)를 결과로 받는 Future
+        self.tokens = []
+
+
+class ContinuousBatchingEngine:
+    def __init__(self, model, device, max_batch_rows: int = 64, repeat: Optional[RepetitionDetector] = None):
+        self.model = model
+        self.device = device
+        self.max_batch_rows = max_batch_rows
+        self.repeat = repeat
+
+        self.start_idx = model.start_idx
+        self.end_idx = model.end_idx
+        self.padding_idx = model.padding_idx
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        self._reset_state()
+
+    def _reset_state(self):
+        # 현재 batch 상태 (모든 tensor의 0번 차원은 self._requests와 같은 순서의 row)
+        self._requests = []
+        self._last_tokens = None
+        # (b, 1) 다음 step에 decoder에 넣을 토큰
+        self._positions = None
+        # (b,) 다음 step에 넣을 토큰의 row별 위치
+        self._self_valid = None
+        # (b, cache_len) self-attention cache의 각 위치가 유효한 key인지 여부
+        self._src_valid = None
+        # (b, src_len) encoder output의 각 위치가 pad가 아닌지 여부
+        self._caches = None
+        self._cross_kvs = None
+        self._repeat_runs = None
+        self._repeat_recent = None
+        # (b, max_period) row별 반복 검출 상태 (RepetitionDetector.init_state)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="continuous-batching-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def queued(self) -> int:
+        """아직 batch에 합류하지 못하고 대기 중인 요청 수"""
+        return self._queue.qsize()
+
+    def submit(self, src_ids: List[int], max_len: int) -> Future:
+        """source 토큰 id 리스트를 대기열에 넣고 (생성 토큰 id 리스트, 반복 루프 판정 여부)를 받을 Future 반환"""
+        future = Future()
+        if self._stop_event.is_set():
+            # 종료된 엔진에 들어온 요청은 대기열에 넣지 않고 바로 실패 처리
+            future.set_exception(RuntimeError("Engine stopped"))
+            return future
+        self._queue.put(_EngineRequest(src_ids, max_len, future))
+        return future
+
+    def _loop(self):
+        with torch.no_grad(), self.model.autocast():
+            # @@@ autocast 상태는 스레드별이므로 엔진 스레드 안에서 설정
+            while not self._stop_event.is_set():
+                # batch가 비어 있으면 새 요청이 올 때까지 대기
+                block = len(self._requests) == 0
+                new_requests = self._collect(block)
+
+                try:
+                    if new_requests:
+                        self._admit(new_requests)
+                    if self._requests:
+                        self._step()
+                except Exception as e:
+                    # 실패한 step에 포함된 요청들은 모두 예외로 종료하고 batch 초기화
+                    for r in self._requests + new_requests:
+                        if not r.future.done():
+                            r.future.set_exception(e)
+                    self._reset_state()
+
+        # 종료 시 남아있는 요청 정리 (batch에 있는 요청과 아직 대기열에 있는 요청 모두)
+        # @@@ 대기열 요청을 그대로 두면 translate_continuous가 결과를 계속 기다리게 된다
+        pending = list(self._requests)
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for r in pending:
+            if not r.future.done():
+                r.future.set_exception(RuntimeError("Engine stopped"))
+        self._reset_state()
+
+    def _collect(self, block: bool) -> List[_EngineRequest]:
+        # batch에 빈 자리만큼 대기열에서 요청 꺼내기
+        requests = []
+        capacity = self.max_batch_rows - len(self._requests)
+
+        while len(requests) < capacity:
+            try:
+                if block and not requests:
+                    r = self._queue.get(timeout=0.1)
+                else:
+                    r = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            # 대기 중에 취소된 요청은 건너뛰기
+            if r.future.set_running_or_notify_cancel():
+                requests.append(r)
+
+        return requests
+
+    def _admit(self, new_requests: List[_EngineRequest]):
+        # 새 요청들을 encoder에 통과시킨 후 현재 batch에 합류
+        model = self.model
+        n_new = len(new_requests)
+
+        src_len = max(len(r.src_ids) for r in new_requests)
+        x = torch.full((n_new, src_len), self.padding_idx, dtype=torch.long, device=self.device)
+        x_mask = torch.zeros(n_new, src_len, dtype=torch.long, device=self.device)
+        for i, r in enumerate(new_requests):
+            x[i, :len(r.src_ids)] = torch.tensor(r.src_ids, dtype=torch.long, device=self.device)
+            x_mask[i, :len(r.src_ids)] = 1
+
+        out_en = model.encode(x, model.make_pad_mask(x_mask))
+        new_cross_kvs = model.decoder.precompute_cross_kv(out_en)
+        # block별 (K_, V_): (n_new, head_num, src_len, head_dim)
+        new_src_valid = x_mask.bool()
+
+        new_last_tokens = torch.full((n_new, 1), self.start_idx, dtype=torch.long, device=self.device)
+        new_positions = torch.zeros(n_new, dtype=torch.long, device=self.device)
+        new_runs, new_recent = self.repeat.init_state(n_new, self.device) if self.repeat is not None else (None, None)
+
+        if not self._requests:
+            self._caches = model.init_decoder_cache()
+            self._cross_kvs = new_cross_kvs
+            self._src_valid = new_src_valid
+            self._self_valid = torch.zeros(n_new, 0, dtype=torch.bool, device=self.device)
+            self._last_tokens = new_last_tokens
+            self._positions = new_positions
+            self._repeat_runs, self._repeat_recent = new_runs, new_recent
+        else:
+            # encoder output 길이를 긴 쪽에 맞춰 pad (pad 위치는 src_valid False로 masking)
+            cur_len = self._src_valid.size(1)
+            total_len = max(cur_len, src_len)
+            self._cross_kvs = [
+                (
+                    torch.cat([self._pad_src(K_, total_len), self._pad_src(K_new, total_len)], dim=0),
+                    torch.cat([self._pad_src(V_, total_len), self._pad_src(V_new, total_len)], dim=0),
+                )
+                for (K_, V_), (K_new, V_new) in zip(self._cross_kvs, new_cross_kvs)
+            ]
+            self._src_valid = torch.cat(
+                [F.pad(self._src_valid, (0, total_len - cur_len)), F.pad(new_src_valid, (0, total_len - src_len))], dim=0
+            )
+
+            # 새 row의 self-attention cache는 현재 cache 길이만큼 0으로 채우고 무효 처리
+            for cache in self._caches:
+                cache.add_rows(n_new)
+            self._self_valid = torch.cat(
+                [self._self_valid, self._self_valid.new_zeros(n_new, self._self_valid.size(1))], dim=0
+            )
+            self._last_tokens = torch.cat([self._last_tokens, new_last_tokens], dim=0)
+            self._positions = torch.cat([self._positions, new_positions], dim=0)
+            if self.repeat is not None:
+                self._repeat_runs = torch.cat([self._repeat_runs, new_runs], dim=0)
+                self._repeat_recent = torch.cat([self._repeat_recent, new_recent], dim=0)
+
+        self._requests.extend(new_requests)
+
+    def _pad_src(self, t, length):
+        # (b, head_num, src_len, head_dim)의 src_len 차원을 length까지 0으로 pad
+        return F.pad(t, (0, 0, 0, length - t.size(2)))
+
+    def _step(self):
+        # batch 전체에 대해 decoding 1 step 실행
+        model = self.model
+
+        self._self_valid = torch.cat([self._self_valid, self._last_tokens.ne(self.padding_idx)], dim=1)
+        # 이번 step에 들어가는 토큰의 key 위치 추가
+        # @@@ Transformer.inference와 동일하게 pad 토큰은 key에서 제외
+
+        logits = model.decode_step(
+            self._last_tokens,
+            self._positions,
+            self._caches,
+            self._cross_kvs,
+            self._self_valid.unsqueeze(1).unsqueeze(2),
+            self._src_valid.unsqueeze(1).unsqueeze(2),
+        )
+        next_token = logits.argmax(dim=-1)
+        # (b,)
+        # @@@ softmax는 단조증가 함수이므로 logits의 argmax와 softmax 결과의 argmax는 동일
+
+        self._positions = self._positions + 1
+
+        if self.repeat is not None:
+            self._repeat_runs, self._repeat_recent, looped, drop = self.repeat.update(self._repeat_runs, self._repeat_recent, next_token)
+            looped, drop = looped.tolist(), drop.tolist()
+        else:
+            looped = drop = [0] * len(self._requests)
+
+        keep = []
+        detected = saved_steps = 0
+        for i, (r, token) in enumerate(zip(self._requests, next_token.tolist())):
+            r.tokens.append(token)
+            if token == self.end_idx:
+                r.future.set_result((r.tokens, False))
+            elif len(r.tokens) >= r.max_len:
+                # 최대 생성 길이까지 eos가 나오지 않은 문장은 Transformer.inference와 동일하게 eos를 붙여서 종료
+                r.future.set_result((r.tokens + [self.end_idx], False))
+            elif looped[i]:
+                # 반복 구간의 첫 n-gram만 남기고 eos로 종료
+                detected += 1
+                saved_steps += r.max_len - len(r.tokens)
+                r.future.set_result((r.tokens[:len(r.tokens) - drop[i]] + [self.end_idx], True))
+            else:
+                keep.append(i)
+
+        if self.repeat is not None:
+            self.repeat.record(len(self._requests) - len(keep), detected, saved_steps)
+            # @@@ 끝난 row만 검사한 문장 수에 포함
+
+        self._last_tokens = next_token.unsqueeze(1)
+
+        if len(keep) < len(self._requests):
+            self._drop_finished(keep)
+
+    def _drop_finished(self, keep: List[int]):
+        # 끝난 row들을 batch에서 제거하고 모든 row에서 쓰이지 않는 cache 위치 정리
+        if not keep:
+            self._reset_state()
+            return
+
+        index = torch.tensor(keep, dtype=torch.long, device=self.device)
+
+        self._requests = [self._requests[i] for i in keep]
+        self._last_tokens = self._last_tokens.index_select(0, index)
+        self._positions = self._positions.index_select(0, index)
+        self._self_valid = self._self_valid.index_select(0, index)
+        self._src_valid = self._src_valid.index_select(0, index)
+        if self.repeat is not None:
+            self._repeat_runs = self._repeat_runs.index_select(0, index)
+            self._repeat_recent = self._repeat_recent.index_select(0, index)
+        self._cross_kvs = [(K_.index_select(0, index), V_.index_select(0, index)) for K_, V_ in self._cross_kvs]
+        for cache in self._caches:
+            cache.reorder(index)
+
+        # 남은 row 모두에게 무효인 앞쪽 self-attention cache 위치 제거
+        used = self._self_valid.any(dim=0)
+        if used.any():
+            first = int(used.int().argmax())
+            if first > 0:
+                self._self_valid = self._self_valid[:, first:]
+                for cache in self._caches:
+                    cache.trim_front(first)
+
+        # 남은 row 중 가장 긴 source 길이 이후의 encoder output 위치 제거
+        src_len = int(self._src_valid.sum(dim=1).max())
+        if src_len < self._src_valid.size(1):
+            self._src_valid = self._src_valid[:, :src_len]
+            self._cross_kvs = [(K_[:, :, :src_len], V_[:, :, :src_len]) for K_, V_ in self._cross_kvs]
@@ -0,0 +1,56 @@
+# app/ml/low_rank.py
+# ffc(q_dim x tgt_len_vocab)를 rank r의 얇은 Linear 2개로 바꾼 저랭크(low-rank) 출력 projection
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# ffc weight W (tgt_len_vocab, q_dim)를 SVD: W = U S V^T 후 상위 r개 특이값만 남기면
+# # W ~= (U_r S_r^(1/2)) (S_r^(1/2) V_r^T) = up (tgt_len_vocab, r) @ down (r, q_dim)  (Frobenius norm 기준 최적 rank r 근사)
+# # ==> h @ W^T = (h @ down^T) @ up^T: step당 ffc 계산량이 q_dim * vocab에서 r * (q_dim + vocab)로 줄어든다
+# # (q_dim 512, vocab 64101 기준 r = 128이면 약 1/4)
+# tools/low_rank_ffc.py가 rank별 BLEU / latency를 비교하고 선택한 rank로 체크포인트를 저장
+# # 체크포인트에 "ffc_rank"가 있으면 model_loader가 ffc를 LowRankLinear로 바꾼 뒤 로드
+# @@@ 재학습 없이 SVD로 바로 만들기 때문에 rank가 작을수록 번역 품질이 떨어진다
+# @@@ weight tying으로 ffc가 embedding과 weight를 공유하던 경우 tying이 끊어지고 embedding은 원래 weight 그대로 사용
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import torch
+import torch.nn as nn
+
+
+class LowRankLinear(nn.Module):
+    def __init__(self, in_features: int, out_features: int, rank: int, bias: bool = True):
+        super().__init__()
+        self.rank = rank
+        self.down = nn.Linear(in_features=in_features, out_features=rank, bias=False)
+        # (b, in_features) ==> (b, rank)
+        self.up = nn.Linear(in_features=rank, out_features=out_features, bias=bias)
+        # (b, rank) ==> (b, out_features)
+
+    @classmethod
+    def from_svd(cls, svd, bias, rank: int) -> "LowRankLinear":
+        """svd(weight) 결과와 bias로 rank개 특이값만 남긴 LowRankLinear 생성 (float32)"""
+        U, S, Vh = svd
+        scale = S[:rank].sqrt()
+
+        layer = cls(Vh.size(1), U.size(0), rank, bias=bias is not None)
+        with torch.no_grad():
+            layer.up.weight.copy_(U[:, :rank] * scale)
+            layer.down.weight.copy_(scale.unsqueeze(1) * Vh[:rank])
+            # 특이값을 양쪽에 sqrt로 나눠 곱해서 두 weight의 크기를 비슷하게 유지
+            if bias is not None:
+                layer.up.bias.copy_(bias.detach().float())
+        return layer
+
+    def forward(self, x):
+        return self.up(self.down(x))
+
+
+def svd(weight: torch.Tensor):
+    """Linear weight (out_features, in_features)의 SVD (U (out_features, k), S (k,), Vh (k, in_features)), k = min(out_features, in_features)"""
+    # @@@ rank별로 비교할 때 1번만 계산해서 LowRankLinear.from_svd에 재사용
+    return torch.linalg.svd(weight.detach().float().cpu(), full_matrices=False)
+
+
+def relative_error(S: torch.Tensor, rank: int) -> float:
+    """특이값 S로 계산한 rank 근사의 상대 오차 |W - W_r|_F / |W|_F"""
+    energy = S.float().pow(2)
+    return float(energy[rank:].sum().div(energy.sum()).sqrt())
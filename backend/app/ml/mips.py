@@ -0,0 +1,143 @@
+# app/ml/mips.py
+# ffc weight 행(토큰별 output embedding)에 대한 clustering 기반 근사 maximum inner product search(MIPS) index
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# greedy decoding의 다음 토큰 = argmax_t (h · w_t + b_t) ==> ffc 행들 중 decoder 출력 h와 내적이 가장 큰 행 찾기
+# # bias는 w_t 뒤에 차원 1개로 붙이고 h 뒤에 1을 붙여서 bias 없는 내적 문제로 변환
+# 1. index 생성: ffc 행들을 k-means로 n_clusters개 cluster로 나누고 cluster별로 행들을 연속 저장
+# #    cluster 중심 c와 중심에서 가장 먼 행까지의 거리(반지름 r)도 저장
+# 2. 검색: h와 cluster 중심들의 내적 상위 n_probe개 cluster의 행들만 정확한 logits 계산 (exact rescoring)
+# 3. 검증: 검색하지 않은 cluster의 모든 행은 h · w <= h · c + |h| * r (Cauchy-Schwarz)
+# #    찾은 최대 logits가 검색하지 않은 cluster들의 상한 - tolerance 이상이면 결과 확정
+# #    아니면 해당 row만 전체 ffc로 다시 계산 (fallback)
+# ==> tolerance = 0이면 결과는 전체 ffc argmax와 동일 (동점 제외), tolerance > 0이면 logits 차이 tolerance 이내의 토큰까지 허용
+# @@@ batch 안 row들이 검색하는 cluster 합집합의 행들을 matmul 1번으로 계산하므로
+#     batch가 커질수록 합집합이 vocab 전체에 가까워져 이득이 줄어든다 (tools/benchmark_mips.py로 batch 크기별 비교)
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import threading
+
+import torch
+
+from typing import Optional
+
+
+class MipsIndex:
+    def __init__(self, rows: torch.Tensor, token_ids: torch.Tensor, offsets: torch.Tensor, centroids: torch.Tensor, radii: torch.Tensor, n_probe: int, tolerance: float = 0.0):
+        # rows: (vocab, q_dim + 1) cluster 순서로 정렬한 [ffc weight 행, bias]
+        # token_ids: (vocab,) rows의 각 행의 원래 토큰 id
+        # offsets: (n_clusters + 1,) cluster k의 행은 rows[offsets[k]:offsets[k + 1]]
+        # centroids: (n_clusters, q_dim + 1), radii: (n_clusters,)
+        self.rows = rows
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.centroids = centroids
+        self.radii = radii
+        self.row_cluster = torch.repeat_interleave(torch.arange(centroids.size(0)), offsets[1:] - offsets[:-1])
+        # (vocab,) rows의 각 행이 속한 cluster
+        self.empty = offsets[1:] == offsets[:-1]
+        # (n_clusters,) 행이 없는 cluster (검색 / 상한 계산에서 제외)
+        self.n_probe = min(n_probe, centroids.size(0))
+        self.tolerance = tolerance
+
+        self.stats = {"queries": 0, "fallbacks": 0, "scored_rows": 0}
+        # 누적 통계 (fallback 비율 = fallbacks / queries, row당 평균 계산 행 수 = scored_rows / queries)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, weight: torch.Tensor, bias: Optional[torch.Tensor], n_clusters: int = 256, n_probe: int = 8, tolerance: float = 0.0, n_iter: int = 10, seed: int = 0) -> "MipsIndex":
+        """ffc weight (vocab, q_dim)와 bias (vocab,)로 index 생성 (k-means, float32)"""
+        weight = weight.detach().float().cpu()
+        if bias is None:
+            bias = torch.zeros(weight.size(0))
+        vectors = torch.cat([weight, bias.detach().float().cpu().unsqueeze(1)], dim=1)
+        # (vocab, q_dim + 1)
+
+        generator = torch.Generator().manual_seed(seed)
+        centroids = vectors[torch.randperm(vectors.size(0), generator=generator)[:n_clusters]].clone()
+
+        for _ in range(n_iter):
+            assign = cls._nearest(vectors, centroids)
+            sums = torch.zeros_like(centroids).index_add_(0, assign, vectors)
+            counts = torch.bincount(assign, minlength=centroids.size(0)).unsqueeze(1)
+            centroids = torch.where(counts > 0, sums / counts.clamp(min=1), centroids)
+            # 빈 cluster는 이전 중심 유지
+
+        assign = cls._nearest(vectors, centroids)
+        order = torch.argsort(assign, stable=True)
+        counts = torch.bincount(assign, minlength=centroids.size(0))
+        offsets = torch.cat([torch.zeros(1, dtype=torch.long), torch.cumsum(counts, dim=0)])
+
+        radii = torch.zeros(centroids.size(0)).index_reduce_(
+            0, assign, (vectors - centroids[assign]).norm(dim=1), "amax", include_self=False
+        )
+        # cluster별 중심에서 가장 먼 행까지의 거리 (빈 cluster는 0)
+
+        return cls(vectors[order].contiguous(), order, offsets, centroids, radii, n_probe, tolerance)
+
+    @staticmethod
+    def _nearest(vectors: torch.Tensor, centroids: torch.Tensor) -> torch.Tensor:
+        # 행별로 가장 가까운(유클리드 거리) 중심 index
+        # # |v - c|^2 = |v|^2 - 2 v·c + |c|^2 에서 |v|^2는 argmin에 영향 없음
+        return (centroids.pow(2).sum(dim=1) - 2 * vectors @ centroids.T).argmin(dim=1)
+
+    def to(self, device) -> "MipsIndex":
+        for name in ("rows", "token_ids", "offsets", "centroids", "radii", "row_cluster", "empty"):
+            setattr(self, name, getattr(self, name).to(device))
+        return self
+
+    def argmax(self, h: torch.Tensor) -> torch.Tensor:
+        """h: (b, q_dim) decoder 출력 ==> (b,) logits가 가장 큰 토큰 id"""
+        with torch.autocast(device_type=h.device.type, enabled=False):
+            # @@@ 상한 검증이 정확하도록 bf16 autocast 안에서도 float32로 계산
+            return self._argmax(h.float())
+
+    def _argmax(self, h: torch.Tensor) -> torch.Tensor:
+        q = torch.cat([h, torch.ones(h.size(0), 1, device=h.device)], dim=1)
+        # (b, q_dim + 1)
+
+        centroid_scores = (q @ self.centroids.T).masked_fill_(self.empty, float("-inf"))
+        # (b, n_clusters)
+        probe = centroid_scores.topk(self.n_probe, dim=1).indices
+        probed = torch.zeros_like(centroid_scores, dtype=torch.bool).scatter_(1, probe, True)
+        # (b, n_clusters) row별 검색할 cluster
+
+        # batch 전체가 검색하는 cluster 합집합의 행 index (cluster별 [start, end) 범위를 한번에 gather)
+        clusters = torch.nonzero(probed.any(dim=0)).squeeze(1)
+        starts = self.offsets[clusters]
+        counts = self.offsets[clusters + 1] - starts
+        range_starts = torch.repeat_interleave(starts - (torch.cumsum(counts, dim=0) - counts), counts)
+        index = range_starts + torch.arange(range_starts.numel(), device=h.device)
+
+        scores = q @ self.rows[index].T
+        # (b, 합집합 행 수) exact rescoring
+        scores.masked_fill_(~probed[:, self.row_cluster[index]], float("-inf"))
+        # row가 검색하지 않은 cluster의 행은 제외
+
+        best_scores, best = scores.max(dim=1)
+        tokens = self.token_ids[index[best]]
+
+        # 검색하지 않은 cluster들의 logits 상한과 비교해서 결과 검증
+        upper = (centroid_scores + q.norm(dim=1, keepdim=True) * self.radii).masked_fill_(probed, float("-inf"))
+        unverified = best_scores < upper.max(dim=1).values - self.tolerance
+
+        if unverified.any():
+            tokens[unverified] = self.token_ids[(q[unverified] @ self.rows.T).argmax(dim=1)]
+            # 검증 실패한 row만 전체 vocab으로 다시 계산
+
+        with self._lock:
+            self.stats["queries"] += h.size(0)
+            self.stats["fallbacks"] += int(unverified.sum())
+            self.stats["scored_rows"] += index.numel() * h.size(0)
+
+        return tokens
+
+    def stats_summary(self) -> dict:
+        """누적 검색 통계 (fallback 비율, query당 평균 계산 행 수)"""
+        with self._lock:
+            queries = self.stats["queries"]
+            return {
+                **self.stats,
+                "fallback_rate": self.stats["fallbacks"] / queries if queries > 0 else 0.0,
+                "mean_scored_rows": self.stats["scored_rows"] / queries if queries > 0 else 0.0,
+            }
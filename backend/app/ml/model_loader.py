@@ -0,0 +1,197 @@
+# app/ml/model_loader.py
+# 설정값(settings)에 맞춰 Transformer 모델과 tokenizer를 생성/로드하는 함수들
+# @@@ TranslatorService와 tools/의 오프라인 도구들이 같은 방식으로 모델을 로드하도록 분리
+
+import torch
+import torch.nn as nn
+
+from transformers import AutoTokenizer
+
+from typing import Optional
+
+from app.ml.embeddings import QuantizedEmbedding, quantize_rows
+from app.ml.transformer import Transformer
+from app.ml.pe import PositionalEncoding
+from app.ml.vocab_remap import VocabRemap
+from app.core.config import settings
+
+
+QUANTIZATION_MODES = ("none", "dynamic_int8")
+PRECISIONS = ("fp32", "bf16")
+EMBED_QUANTIZATIONS = {"none": None, "int8": 8, "int4": 4}
+# embedding table 양자화 방식별 bit 수
+
+
+def build_model(remap: Optional[VocabRemap] = None, head_counts: Optional[dict] = None) -> Transformer:
+    """설정값으로 가중치가 로드되지 않은 Transformer 생성 (remap이 주어지면 trim된 vocab 크기로, head_counts가 주어지면 block별 head 수로 생성)"""
+    model = Transformer(
+        src_len_vocab=settings.LEN_VOCAB if remap is None else remap.src_ids.numel(),
+        tgt_len_vocab=settings.LEN_VOCAB if remap is None else remap.tgt_ids.numel(),
+        start_idx=settings.START_IDX if remap is None else int(remap.tgt_map[settings.START_IDX]),
+        end_idx=settings.END_IDX,
+        padding_idx=settings.PADDING_IDX,
+        unk_idx=settings.UNK_IDX,
+        q_dim=settings.Q_DIM,
+        k_dim=settings.Q_DIM,
+        v_dim=settings.Q_DIM,
+        h_dim=(settings.Q_DIM * 4),
+        visualization=settings.VISUALIZATION,
+        weight_tying=settings.WEIGHT_TYING,
+        head_counts=head_counts,
+    )
+    model.vocab_remap = remap
+    return model
+
+
+def load_model(device: str, quantization: str = "none", precision: str = "fp32", path: Optional[str] = None, embed_quantization: str = "none") -> Transformer:
+    """체크포인트(path, 기본값 settings.MODEL_PATH)를 로드한 추론용(eval) Transformer 반환
+    tools/trim_vocab.py로 vocab을 줄인 체크포인트면 model.vocab_remap에 토큰 id 변환 정보 설정
+    tools/low_rank_ffc.py로 저장한 체크포인트면 ffc를 저장된 rank의 LowRankLinear로 생성
+    tools/prune_heads.py로 저장한 체크포인트면 attention을 저장된 block별 head 수로 생성
+    embed_quantization이 "int8" / "int4"이면 embedding table을 행별 양자화 (quantize_embeddings)"""
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization: {quantization} (choose from {QUANTIZATION_MODES})")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision} (choose from {PRECISIONS})")
+    if quantization != "none" and precision != "fp32":
+        raise ValueError("quantization is only supported with fp32 precision")
+    if embed_quantization not in EMBED_QUANTIZATIONS:
+        raise ValueError(f"Unknown embed_quantization: {embed_quantization} (choose from {tuple(EMBED_QUANTIZATIONS)})")
+
+    load_dict = None
+    load_dict = torch.load(
+        path or settings.MODEL_PATH, map_location="cpu"
+    )
+
+    remap = None
+    if "vocab_remap" in load_dict:
+        remap = VocabRemap.from_checkpoint(
+            load_dict["vocab_remap"],
+            len_vocab=settings.LEN_VOCAB,
+            special_ids=[settings.PADDING_IDX, settings.END_IDX, settings.UNK_IDX],
+            unk_idx=settings.UNK_IDX,
+        )
+        # embedding / ffc 크기는 체크포인트에 저장된 토큰 목록 크기로 생성
+
+    model = build_model(remap, head_counts=load_dict.get("head_counts"))
+
+    if "ffc_rank" in load_dict:
+        model.use_low_rank_ffc(load_dict["ffc_rank"])
+
+    if precision == "bf16":
+        to_bf16(model)
+        # @@@ 체크포인트 로드 전에 변환해두면 load_state_dict가 float32 체크포인트 값을 bf16 weight에 바로 복사
+
+    model.load_state_dict(load_dict["model_state_dict"])
+    del load_dict
+
+    model.packed_encoder = settings.PACKED_ENCODER
+    # 추론 시 pad 토큰을 제거한 packed 입력으로 encoder 실행
+
+    model.to(device)
+    model.eval()
+
+    if remap is not None:
+        remap.to(device)
+
+    if embed_quantization != "none":
+        quantize_embeddings(model, EMBED_QUANTIZATIONS[embed_quantization], device)
+        # @@@ dynamic_int8보다 먼저 실행해야 tying된 ffc가 행별(per-channel) scale로 양자화된다
+
+    if quantization == "dynamic_int8":
+        quantize_dynamic_int8(model, device)
+
+    return model
+
+
+def to_bf16(model: Transformer) -> Transformer:
+    """LayerNorm과 positional encoding을 제외한 weight를 bfloat16으로 변환 (in-place)"""
+
+    # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+    # embedding 2개(+ ffc)와 block들의 Linear weight가 대부분의 메모리를 차지하므로 bf16으로 저장하면 메모리가 절반
+    # # LayerNorm weight와 positional encoding buffer는 float32로 유지
+    # # ==> embedding(bf16) + positional encoding(float32)부터 residual 경로는 float32로 유지되고
+    # #     LayerNorm도 float32로 계산된다
+    # # Linear, matmul, SDPA는 model.autocast() 안에서 bf16으로 계산 (bf16 지원 CPU의 AVX512-BF16/AMX 명령어 사용)
+    # # 최종 logits의 softmax / log_softmax는 float32로 변환 후 계산 (Transformer.inference, beam_search)
+    # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+    model.to(torch.bfloat16)
+
+    for m in model.modules():
+        if isinstance(m, (nn.LayerNorm, PositionalEncoding)):
+            m.float()
+
+    model.compute_dtype = torch.bfloat16
+    return model
+
+
+def quantize_dynamic_int8(model: Transformer, device: str) -> Transformer:
+    """모델의 nn.Linear들을 dynamic int8 quantized Linear로 교체 (in-place)"""
+
+    # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+    # dynamic quantization: weight는 로드 시 1번 int8(weight 전체 scale 1개, per-tensor)로 변환해두고
+    # # activation은 실행 시 batch마다 scale을 계산해 int8로 변환 후 int8 GEMM
+    # # ==> self-attention make_QKV, encoder-decoder attention make_Q/K/V, make_O, FeedForward fc1/fc2, ffc(512 x 64101) 모두 대상
+    # @@@ WeightTying으로 ffc.weight가 embedding weight와 같은 Parameter인 경우
+    #     ffc만 int8 복사본을 가진 quantized Linear로 바뀌고 embedding은 float weight를 그대로 lookup에 사용
+    #     (추론에서는 weight가 갱신되지 않으므로 공유가 끊어져도 결과에 영향 없음)
+    #     tying 시 ffc는 bias=False로 만들어지므로 quantized ffc도 bias 없이 변환된다
+    # @@@ quantized Linear 커널(fbgemm/qnnpack)은 CPU 전용
+    # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+    if torch.device(device).type != "cpu":
+        raise ValueError("dynamic int8 quantization is only supported on CPU")
+
+    torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    # @@@ inplace=False면 모델 전체를 deepcopy하므로 로드 중 메모리가 2배로 늘어난다
+
+    return model
+
+
+def quantize_embeddings(model: Transformer, bits: int, device: str) -> Transformer:
+    """src_embed / tgt_embed의 nn.Embedding을 행별 int8 / 4-bit QuantizedEmbedding으로 교체 (in-place)"""
+
+    # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+    # embedding은 lookup만 하므로 table을 정수로 저장하고 batch에 나온 행만 float로 되돌려도 계산량은 거의 그대로
+    # # ==> tying하지 않은 모델 기준 float32 table 2개(약 262 MB)가 int8이면 약 66 MB
+    # WeightTying으로 embedding weight를 공유하는 경우
+    # # src_embed와 tgt_embed가 공유(TYINGALL, TYINGSRCTGT)하면 QuantizedEmbedding 1개를 두 곳에서 같이 사용
+    # # ffc가 공유(TYINGALL, TYINGTGTFFC, TYINGSRCFFC)하면 ffc도 같은 행별 scale의 int8 weight를 가진
+    # #   dynamic quantized Linear(per-channel)로 교체 ==> float32 table이 메모리에 남지 않는다
+    # #   @@@ int4여도 ffc는 int8 (ffc 출력 logits가 번역 결과를 바로 결정하므로 4-bit는 품질 손실이 큼)
+    # #   @@@ quantized Linear 커널은 CPU 전용이고 bf16 autocast와 같이 사용할 수 없다
+    # @@@ tools/low_rank_ffc.py로 ffc를 저랭크로 바꾼 모델은 tying이 이미 끊어져 있어 embedding만 양자화
+    # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+    src, tgt = model.src_embed[0], model.tgt_embed[0]
+    ffc_weight = getattr(model.ffc, "weight", None)
+    tied_ffc = isinstance(model.ffc, nn.Linear) and any(ffc_weight is m.embed.weight for m in (src, tgt))
+
+    if tied_ffc:
+        if torch.device(device).type != "cpu":
+            raise ValueError("embedding quantization with a tied ffc is only supported on CPU")
+        if model.compute_dtype is not None:
+            raise ValueError("embedding quantization with a tied ffc is only supported with fp32 precision")
+
+        _, scale = quantize_rows(ffc_weight, 8)
+        q = torch.quantize_per_channel(
+            ffc_weight.detach().float(), scale.double(), torch.zeros_like(scale, dtype=torch.long), axis=0, dtype=torch.qint8
+        )
+        # 행(출력 channel)별 scale ==> int8 QuantizedEmbedding과 같은 값
+        ffc = torch.ao.nn.quantized.dynamic.Linear(model.ffc.in_features, model.ffc.out_features, bias_=False, dtype=torch.qint8)
+        ffc.set_weight_bias(q, None)
+        model.ffc = ffc
+        # tying 시 ffc는 bias=False (Transformer.__init__)
+
+    shared = src.embed.weight is tgt.embed.weight
+    tgt.embed = QuantizedEmbedding.from_float(tgt.embed, bits).to(device)
+    src.embed = tgt.embed if shared else QuantizedEmbedding.from_float(src.embed, bits).to(device)
+
+    model.disable_compiled()
+    return model
+
+
+def load_tokenizer():
+    """번역에 사용하는 tokenizer 로드 (시작 토큰 <s> 추가)"""
+    tokenizer = AutoTokenizer.from_pretrained(settings.TOKENIZER_NAME)
+    special_tokens_dict = {'bos_token': '<s>'}
+    tokenizer.add_special_tokens(special_tokens_dict)
+    return tokenizer
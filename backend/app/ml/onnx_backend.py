@@ -0,0 +1,109 @@
+# app/ml/onnx_backend.py
+# tools/export_onnx.py로 export한 encoder / decoder step ONNX 모델을 ONNX Runtime(CPU)으로 실행하는 greedy decoding
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# encoder graph: source 토큰 ==> decoding block별 encoder-decoder attention key/value
+# # (Transformer.encode + Decoder.precompute_cross_kv와 동일)
+# decoder step graph: 마지막 토큰 1개 + self-attention cache ==> 다음 토큰 logits + 새 토큰까지 이어붙인 cache
+# # (Transformer.decode_step과 동일, cache는 (block 수, b, head_num, cache_len, head_dim) tensor로 입출력)
+# greedy 루프와 후처리는 Transformer.inference(use_cache=True)와 같은 방식으로 numpy에서 실행
+# ==> ONNX Runtime graph 최적화(연산 fusion 등)를 사용하고 PyTorch eager의 연산별 overhead 제거
+# @@@ onnxruntime은 선택 의존성 (INFERENCE_BACKEND: "onnx"일 때만 import)
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import numpy as np
+
+from typing import Optional
+
+
+# export / 실행 시 공통으로 사용하는 graph 입출력 이름
+ENCODER_INPUTS = ["src_ids", "src_mask"]
+ENCODER_OUTPUTS = ["cross_k", "cross_v"]
+DECODER_INPUTS = ["tokens", "positions", "self_k", "self_v", "self_mask", "cross_k", "cross_v", "src_mask"]
+DECODER_OUTPUTS = ["logits", "new_self_k", "new_self_v"]
+
+
+class OnnxGreedyDecoder:
+    def __init__(self, encoder_path: str, decoder_path: str, start_idx: int, end_idx: int, padding_idx: int, n_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("INFERENCE_BACKEND: onnx requires onnxruntime (pip install onnxruntime)") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if n_threads > 0:
+            options.intra_op_num_threads = n_threads
+
+        providers = ["CPUExecutionProvider"]
+        self.encoder = ort.InferenceSession(encoder_path, sess_options=options, providers=providers)
+        self.decoder = ort.InferenceSession(decoder_path, sess_options=options, providers=providers)
+
+        self.start_idx = start_idx
+        self.end_idx = end_idx
+        self.padding_idx = padding_idx
+
+    def inference(self, x: np.ndarray, x_mask: np.ndarray, max_pred_len: int, budgets: Optional[np.ndarray] = None) -> np.ndarray:
+        """x, x_mask: (b, src_seq_len) int64 ==> (b, pred_seq_len) 생성 토큰 (eos 이후 pad, 시작 토큰 제외)
+        budgets: (b,) 문장별 최대 생성 토큰 수 (Transformer.decode_budgets, eos 제외)가 주어지면 그만큼 생성한 뒤 eos로 종료"""
+        if budgets is not None:
+            max_pred_len = min(max_pred_len, int(budgets.max()))
+        x = x.astype(np.int64)
+        x_mask = x_mask.astype(np.int64)
+        n_batch = x.shape[0]
+
+        cross_k, cross_v = self.encoder.run(ENCODER_OUTPUTS, {"src_ids": x, "src_mask": x_mask})
+        # (block 수, b, head_num, src_seq_len, head_dim)
+        n_blocks, _, head_num, _, head_dim = cross_k.shape
+
+        self_k = np.zeros((n_blocks, n_batch, head_num, 0, head_dim), dtype=cross_k.dtype)
+        self_v = np.zeros_like(self_k)
+        self_valid = np.zeros((n_batch, 0), dtype=bool)
+        src_valid = x_mask.astype(bool)
+
+        ys = np.full((n_batch, 1), self.start_idx, dtype=np.int64)
+
+        for i in range(max_pred_len):
+            last = ys[:, -1:]
+            self_valid = np.concatenate([self_valid, last != self.padding_idx], axis=1)
+            # Transformer.inference와 동일하게 pad 토큰은 key에서 제외
+
+            logits, self_k, self_v = self.decoder.run(
+                DECODER_OUTPUTS,
+                {
+                    "tokens": last,
+                    "positions": np.full((n_batch,), i, dtype=np.int64),
+                    "self_k": self_k,
+                    "self_v": self_v,
+                    "self_mask": self_valid,
+                    "cross_k": cross_k,
+                    "cross_v": cross_v,
+                    "src_mask": src_valid,
+                },
+            )
+            # logits: (b, tgt_len_vocab)
+
+            next_token = logits.argmax(axis=-1).astype(np.int64)
+            if budgets is not None:
+                next_token = np.where(budgets == i, self.end_idx, next_token)
+                # Transformer.inference와 동일하게 이미 길이 제한만큼 생성한 문장은 eos
+            ys = np.concatenate([ys, next_token[:, None]], axis=1)
+
+            finished = (ys == self.end_idx).any(axis=1)
+            if budgets is not None:
+                finished |= budgets <= i + 1
+            if finished.all():
+                break
+
+        return self._finalize_preds(ys)
+
+    def _finalize_preds(self, ys: np.ndarray) -> np.ndarray:
+        # Transformer._finalize_preds의 numpy 버전
+        if not (ys == self.end_idx).any(axis=1).all():
+            ys = np.concatenate([ys, np.full((ys.shape[0], 1), self.end_idx, dtype=ys.dtype)], axis=1)
+
+        eos_positions = (ys == self.end_idx).argmax(axis=1)[:, None]
+        # (b, 1) 문장별 첫 eos 위치
+        ys[np.arange(ys.shape[1])[None, :] > eos_positions] = self.padding_idx
+
+        return ys[:, 1:]
@@ -11,7 +11,10 @@ class PositionalEncoding(nn.Module):
 
         self.register_buffer('positional_encodings', get_positional_encoding(d_model, max_len), False)
 
-    def forward(self, x: torch.Tensor):
+    def forward(self, x: torch.Tensor, offset: int | torch.Tensor = 0):
+        # offset: x의 첫 토큰 위치
+        # # incremental decoding에서는 새 토큰 하나만 들어오므로 해당 토큰의 위치부터 slicing 해야 한다
+        # # continuous batching처럼 row마다 위치가 다르면 (n_batch,) long tensor로 row별 위치 입력
         # pe = self.positional_encodings[:x.shape[0]].requires_grad_(False)
         # @@@ requires_grad=False인 buffer self.positional_encodings의 slice도 여전히 requires_grad=False이므로 
         # @@@ .requires_grad_(False) 필요 없다
@@ -19,7 +22,14 @@ class PositionalEncoding(nn.Module):
         # self.positional_encodings의 shape는 (1, max_len, d_model)
         # x의 shape는 (n_batch, seq_len, d_model)이므로
         # slicing을 해서 self.positional_encodings의 (1, seq_len, d_model)로 변경
-        pe = self.positional_encodings[:, :x.size(1), :]
+        # @@@ offset이 주어지면 [offset, offset + seq_len) 위치의 encoding 사용
+        if isinstance(offset, torch.Tensor):
+            positions = offset.unsqueeze(1) + torch.arange(x.size(1), device=x.device)
+            # (n_batch, seq_len)
+            pe = self.positional_encodings[0, positions]
+            # (n_batch, seq_len, d_model)
+        else:
+            pe = self.positional_encodings[:, offset:offset + x.size(1), :]
         x = x + pe
         x = self.dropout(x)
         return x 
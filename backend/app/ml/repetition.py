@@ -0,0 +1,78 @@
+# app/ml/repetition.py
+# greedy decoding 중 같은 n-gram이 계속 반복되는 문장(반복 루프)을 찾아서 일찍 종료시키기 위한 반복 검출기
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# 모델이 "the the the ..." 나 "of the world, of the world, ..." 같은 반복에 빠지면 eos가 나오지 않아서
+# # 최대 생성 길이까지 decoder를 계속 실행하고 같은 batch의 다른 문장들도 그동안 기다리게 된다
+# 주기 p (1 ~ max_period)별로 "새 토큰 == p step 전 토큰"이 연속으로 성립한 횟수(run)를 row별로 유지
+# # run[b, p] >= m 이면 마지막 m + p개 토큰은 주기 p로 반복 ==> 길이 p인 n-gram이 (m + p) / p번 반복
+# # 주기 p의 n-gram이 max(min_repeats, ceil(min_span / p))번 이상 반복되면 반복 루프로 판정
+# ==> step마다 (b, max_period) 비교 1번으로 검사 (ys 전체를 다시 보지 않음)
+# 판정된 row는 반복 구간의 첫 1번만 남기고 뒤의 반복 토큰들을 지운 위치에 eos를 넣어서 종료
+# @@@ min_span은 짧은 주기의 자연스러운 반복 ("very very", "ha ha ha")을 루프로 보지 않기 위한 최소 반복 구간 길이
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import math
+import threading
+
+import torch
+
+from typing import Tuple
+
+
+class RepetitionDetector:
+    def __init__(self, max_period: int, min_repeats: int = 3, min_span: int = 12):
+        # max_period: 검사할 최대 반복 주기 (n-gram 길이)
+        # min_repeats: 루프로 판정할 최소 반복 횟수, min_span: 루프로 판정할 최소 반복 구간 토큰 수
+        self.max_period = max_period
+        self.thresholds = torch.tensor(
+            [(max(min_repeats, math.ceil(min_span / p)) - 1) * p for p in range(1, max_period + 1)], dtype=torch.long
+        )
+        # (max_period,) 주기 p의 run이 이 값 이상이면 루프 (n-gram 반복 횟수 - 1) * p
+
+        self.stats = {"rows": 0, "detected": 0, "saved_steps": 0}
+        # 누적 통계 (rows: 검사한 문장 수, detected: 루프로 판정해 종료한 문장 수,
+        # # saved_steps: 판정된 문장들의 남은 최대 생성 길이 합 = 실행하지 않은 decoding step 수의 상한)
+        self._lock = threading.Lock()
+
+    def init_state(self, n_batch: int, device) -> Tuple[torch.Tensor, torch.Tensor]:
+        """(runs, recent) 초기 상태 ==> runs: (b, max_period) 주기별 연속 일치 횟수, recent: (b, max_period) 최근 토큰 (0번이 가장 최근)"""
+        runs = torch.zeros(n_batch, self.max_period, dtype=torch.long, device=device)
+        recent = torch.full((n_batch, self.max_period), -1, dtype=torch.long, device=device)
+        # @@@ 아직 생성되지 않은 위치는 토큰 id가 될 수 없는 -1 (start 토큰은 비교에서 제외)
+        return runs, recent
+
+    def update(self, runs: torch.Tensor, recent: torch.Tensor, next_token: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """새 토큰 next_token (b,)으로 상태 갱신 ==> (runs, recent, looped (b,) bool, drop (b,) 지울 마지막 토큰 수 (next_token 포함))"""
+        next_token = next_token.long()
+
+        runs = (runs + 1) * (recent == next_token.unsqueeze(1))
+        # recent[:, p - 1]은 p step 전 토큰 ==> 일치하면 run 1 증가, 아니면 0으로 초기화
+        recent = torch.cat([next_token.unsqueeze(1), recent[:, :-1]], dim=1)
+
+        hit = runs >= self.thresholds.to(runs.device)
+        # (b, max_period)
+        looped = hit.any(dim=1)
+        period = hit.int().argmax(dim=1, keepdim=True)
+        # 가장 짧은 판정 주기 (argmax는 첫 번째 True 위치)
+        drop = runs.gather(1, period).squeeze(1).masked_fill(~looped, 0)
+        # 반복 구간 m + p개 중 첫 n-gram p개만 남기고 나머지 m개 토큰 삭제
+
+        return runs, recent, looped, drop
+
+    def record(self, rows: int, detected: int, saved_steps: int):
+        with self._lock:
+            self.stats["rows"] += rows
+            self.stats["detected"] += detected
+            self.stats["saved_steps"] += saved_steps
+
+    def stats_summary(self) -> dict:
+        """누적 반복 검출 통계 (루프 판정 비율, 판정된 문장당 평균 절약 step 수)"""
+        with self._lock:
+            rows = self.stats["rows"]
+            detected = self.stats["detected"]
+            return {
+                **self.stats,
+                "detection_rate": detected / rows if rows > 0 else 0.0,
+                "mean_saved_steps": self.stats["saved_steps"] / detected if detected > 0 else 0.0,
+            }
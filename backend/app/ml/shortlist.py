@@ -0,0 +1,51 @@
+# app/ml/shortlist.py
+# source 토큰으로 target 후보 단어 목록(shortlist)을 만들어 ffc projection을 후보 단어에만 계산하기 위한 lexical shortlist
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# 매 decoding step의 ffc(512 x 64101) matmul과 softmax는 vocab 전체에 대해 계산되지만
+# # 한국어 문장 하나가 실제로 만들 수 있는 영어 subword는 수천 개 이하
+# tools/build_shortlist.py가 병렬 코퍼스에서 source 토큰별로 같이 등장한 target 토큰 상위 top_k개와
+# # 코퍼스 전체에서 자주 나오는 target 토큰 상위 n_frequent개를 미리 저장
+# 추론 시 batch의 source 토큰들의 후보 합집합 + 자주 나오는 토큰 + special 토큰만 ffc 계산 대상
+# ==> ffc 계산량이 (shortlist 크기 / 64101)로 줄어든다
+# @@@ batch 안의 모든 문장이 같은 후보 목록을 공유 (matmul 1번으로 계산하기 위해 문장별이 아닌 batch별 합집합)
+# @@@ 후보 밖 토큰이 전체 vocab argmax였던 경우 결과가 달라지므로 check 옵션으로 불일치 비율 측정
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import torch
+
+from typing import List
+
+
+class VocabShortlist:
+    def __init__(self, offsets: torch.Tensor, targets: torch.Tensor, frequent: torch.Tensor, special_ids: List[int]):
+        # offsets: (src_len_vocab + 1,) source 토큰 s의 후보는 targets[offsets[s]:offsets[s + 1]] (CSR 형태)
+        # targets: (후보 총 개수,) target 토큰 id
+        # frequent: (n_frequent,) 항상 포함할 자주 나오는 target 토큰 id
+        self.offsets = offsets.long()
+        self.targets = targets.long()
+        self.always = torch.unique(torch.cat([frequent.long(), torch.tensor(special_ids, dtype=torch.long)]))
+        # @@@ special 토큰(eos, pad, unk, 시작 토큰)은 항상 후보에 포함
+
+    @classmethod
+    def load(cls, path: str, special_ids: List[int]) -> "VocabShortlist":
+        """tools/build_shortlist.py로 저장한 shortlist 파일 로드"""
+        data = torch.load(path, map_location="cpu")
+        return cls(data["offsets"], data["targets"], data["frequent"], special_ids)
+
+    def candidates(self, x: torch.Tensor) -> torch.Tensor:
+        """x: (b, src_seq_len) source 토큰 id ==> (n_candidates,) 오름차순 target 후보 토큰 id (x와 같은 device)"""
+        src_ids = torch.unique(x.cpu())
+        src_ids = src_ids[src_ids < self.offsets.numel() - 1]
+        # shortlist 파일보다 큰 vocab id는 무시
+
+        starts = self.offsets[src_ids]
+        counts = self.offsets[src_ids + 1] - starts
+
+        # source 토큰별 [start, start + count) 범위를 for 루프 없이 한번에 gather
+        # ex: starts = [10, 50], counts = [2, 3] ==> [10, 11, 50, 51, 52]
+        range_starts = torch.repeat_interleave(starts - (torch.cumsum(counts, dim=0) - counts), counts)
+        index = range_starts + torch.arange(range_starts.numel())
+
+        return torch.unique(torch.cat([self.targets[index], self.always])).to(x.device)
+        # @@@ torch.unique는 정렬된 결과를 반환
@@ -3,16 +3,22 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from app.ml import blocks, embeddings, pe
+from app.ml.low_rank import LowRankLinear
 
 from app.core.config import settings, WeightTying
 
 class Encoder(nn.Module):
-    def __init__(self, q_dim, h_dim, head_num, block_num, drop_rate, visualization=False):
+    def __init__(self, q_dim, h_dim, head_num, block_num, drop_rate, visualization=False, head_nums=None):
+        # head_nums: block별 self-attention head 수 리스트 (head pruning된 모델, None이면 모든 block이 head_num)
+        # @@@ head별 차원은 head 수와 관계없이 q_dim // head_num
         super().__init__()
 
+        head_nums = head_nums or [head_num] * block_num
         self.blocks = nn.ModuleList(
             [
-                blocks.EncodingBlock(q_dim=q_dim, h_dim=h_dim, head_num=head_num, drop_rate=drop_rate, visualization=visualization)
+                blocks.EncodingBlock(
+                    q_dim=q_dim, h_dim=h_dim, head_num=head_nums[i], drop_rate=drop_rate, visualization=visualization, head_dim=q_dim // head_num
+                )
                 for i in range(block_num)
             ]
         )
@@ -25,15 +31,30 @@ class Encoder(nn.Module):
 
         return out
 
+    def forward_packed(self, x, pack_index, batch_shape, mask):
+        # x: (n_tokens, q_dim) pad 토큰을 제거한 packed 입력
+        # blocks.MultiHeadAttention.forward_packed 참고
+        out = x
+
+        for m in self.blocks:
+            out = m.forward_packed(out, pack_index, batch_shape, mask)
+
+        return out
+
 
 class Decoder(nn.Module):
-    def __init__(self, q_dim, k_dim, v_dim, h_dim, head_num, block_num, drop_rate, visualization=False):
+    def __init__(self, q_dim, k_dim, v_dim, h_dim, head_num, block_num, drop_rate, visualization=False, self_head_nums=None, cross_head_nums=None):
+        # self_head_nums / cross_head_nums: block별 masked self-attention / encoder-decoder attention head 수 리스트
+        # # (head pruning된 모델, None이면 모든 block이 head_num)
         super().__init__()
 
+        self_head_nums = self_head_nums or [head_num] * block_num
+        cross_head_nums = cross_head_nums or [head_num] * block_num
         self.blocks = nn.ModuleList(
             [
                 blocks.DecodingBlock(
-                    q_dim=q_dim, k_dim=k_dim, v_dim=v_dim, h_dim=h_dim, head_num=head_num, drop_rate=drop_rate, visualization=visualization
+                    q_dim=q_dim, k_dim=k_dim, v_dim=v_dim, h_dim=h_dim, head_num=self_head_nums[i], drop_rate=drop_rate, visualization=visualization,
+                    cross_head_num=cross_head_nums[i], head_dim=q_dim // head_num,
                 )
                 for i in range(block_num)
             ]
@@ -47,14 +68,30 @@ class Decoder(nn.Module):
         tgt_mask,
         src_mask,
         testing=False,
+        caches=None,
+        cross_kvs=None,
+        n_blocks=None,
     ):
+        # caches: block마다 하나씩인 blocks.KVCache 리스트 (incremental decoding 시에만 사용)
+        # cross_kvs: precompute_cross_kv로 미리 계산한 block별 encoder-decoder attention (K_, V_) 리스트
+        # n_blocks: 앞쪽 n_blocks개 block만 실행 (speculative decoding의 shallow draft용, None이면 전체)
         out = Q
 
-        for m in self.blocks:
-            out = m(out, K, V, tgt_mask, src_mask, testing)
+        for i, m in enumerate(self.blocks[:n_blocks]):
+            out = m(
+                out, K, V, tgt_mask, src_mask, testing,
+                cache=None if caches is None else caches[i],
+                cross_kv=None if cross_kvs is None else cross_kvs[i],
+            )
 
         return out
 
+    def precompute_cross_kv(self, memory):
+        # memory: encoder output (b, src_seq_len, k_dim)
+        # block별 encoder-decoder attention의 key/value projection을 1번만 계산
+        # ==> decoding step마다 block 수 x make_K/make_V 계산 반복 제거
+        return [m.MHA.project_kv(memory, memory) for m in self.blocks]
+
 class Transformer(nn.Module):
     def __init__(
         self,
@@ -75,7 +112,10 @@ class Transformer(nn.Module):
         drop_rate=0.1,
         visualization=False,
         weight_tying: WeightTying = WeightTying.NOTYING,
+        head_counts=None,
     ):
+        # head_counts: tools/prune_heads.py로 head를 줄인 체크포인트의 attention 종류별 block별 head 수
+        # # {"encoder": [...], "decoder_self": [...], "decoder_cross": [...]} (None이면 모든 attention이 head_num)
         super().__init__()
 
         self.start_idx = start_idx
@@ -84,8 +124,26 @@ class Transformer(nn.Module):
         self.unk_idx = unk_idx
         self.max_len = max_len
 
+        self.src_len_vocab = src_len_vocab
         self.tgt_len_vocab = tgt_len_vocab
 
+        self.vocab_remap = None
+        # vocab을 줄인 체크포인트면 model_loader가 설정하는 VocabRemap (모델 토큰 id <==> tokenizer 토큰 id)
+        # @@@ 모델 입출력은 항상 모델 id 기준이고 변환은 TranslatorService / tools에서 처리
+
+        self.packed_encoder = False
+        # True이면 추론 시 pad 토큰을 제거한 packed 입력으로 encoder 실행 (encode 메서드 참고)
+
+        self._compiled = {}
+        # compile_inference로 컴파일한 encoder / decoding step 함수들 (비어 있으면 eager 실행)
+        # @@@ nn.Module이 아닌 dict에 저장해서 state_dict에 포함되지 않도록 함
+
+        self._int8_rows = {}
+        # shortlist_projection용 dynamic int8 ffc weight의 int8 값 / 행별 scale, zero point (_linear_rows 참고, state_dict에 포함되지 않음)
+
+        self.compute_dtype = None
+        # 추론 연산 dtype (torch.bfloat16 등, None이면 weight dtype 그대로) ==> autocast 메서드 참고
+
         self.src_embed = nn.Sequential(embeddings.Embeddings(src_len_vocab, q_dim, padding_idx), pe.PositionalEncoding(d_model=q_dim, dropout_prob=drop_rate, max_len=max_len))
         self.tgt_embed = nn.Sequential(embeddings.Embeddings(tgt_len_vocab, q_dim, padding_idx), pe.PositionalEncoding(d_model=q_dim, dropout_prob=drop_rate, max_len=max_len))
         # num_embeddings = 단어 집합 개수 (len(vocab))
@@ -93,8 +151,10 @@ class Transformer(nn.Module):
         # padding_idx = 패딩 토큰 <PAD> 의 index를 nn.Embedding에 알려주는 인자
 
 
+        head_counts = head_counts or {}
         self.encoder = Encoder(
-            q_dim=q_dim, h_dim=h_dim, head_num=head_num, block_num=en_block_num, drop_rate=drop_rate, visualization=visualization
+            q_dim=q_dim, h_dim=h_dim, head_num=head_num, block_num=en_block_num, drop_rate=drop_rate, visualization=visualization,
+            head_nums=head_counts.get("encoder"),
         )
         self.decoder = Decoder(
             q_dim=q_dim,
@@ -105,6 +165,8 @@ class Transformer(nn.Module):
             block_num=de_block_num,
             drop_rate=drop_rate,
             visualization=visualization,
+            self_head_nums=head_counts.get("decoder_self"),
+            cross_head_nums=head_counts.get("decoder_cross"),
         )
 
         
@@ -180,8 +242,8 @@ class Transformer(nn.Module):
         tgt_mask = self.make_tgt_mask(gt, gt_mask)
 
         assert src_mask.size(-1) == x.size(-1)
-        assert tgt_mask.size(-1) == gt.size(-1)
-        assert tgt_mask.size(-2) == gt.size(-1)
+        assert tgt_mask.key_mask.size(-1) == gt.size(-1)
+        # tgt_mask는 (b, 1, 1, tgt_seq_len) key padding mask만 가진 blocks.CausalMask
 
         Q_en = self.src_embed(x)
         # (b, src_seq_len, q_dim)
@@ -224,9 +286,260 @@ class Transformer(nn.Module):
         # return out
         # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
     
-    def inference(self, x, x_mask, max_pred_len, testing=False):
+    def encode(self, x, src_mask, testing=False):
+        # 추론용 encoder 실행
+        # x: (b, src_seq_len), src_mask: make_pad_mask 결과 (b, 1, 1, src_seq_len)
+        Q_en = self.src_embed(x)
+        # (b, src_seq_len, q_dim)
+
+        if testing:
+            return self.encoder(Q_en, src_mask, testing)
+
+        if not self.packed_encoder:
+            encoder = self._compiled.get("encoder", self.encoder)
+            return encoder(Q_en, src_mask)
+
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        # packed encoder
+        # # pad 토큰은 mask로 attention에서만 가려질 뿐 projection, feed-forward 계산은 그대로 하게 된다
+        # # ==> 실제 토큰들만 (n_tokens, q_dim)으로 모아서 토큰별 연산은 실제 토큰 수만큼만 계산
+        # # pad 위치 출력은 0이 되지만 encoder-decoder attention에서 src_mask로 가려지므로 결과는 동일
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        b, seq_len, q_dim = Q_en.size()
+
+        pack_index = src_mask.reshape(-1).nonzero().squeeze(1)
+        # (n_tokens,) pad가 아닌 토큰들의 (b * src_seq_len) 평탄화 위치
+
+        packed = Q_en.reshape(b * seq_len, q_dim).index_select(0, pack_index)
+        # (n_tokens, q_dim)
+
+        forward_packed = self._compiled.get("encoder_packed", self.encoder.forward_packed)
+        out = forward_packed(packed, pack_index, (b, seq_len), src_mask)
+
+        out_en = out.new_zeros(b * seq_len, q_dim).index_copy_(0, pack_index, out)
+        return out_en.view(b, seq_len, q_dim)
+        # (b, src_seq_len, q_dim)
+
+    def compile_inference(self, mode="default"):
+        # 추론용 encoder forward와 decoding 1 step(decode_step)을 torch.compile로 컴파일
+        # # Encoder/Decoder의 python block 루프와 MultiHeadAttention의 view/permute/contiguous 등
+        # # 작은 연산들을 graph 하나로 묶어서 step마다의 python/연산 호출 overhead 제거
+        # @@@ dynamic=True로 batch 크기, source 길이, cache 길이가 달라도 graph를 재사용
+        # @@@ 실제 컴파일은 첫 호출 시 일어나므로 서버 시작 시 TranslatorService.warmup으로 미리 실행해둔다
+        # @@@ 시각화(testing=True)와 speculative decoding의 draft(n_blocks) 경로는 eager 실행
+        # @@@ capacity KVCache의 buffer 쓰기는 graph 밖에서 실행 (blocks.KVCache._append_buffer 참고)
+        self._compiled = {
+            "encoder": torch.compile(self.encoder.forward, mode=mode, dynamic=True),
+            "encoder_packed": torch.compile(self.encoder.forward_packed, mode=mode, dynamic=True),
+            "decode_step": torch.compile(self._decode_step, mode=mode, dynamic=True),
+            "decode_hidden": torch.compile(self._decode_hidden, mode=mode, dynamic=True),
+        }
+
+    def disable_compiled(self):
+        # 컴파일된 함수들을 버리고 eager 실행으로 되돌림
+        self._compiled = {}
+
+    @property
+    def compiled(self):
+        return bool(self._compiled)
+
+    def autocast(self):
+        # compute_dtype이 설정된 경우 추론 코드를 감쌀 autocast context 반환
+        # # Linear, matmul, SDPA 등은 compute_dtype으로 계산하고 LayerNorm 등은 float32 유지
+        # @@@ autocast 상태는 스레드별이므로 추론을 실행하는 스레드 안에서 사용해야 한다
+        device_type = next(self.parameters()).device.type
+        return torch.autocast(device_type=device_type, dtype=self.compute_dtype, enabled=self.compute_dtype is not None)
+
+    def init_decoder_cache(self, capacity=None):
+        # decoding block마다 masked self-attention용 KVCache 생성
+        # capacity: 최대 cache 길이를 알면 첫 append 시 그 크기의 buffer를 할당해두고 이어쓰기 (blocks.KVCache 참고)
+        return [blocks.KVCache(capacity) for _ in self.decoder.blocks]
+
+    def embed_tgt(self, tokens, offset=0):
+        # incremental decoding 시 새 토큰들을 offset 위치부터 positional encoding하여 embed
+        # tokens: (b, new_len) ==> (b, new_len, q_dim)
+        return self.tgt_embed[1](self.tgt_embed[0](tokens), offset)
+
+    def decode_step(self, tokens, offset, caches, cross_kvs, tgt_mask, src_mask, n_blocks=None, proj=None):
+        # KV cache에 이어서 새 토큰들을 decoding하고 마지막 위치의 logits 반환
+        # tokens: (b, new_len), offset: int 또는 row별 위치 (b,) long tensor
+        # tgt_mask: cache + 새 토큰 key에 대한 mask, src_mask: cross_kvs key에 대한 mask
+        # n_blocks: 앞쪽 n_blocks개 decoding block만 실행 (None이면 전체)
+        # proj: shortlist_projection으로 만든 (weight, bias)가 주어지면 후보 토큰들의 logits만 계산
+        if n_blocks is None and "decode_step" in self._compiled:
+            if isinstance(offset, int):
+                offset = torch.full((tokens.size(0),), offset, dtype=torch.long, device=tokens.device)
+                # @@@ python int는 값마다 graph가 따로 컴파일되므로 row별 위치 tensor로 전달
+            return self._compiled["decode_step"](tokens, offset, caches, cross_kvs, tgt_mask, src_mask, None, proj)
+
+        return self._decode_step(tokens, offset, caches, cross_kvs, tgt_mask, src_mask, n_blocks, proj)
+
+    def decode_hidden(self, tokens, offset, caches, cross_kvs, tgt_mask, src_mask):
+        # decode_step과 같지만 ffc 이전 마지막 위치 decoder 출력 (b, q_dim) 반환
+        # # ffc 대신 MipsIndex로 다음 토큰을 찾거나 shortlist 결과를 전체 vocab과 비교할 때 사용
+        if "decode_hidden" in self._compiled:
+            if isinstance(offset, int):
+                offset = torch.full((tokens.size(0),), offset, dtype=torch.long, device=tokens.device)
+            return self._compiled["decode_hidden"](tokens, offset, caches, cross_kvs, tgt_mask, src_mask)
+
+        return self._decode_hidden(tokens, offset, caches, cross_kvs, tgt_mask, src_mask)
+
+    def _decode_step(self, tokens, offset, caches, cross_kvs, tgt_mask, src_mask, n_blocks=None, proj=None):
+        return self.project(self._decode_hidden(tokens, offset, caches, cross_kvs, tgt_mask, src_mask, n_blocks), proj)
+        # (b, tgt_len_vocab) 또는 (b, 후보 토큰 수)
+
+    def _decode_hidden(self, tokens, offset, caches, cross_kvs, tgt_mask, src_mask, n_blocks=None):
+        # decode_step의 ffc 이전 마지막 위치 decoder 출력
+        # ==> (b, q_dim)
+        Q_de = self.embed_tgt(tokens, offset)
+        out_de = self.decoder(Q_de, None, None, tgt_mask, src_mask, caches=caches, cross_kvs=cross_kvs, n_blocks=n_blocks)
+        return out_de[:, -1, :]
+
+    def project(self, h, proj=None):
+        # decoder 출력 h (b, q_dim) ==> logits
+        # # proj가 None이면 ffc로 전체 vocab (b, tgt_len_vocab), 아니면 후보 토큰들만 (b, 후보 토큰 수)
+        if proj is None:
+            return self.ffc(h)
+        return F.linear(h, proj[0], proj[1])
+
+    def ffc_parameters(self):
+        # ffc의 (weight (tgt_len_vocab, q_dim), bias (tgt_len_vocab,) 또는 None)
+        # @@@ 저랭크 ffc(LowRankLinear)면 up @ down으로 전체 크기 weight를 만들어 반환
+        if isinstance(self.ffc, LowRankLinear):
+            up, bias = self._linear_parameters(self.ffc.up)
+            down, _ = self._linear_parameters(self.ffc.down)
+            return up @ down, bias
+        return self._linear_parameters(self.ffc)
+
+    @staticmethod
+    def _linear_parameters(linear):
+        weight = linear.weight
+        bias = linear.bias
+        if callable(weight):
+            # dynamic int8 양자화된 Linear는 weight()/bias() 메서드로 packed weight를 꺼내야 한다
+            # # float로 되돌린 복사본 반환
+            weight = weight().dequantize()
+            bias = bias()
+        return weight, bias
+
+    def _linear_rows(self, linear, rows):
+        # linear의 rows 행만 float로 꺼낸 (weight (n_rows, in_features), 전체 bias 또는 None)
+        weight = linear.weight
+        if not callable(weight):
+            return weight.index_select(0, rows), linear.bias
+
+        # @@@ dynamic int8 양자화된 Linear (QUANTIZATION: dynamic_int8, EMBED_QUANTIZATION의 tying된 ffc)
+        # # weight().dequantize()는 batch마다 전체 vocab 크기 float weight(64101 x 512, 약 130 MB)를 만들므로
+        # # 처음 1번 int8 값과 행별 scale / zero point를 꺼내두고 후보 행만 float로 변환
+        cached = self._int8_rows
+        if cached.get("linear") is not linear:
+            q = weight()
+            if q.qscheme() in (torch.per_channel_affine, torch.per_channel_symmetric):
+                scale = q.q_per_channel_scales().float()
+                zero = q.q_per_channel_zero_points().float()
+            else:
+                scale = torch.full((q.size(0),), q.q_scale())
+                zero = torch.full((q.size(0),), float(q.q_zero_point()))
+            self._int8_rows = cached = {"linear": linear, "int8": q.int_repr(), "scale": scale, "zero": zero}
+            # @@@ ffc가 교체되면(use_low_rank_ffc 등) linear가 달라지므로 다시 계산
+
+        q = cached["int8"].index_select(0, rows).float()
+        weight = (q - cached["zero"].index_select(0, rows).unsqueeze(1)) * cached["scale"].index_select(0, rows).unsqueeze(1)
+        return weight, linear.bias()
+
+    def shortlist_projection(self, vocab):
+        # vocab: (n_candidates,) 후보 토큰 id ==> 후보 토큰 행만 잘라낸 ffc (weight, bias)
+        # @@@ decoding 시작 전에 batch당 1번만 잘라두고 매 step 재사용
+        # @@@ 전체 vocab 크기 weight를 만들지 않고 후보 행만 꺼낸다 (_linear_rows)
+        if isinstance(self.ffc, LowRankLinear):
+            up, bias = self._linear_rows(self.ffc.up, vocab)
+            down, _ = self._linear_parameters(self.ffc.down)
+            weight = up @ down
+            # 저랭크 ffc는 후보 행만 up @ down으로 계산
+        else:
+            weight, bias = self._linear_rows(self.ffc, vocab)
+        bias = bias.index_select(0, vocab) if bias is not None else None
+        return weight, bias
+
+    def use_low_rank_ffc(self, rank, svd=None, bias=None):
+        # ffc를 rank의 LowRankLinear로 교체
+        # # svd: low_rank.svd(ffc weight) 결과가 주어지면 상위 rank개 특이값으로 초기화 (bias는 원래 ffc bias)
+        # # 없으면 체크포인트 로드용 빈 layer
+        q_dim = self.tgt_embed[0].embeddding_dim
+        if svd is not None:
+            self.ffc = LowRankLinear.from_svd(svd, bias, rank)
+        else:
+            self.ffc = LowRankLinear(q_dim, self.tgt_len_vocab, rank, bias=self.ffc.bias is not None)
+        self.disable_compiled()
+        # @@@ 이전 ffc로 컴파일된 graph는 버리고 필요하면 compile_inference를 다시 호출
+        return self.ffc
+
+    def attention_modules(self):
+        # attention 종류별 block 순서의 blocks.MultiHeadAttention 리스트 (head_counts와 같은 key)
+        return {
+            "encoder": [m.MHA for m in self.encoder.blocks],
+            "decoder_self": [m.MMHA for m in self.decoder.blocks],
+            "decoder_cross": [m.MHA for m in self.decoder.blocks],
+        }
+
+    def head_counts(self):
+        # 현재 attention 종류별 block별 head 수 (head pruning 체크포인트에 저장하는 형식)
+        return {name: [m.head_num for m in modules] for name, modules in self.attention_modules().items()}
+
+    def prune_heads(self, keep):
+        # keep: {attention 종류: block별 남길 head 번호 리스트} ==> make_Q/K/V/O를 실제로 줄인다 (MultiHeadAttention.prune_heads)
+        for name, modules in self.attention_modules().items():
+            for m, heads in zip(modules, keep[name]):
+                if len(heads) < m.head_num:
+                    m.prune_heads(heads)
+        self.disable_compiled()
+        # @@@ 이전 크기로 컴파일된 graph는 버리고 필요하면 compile_inference를 다시 호출
+
+    def verify_tokens(self, ys, n_new, caches, cross_kvs, src_mask):
+        # ys의 마지막 n_new개 토큰을 전체 decoder에 한번에 넣어 각 위치의 greedy 다음 토큰 반환
+        # # caches에는 ys[:, :-n_new]의 key/value가 들어 있어야 한다
+        # ys: (b, seq_len) ==> (b, n_new)
+        # @@@ i번째 새 토큰 위치의 출력은 ys[:, :seq_len - n_new + i + 1]만 보고 계산되므로
+        #     n_new번의 순차 step과 같은 결과를 decoder 1번 실행으로 얻는다
+        offset = ys.size(1) - n_new
+        tgt_mask = self.make_tgt_mask_cached(ys, n_new)
+        Q_de = self.embed_tgt(ys[:, offset:], offset)
+        out_de = self.decoder(Q_de, None, None, tgt_mask, src_mask, caches=caches, cross_kvs=cross_kvs)
+        return self.ffc(out_de).argmax(dim=-1)
+        # (b, n_new)
+
+    def inference(self, x, x_mask, max_pred_len, testing=False, use_cache=False, drafts=None, vocab=None, vocab_stats=None, index=None, len_ratio=None, len_offset=0, repeat=None, repeat_flags=None):
         # Greedy decoding
-        # TODO: Beam search 구현
+        # @@@ beam search는 beam_search 메서드 사용
+
+        # len_ratio가 주어지면 문장별 최대 생성 길이를 min(max_pred_len, ceil(source 토큰 수 * len_ratio) + len_offset)로 제한
+        # # 자기 길이 제한만큼 토큰을 생성한 문장은 그 뒤에 eos를 넣어 종료하고 나머지 문장은 계속 decoding
+        # # @@@ 길이 제한은 max_pred_len과 같이 eos를 제외한 생성 토큰 수 (continuous batching 엔진과 동일)
+        # # 루프 최대 반복 수도 batch 안에서 가장 긴 제한까지만 실행
+
+        # vocab: VocabShortlist.candidates로 만든 후보 토큰 id (n_candidates,)가 주어지면
+        # # ffc와 argmax를 후보 토큰들에 대해서만 계산
+        # vocab_stats: dict가 주어지면 매 step 전체 vocab argmax도 계산해서 후보 argmax와 다른 횟수를 누적
+        # # {"steps": 아직 eos가 안 나온 문장들의 step 수, "mismatches": 그 중 전체 vocab argmax와 다른 횟수}
+        # # @@@ 측정용이므로 결과는 후보 argmax를 그대로 사용 (전체 vocab ffc를 추가로 계산하므로 느려진다)
+        # index: MipsIndex가 주어지면 ffc + argmax 대신 근사 MIPS 검색 + exact rescoring으로 다음 토큰 선택
+        # # (vocab이 주어지면 무시)
+
+        # repeat: RepetitionDetector가 주어지면 매 step 새 토큰으로 n-gram 반복 루프를 검사해서
+        # # 루프로 판정된 문장은 반복 구간의 첫 n-gram 뒤에 eos를 넣고 종료 (통계는 repeat.stats_summary())
+        # repeat_flags: list가 주어지면 문장별 반복 루프 판정 여부(bool)를 batch 순서대로 추가
+
+        # drafts: 문장별 draft 토큰 id 리스트 (번역 메모리)가 주어지면 draft를 한번에 검증하는 memory_inference 사용
+        # # 결과는 greedy decoding과 동일 (len_ratio 문장별 길이 제한, repeat 반복 검출 포함, 시각화 시에는 무시)
+        if drafts is not None and not testing:
+            return self.memory_inference(
+                x, x_mask, max_pred_len, drafts, len_ratio=len_ratio, len_offset=len_offset, repeat=repeat, repeat_flags=repeat_flags
+            )[0]
+
+        # use_cache=True이면 KV cache를 사용하는 incremental decoding
+        # # 매 step마다 ys 전체를 다시 embed하고 decoder에 넣는 대신 마지막 토큰만 decoder에 넣고
+        # # 이전 토큰들의 self-attention key/value는 cache에서 재사용 ==> step당 O(n) 계산
+        # @@@ 시각화(testing=True)는 ys 전체에 대한 attention 값이 필요하므로 cache 사용 불가
         
         # x는 embed 되기전 seq token id들을 담은 long tensor
         # (b, seq_len)
@@ -239,64 +552,177 @@ class Transformer(nn.Module):
 
         assert src_mask.size(-1) == x.size(-1)
 
-        Q_en = self.src_embed(x)
+        out_en = self.encode(x, src_mask, testing)
         # (b, seq_len, q_dim)
         # @@ batch안의 각 문장의 원래 길이는 다 다르지만 collate함수를 이용해 dataloader가 batch단위로 내보낼 때
         # @@ batch안의 가장 긴 문장의 길이를 기준으로 그보다 짧은 문장들은 다 padding을 추가해준다
 
-        out_en = self.encoder(Q_en, src_mask, testing)
-        # (b, seq_len, q_dim)
-
-        ys = torch.zeros(n_batch, 1, device=device).fill_(self.start_idx).type_as(x)
-        # (b, 1) 에 start 토큰을 채우기
+        cross_kvs = self.decoder.precompute_cross_kv(out_en)
+        # block별 (K_, V_): (b, head_num, seq_len, head_dim)
+        # @@@ encoder output은 decoding 동안 변하지 않으므로 encoder-decoder attention의 K, V projection은 1번만 계산
+
+        budgets = None
+        if len_ratio is not None:
+            budgets = self.decode_budgets(x_mask, max_pred_len, len_ratio, len_offset)
+            # (b,) 문장별 최대 생성 토큰 수 (eos 제외)
+            max_pred_len = int(budgets.max())
+
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        # 매 step마다 torch.cat으로 ys, KV cache, mask를 1칸씩 늘리면 step마다 길이 L짜리 tensor를 새로 할당하고 복사
+        # # ==> max_pred_len 크기 buffer를 decoding 시작 시 1번 할당하고 step마다 해당 위치에만 값을 쓴 뒤
+        # #     앞쪽 채워진 부분의 view를 사용
+        # # eos 확인도 ys 전체를 다시 보는 대신 문장별 finished flag를 새 토큰으로만 갱신
+        # # softmax는 argmax 결과를 바꾸지 않으므로 생략 ((b, tgt_len_vocab) float32 tensor 할당 제거)
+        # @@@ 시각화(testing=True)와 use_cache=False 경로도 같은 ys buffer를 사용
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        ys_buf = torch.full((n_batch, max_pred_len + 1), self.padding_idx, dtype=x.dtype, device=device)
+        ys_buf[:, 0] = self.start_idx
+        # (b, 1 + max_pred_len) 첫 위치에 start 토큰
         # @@@ 텐서 생성 시에 x와 동일한 device에 있도록 반드시 명시
 
-        # for i in range(self.max_len):
-        # 5000을 max로 하면 메모리 초과 문제 발생?
-        for i in range(max_pred_len):
+        finished = torch.zeros(n_batch, dtype=torch.bool, device=device)
+        # (b,) 문장별 eos 생성 여부
 
-            tgt_mask = self.make_tgt_mask_inference(ys, self.padding_idx)
+        caches = self.init_decoder_cache(capacity=max_pred_len) if (use_cache and not testing) else None
 
-            assert tgt_mask.size(-1) == ys.size(-1)
+        tgt_valid = torch.ones(n_batch, 1, 1, max_pred_len, dtype=torch.bool, device=device) if caches is not None else None
+        # (b, 1, 1, max_pred_len) cache key별 pad 여부 (make_pad_mask_inference(ys)를 위치별로 1번씩만 계산)
 
-            Q_de = self.tgt_embed(ys)
-            # (b, seq_len, q_dim)
+        proj = self.shortlist_projection(vocab) if vocab is not None else None
+        # 후보 토큰 행만 잘라낸 ffc weight (batch 안의 모든 문장이 공유)
+        check = proj is not None and vocab_stats is not None
+        full_proj = self.ffc_parameters() if check else None
+        # 비교용 전체 vocab ffc (weight, bias)
+        # @@@ int8 모델도 후보 행과 같은 dequantize된 float weight로 계산해야 양자화 오차가 불일치로 잡히지 않는다
+        if proj is not None:
+            index = None
 
-            out_de = self.decoder(Q_de, out_en, out_en, tgt_mask, src_mask, testing)
-            # decoding block 2번째 encoder-decoder attention의 Q,K,V는
-            # Q: 1번 Masked self-attention output
-            # K,V: encoder output
-            # 로 되어 있으므로 out_en을 K,V 자리에 입력
+        n_filled = 1
+        # ys_buf에서 값이 채워진 길이
 
-            # out = self.softmax(self.ffc(out_de))
-            # out.size() = (b, seq_len, tgt_len_vocab)
-            # 마지막 단어의 결과(dim=1(seq_len)의 마지막)가 새 단어 예측
-            # next_token_prob = out[:, -1, :]
-            # (b, tgt_len_vocab)
-            # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
-            # @@@ ffc linear에 들어가기 전에 미리 마지막 단어만 남기는게 계산 및 메모리 절약에 도움이 된다
-            # # @@@ ffc linear에 매번 out_de 전체를 넣으면 메모리 초과 문제 발생
-            # next_token_prob = self.softmax(self.ffc(out_de[:, -1, :]))
-            next_token_prob = F.softmax(self.ffc(out_de[:, -1, :]), dim=-1)
-            # 마지막 단어의 결과(dim=1(seq_len)의 마지막)가 새 단어 예측
-            # out.size() = (b, tgt_len_vocab)
-            # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        if repeat is not None:
+            runs, recent = repeat.init_state(n_batch, device)
+            looped = torch.zeros(n_batch, dtype=torch.bool, device=device)
+            # (b,) 반복 루프로 판정되어 종료된 문장
+            saved_steps = 0
 
-            # argmax로 확률이 제일 큰 index 찾기
-            next_token = next_token_prob.argmax(dim=-1).unsqueeze(1)
-            # (b, 1)
-
-            ys = torch.cat([ys, next_token], dim=1)
+        # for i in range(self.max_len):
+        # 5000을 max로 하면 메모리 초과 문제 발생?
+        for i in range(max_pred_len):
+            ys = ys_buf[:, :i + 1]
+            # (b, i + 1) 지금까지 생성된 토큰 (view)
+
+            if caches is not None:
+                tgt_valid[:, 0, 0, i] = ys_buf[:, i] != self.padding_idx
+                tgt_mask = tgt_valid[..., :i + 1]
+                # (b, 1, 1, seq_len)
+                # @@@ query는 마지막 토큰 하나뿐이므로 subsequent mask 없이 key의 pad 부분만 masking
+
+                if check or index is not None:
+                    h = self.decode_hidden(ys[:, -1:], i, caches, cross_kvs, tgt_mask, src_mask)
+                    logits = self.project(h, proj) if index is None else None
+                else:
+                    logits = self.decode_step(ys[:, -1:], i, caches, cross_kvs, tgt_mask, src_mask, proj=proj)
+                # (b, tgt_len_vocab) 또는 (b, 후보 토큰 수)
+                # @@@ compile_inference로 컴파일된 decoding step이 있으면 컴파일된 graph로 실행
+            else:
+                tgt_mask = self.make_tgt_mask_inference(ys, self.padding_idx)
+
+                Q_de = self.tgt_embed(ys)
+                # (b, seq_len, q_dim)
+
+                assert tgt_mask.key_mask is None or tgt_mask.key_mask.size(-1) == ys.size(-1)
+
+                out_de = self.decoder(Q_de, out_en, out_en, tgt_mask, src_mask, testing, caches=caches, cross_kvs=cross_kvs)
+                # decoding block 2번째 encoder-decoder attention의 Q,K,V는
+                # Q: 1번 Masked self-attention output
+                # K,V: encoder output
+                # 로 되어 있으므로 out_en을 K,V 자리에 입력
+
+                # out = self.softmax(self.ffc(out_de))
+                # out.size() = (b, seq_len, tgt_len_vocab)
+                # 마지막 단어의 결과(dim=1(seq_len)의 마지막)가 새 단어 예측
+                # next_token_prob = out[:, -1, :]
+                # (b, tgt_len_vocab)
+                # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+                # @@@ ffc linear에 들어가기 전에 미리 마지막 단어만 남기는게 계산 및 메모리 절약에 도움이 된다
+                # # @@@ ffc linear에 매번 out_de 전체를 넣으면 메모리 초과 문제 발생
+                # next_token_prob = self.softmax(self.ffc(out_de[:, -1, :]))
+                h = out_de[:, -1, :]
+                logits = self.project(h, proj) if index is None else None
+                # 마지막 단어의 결과(dim=1(seq_len)의 마지막)가 새 단어 예측
+                # out.size() = (b, tgt_len_vocab)
+                # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+            if index is not None:
+                next_token = index.argmax(h)
+                # (b,) 전체 vocab logits를 만들지 않고 검색한 cluster들의 행만 계산
+            else:
+                # next_token_prob = F.softmax(logits.float(), dim=-1)
+                # next_token = next_token_prob.argmax(dim=-1)
+                # argmax로 logits가 제일 큰 index 찾기 (softmax 후 argmax와 같은 토큰)
+                next_token = logits.argmax(dim=-1)
+                # (b,)
+
+            if vocab is not None:
+                next_token = vocab[next_token]
+                # 후보 목록 안의 위치 ==> 실제 토큰 id
+
+                if check:
+                    full_token = self.project(h, full_proj).argmax(dim=-1)
+                    vocab_stats["steps"] += int((~finished).sum())
+                    vocab_stats["mismatches"] += int(((next_token != full_token) & ~finished).sum())
+
+            if budgets is not None:
+                next_token = next_token.masked_fill(budgets == i, self.end_idx)
+                # 이미 길이 제한만큼 토큰을 생성한 문장은 eos (이미 끝난 문장은 _finalize_preds에서 pad로 바뀜)
+
+            ys_buf[:, i + 1] = next_token
+            n_filled = i + 2
+            # ys = torch.cat([ys, next_token], dim=1)
+
+            if repeat is not None:
+                runs, recent, hit, drop = repeat.update(runs, recent, next_token)
+                hit &= ~finished & (next_token != self.end_idx)
+                if hit.any():
+                    rows = hit.nonzero().squeeze(1)
+                    ys_buf[rows, i + 2 - drop[rows]] = self.end_idx
+                    # 반복 토큰들을 지운 위치에 eos (뒤쪽 토큰은 _finalize_preds에서 pad로 바뀜)
+                    saved_steps += int(budgets[rows].sum()) - rows.numel() * (i + 1) if budgets is not None else rows.numel() * (max_pred_len - i - 1)
+                    # 판정된 문장들의 남은 최대 생성 step 수
+                    looped |= hit
+                    finished |= hit
 
             # 모든 문장에 eos 토큰이 생성된 것을 확인하면 for 루프 break
-            eos_in_sentence = (ys == self.end_idx).any(dim=1)
-            if eos_in_sentence.all():
+            finished |= next_token == self.end_idx
+            if budgets is not None:
+                finished |= budgets == i + 1
+                # 이번 step에 길이 제한에 도달한 문장도 종료 (루프가 여기서 끝나면 eos는 _finalize_preds에서 추가)
                 break
-        
+
+        if repeat is not None:
+            repeat.record(n_batch, int(looped.sum()), saved_steps)
+            if repeat_flags is not None:
+                repeat_flags.extend(looped.tolist())
+
+        return self._finalize_preds(ys_buf[:, :n_filled])
+
+    def decode_budgets(self, x_mask, max_pred_len, len_ratio, len_offset=0):
+        # x_mask: (b, src_seq_len) ==> (b,) 문장별 최대 생성 토큰 수 (eos 제외, max_pred_len과 같은 기준)
+        # # ceil(source 토큰 수 * len_ratio) + len_offset을 1 ~ max_pred_len 범위로 제한
+        # @@@ 번역 길이는 대략 source 길이에 비례하므로 짧은 입력이 반복 생성 등으로 eos를 못 만들 때
+        #     max_pred_len(최대 1024)번까지 decoder를 실행하지 않도록 문장별로 상한을 둔다
+        src_len = x_mask.sum(dim=1).float()
+        return (src_len * len_ratio).ceil().long().add_(len_offset).clamp_(1, max_pred_len)
+
+    def _finalize_preds(self, ys):
+        # greedy decoding 결과 ys (b, 1 + pred_len) 후처리
+
         # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
-        # 배치 내의 모든 생성 문장이 최대길이를 넘겨서 eos 토큰이 나오기 전에 루프가 종료된 경우 예외 처리
-        if not (ys == self.end_idx).any():
-            eos = torch.zeros(n_batch, 1, device=device).fill_(self.end_idx).type_as(x)
+        # 배치 내의 생성 문장이 최대길이를 넘겨서 eos 토큰이 나오기 전에 루프가 종료된 경우 예외 처리
+        # @@@ eos가 없는 문장이 하나라도 있으면 끝에 eos 열 추가 (eos가 없는 행은 첫 eos 위치가 0으로 잡혀 전부 pad가 되므로)
+        if not (ys == self.end_idx).any(dim=1).all():
+            eos = torch.zeros(ys.size(0), 1, device=ys.device).fill_(self.end_idx).type_as(ys)
             ys = torch.cat([ys, eos], dim=1)
         # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
 
@@ -322,7 +748,7 @@ class Transformer(nn.Module):
         # # ==> self.end_idx가 문장 안에 여러번 나와도 최초 출현 위치의 idx만 반환한다
         
         # 각 문장별 위치 인덱스 생성 (seq_len)
-        seq_indices = torch.arange(ys.size(1), device=device).unsqueeze(0)
+        seq_indices = torch.arange(ys.size(1), device=ys.device).unsqueeze(0)
         # (1, seq_len)
         # [[0, 1, 2, 3, ...., seq_len - 1]] 형태
 
@@ -339,10 +765,367 @@ class Transformer(nn.Module):
         # labels와 동일하게 시작토큰을 제외
         return ys[:, 1:]
 
+
+    def speculative_inference(self, x, x_mask, max_pred_len, draft_blocks=2, n_draft=4, len_ratio=None, len_offset=0, repeat=None, repeat_flags=None):
+        # Speculative greedy decoding (shallow self-draft)
+        # # 앞쪽 draft_blocks개 decoding block + 공유 ffc로 만든 얕은 draft 모델이 n_draft개 토큰을 순차 제안하고
+        # # 전체 decoder가 제안된 토큰들을 한번에(verify_tokens) 검증
+        # ==> 결과는 greedy decoding(inference)과 동일하고 전체 decoder 실행 횟수는 최대 (n_draft + 1)배 줄어든다
+        # @@@ draft block들은 전체 decoder의 앞쪽 block과 같은 모듈이므로 KV cache도 공유
+        #     (draft 단계에서 쌓인 draft block cache는 검증 전에 잘라내고 검증 pass에서 다시 채운다)
+
+        # len_ratio, len_offset, repeat, repeat_flags: inference와 같은 문장별 길이 제한 / 반복 루프 검출 ==> _draft_and_verify 참고
+        # 반환: (preds, stats) ==> _draft_and_verify 참고
+        draft_blocks = min(draft_blocks, len(self.decoder.blocks))
+
+        def propose(ys, caches, cross_kvs, src_mask, max_draft):
+            cur_len = ys.size(1)
+
+            # 얕은 모델로 k개 토큰 순차 생성
+            draft = ys
+            for j in range(min(n_draft, max_draft)):
+                tgt_mask = self.make_pad_mask_inference(draft, self.padding_idx)
+                logits = self.decode_step(draft[:, -1:], cur_len - 1 + j, caches, cross_kvs, tgt_mask, src_mask, n_blocks=draft_blocks)
+                draft = torch.cat([draft, logits.argmax(dim=-1, keepdim=True)], dim=1)
+            # (b, cur_len + k)
+
+            for cache in caches[:draft_blocks]:
+                cache.truncate(cur_len - 1)
+
+            tokens = draft[:, cur_len:]
+            return tokens, torch.ones_like(tokens, dtype=torch.bool)
+
+        return self._draft_and_verify(
+            x, x_mask, max_pred_len, propose, len_ratio=len_ratio, len_offset=len_offset, repeat=repeat, repeat_flags=repeat_flags
+        )
+
+    def memory_inference(self, x, x_mask, max_pred_len, drafts, len_ratio=None, len_offset=0, repeat=None, repeat_flags=None):
+        # 번역 메모리(이전 번역 결과) 기반 speculative greedy decoding
+        # drafts: 문장별 draft 토큰 id 리스트 (비슷한 source 문장의 저장된 번역, eos 포함) 또는 None
+        # # draft를 통째로 전체 decoder 1번 실행으로 검증하고, greedy와 처음 어긋난 위치부터는 일반 decoding
+        # ==> 반복되는 문장은 수백 step이 몇 번의 decoder 실행으로 줄어들고 결과는 greedy decoding과 동일
+        # @@@ 확정 토큰 수는 batch 안의 최소값이므로 draft가 없는 문장과는 같은 batch로 묶지 않는 것이 좋다
+
+        # len_ratio, len_offset, repeat, repeat_flags: inference와 같은 문장별 길이 제한 / 반복 루프 검출 ==> _draft_and_verify 참고
+        # 반환: (preds, stats) ==> _draft_and_verify 참고
+        device = x.device
+
+        draft_len = torch.tensor([len(d) if d else 0 for d in drafts], dtype=torch.long, device=device)
+        draft_ids = torch.full((len(drafts), max(1, int(draft_len.max()))), self.padding_idx, dtype=torch.long, device=device)
+        for i, d in enumerate(drafts):
+            if d:
+                draft_ids[i, :len(d)] = torch.tensor(d, dtype=torch.long, device=device)
+        # (b, max_draft_len)
+
+        def propose(ys, caches, cross_kvs, src_mask, max_draft):
+            n_gen = ys.size(1) - 1
+            # 지금까지 생성된 토큰 수 = 다음에 제안할 draft 위치
+
+            # 생성된 토큰이 draft 앞부분과 모두 같은 문장만 draft를 계속 제안
+            n_cmp = min(n_gen, draft_ids.size(1))
+            on_draft = (ys[:, 1:1 + n_cmp] == draft_ids[:, :n_cmp]).all(dim=1) & (draft_len > n_gen)
+
+            remaining = (draft_len - n_gen).masked_fill(~on_draft, 0)
+            k = min(max_draft, int(remaining.max()))
+
+            positions = torch.arange(n_gen, n_gen + k, device=device)
+            valid = positions.unsqueeze(0) < (n_gen + remaining).unsqueeze(1)
+            # (b, k) 문장별로 제안할 draft가 있는 위치
+            tokens = draft_ids[:, n_gen:n_gen + k].masked_fill(~valid, self.padding_idx)
+            return tokens, valid
+
+        return self._draft_and_verify(
+            x, x_mask, max_pred_len, propose, len_ratio=len_ratio, len_offset=len_offset, repeat=repeat, repeat_flags=repeat_flags
+        )
+
+    def _draft_and_verify(self, x, x_mask, max_pred_len, propose, len_ratio=None, len_offset=0, repeat=None, repeat_flags=None):
+        # speculative decoding 공통 루프
+        # # propose(ys, caches, cross_kvs, src_mask, max_draft)가 최대 max_draft개의 draft 토큰 (b, k)과
+        # #   유효 위치 (b, k) bool을 반환하면 전체 decoder가 ys 마지막 토큰 + draft를 한번에 검증하고
+        # #   greedy 토큰과 일치하는 앞부분 + 전체 decoder가 예측한 다음 토큰 1개를 확정
+        # @@@ batch 안에서 decoding 길이를 맞추기 위해 step마다 확정 토큰 수는 아직 끝나지 않은 문장들 중 최소값
+        # len_ratio가 주어지면 inference와 같은 문장별 최대 생성 길이(decode_budgets)를 적용
+        # # 길이 제한만큼 토큰을 확정한 문장은 다음 위치의 토큰을 eos로 바꿔서 greedy decoding과 같은 위치에서 종료
+        # repeat: RepetitionDetector가 주어지면 확정된 토큰들을 위치 순서대로 검사해서 inference와 같은 위치에서 반복 루프 종료
+        # # (번역 메모리에 저장된 반복 루프 결과도 다시 decoding할 때 같은 결과로 끝난다)
+        # repeat_flags: list가 주어지면 문장별 반복 루프 판정 여부(bool)를 batch 순서대로 추가
+
+        # 반환: (preds, stats)
+        # # stats: proposed(제안된 draft 토큰 수), accepted(greedy와 일치한 draft 토큰 수), verify_steps(전체 decoder 실행 수)
+        # # @@@ proposed/accepted는 끝나지 않은 문장별로 셈 ==> accepted / proposed가 draft의 acceptance rate
+
+        device = x.device
+
+        n_batch = x.size(0)
+
+        src_mask = self.make_pad_mask(x_mask)
+
+        out_en = self.encode(x, src_mask)
+        cross_kvs = self.decoder.precompute_cross_kv(out_en)
+        # block별 (K_, V_): (b, head_num, seq_len, head_dim)
+
+        budgets = None
+        if len_ratio is not None:
+            budgets = self.decode_budgets(x_mask, max_pred_len, len_ratio, len_offset)
+            # (b,) 문장별 최대 생성 토큰 수 (eos 제외)
+            max_pred_len = int(budgets.max())
+
+        ys = torch.zeros(n_batch, 1, device=device).fill_(self.start_idx).type_as(x)
+        # (b, 1)
+
+        caches = self.init_decoder_cache(capacity=max_pred_len + 1)
+        # @@@ cache에는 항상 ys[:, :-1]의 key/value만 들어 있고 ys의 마지막 토큰은 다음 pass의 입력
+        # @@@ 거절된 draft는 truncate로 buffer view만 줄이므로 다음 pass가 같은 buffer 위치에 덮어쓴다
+
+        finished = torch.zeros(n_batch, dtype=torch.bool, device=device)
+        stats = {"proposed": 0, "accepted": 0, "verify_steps": 0}
+
+        if repeat is not None:
+            runs, recent = repeat.init_state(n_batch, device)
+            looped = torch.zeros(n_batch, dtype=torch.bool, device=device)
+            # (b,) 반복 루프로 판정되어 종료된 문장
+            stop_pos = torch.zeros(n_batch, dtype=torch.long, device=device)
+            # (b,) 반복 루프로 판정된 ys 위치 (eos는 그보다 앞에 들어가지만 greedy decoding은 이 위치까지 실행)
+            saved_steps = 0
+
+        while ys.size(1) - 1 < max_pred_len and not finished.all():
+            cur_len = ys.size(1)
+
+            draft, valid = propose(ys, caches, cross_kvs, src_mask, max_pred_len - cur_len)
+            # 확정되는 토큰 수(최대 k + 1)가 max_pred_len을 넘지 않도록 draft 수 제한
+            k = draft.size(1)
+
+            # verify: ys의 마지막 토큰 + draft k개를 전체 decoder로 한번에 검증
+            greedy = self.verify_tokens(torch.cat([ys, draft], dim=1), k + 1, caches, cross_kvs, src_mask)
+            # (b, k + 1) greedy[:, j]는 draft j개까지 이어붙인 ys 다음에 올 greedy 토큰
+
+            matched = ((draft == greedy[:, :k]) & valid).long().cumprod(dim=1).sum(dim=1)
+            # (b,) 문장별로 greedy와 연속해서 일치한 draft 토큰 수
+
+            stats["proposed"] += int(valid[~finished].sum())
+            stats["accepted"] += int(matched[~finished].sum())
+            stats["verify_steps"] += 1
+
+            n_accept = int(matched.masked_fill(finished, k).min())
+            # 이미 eos가 나온 문장은 확정 토큰 수 결정에서 제외
+
+            ys = torch.cat([ys, greedy[:, :n_accept + 1]], dim=1)
+            # 일치한 draft 토큰들(= greedy 토큰)과 그 다음 greedy 토큰 확정
+
+            if budgets is not None:
+                positions = torch.arange(cur_len, ys.size(1), device=device)
+                ys[:, cur_len:] = ys[:, cur_len:].masked_fill(positions.unsqueeze(0) == budgets.unsqueeze(1) + 1, self.end_idx)
+                # ys 위치 p는 p번째 생성 토큰 ==> 길이 제한 다음 위치의 토큰은 eos (inference의 강제 종료와 동일)
+                # @@@ 그 위치의 cache에는 원래 토큰의 key/value가 남지만 이 문장은 여기서 끝나므로 결과에 영향 없음
+
+            if repeat is not None:
+                done = finished.clone()
+                for p in range(cur_len, ys.size(1)):
+                    token = ys[:, p]
+                    runs, recent, hit, drop = repeat.update(runs, recent, token)
+                    hit &= ~done & (token != self.end_idx)
+                    if hit.any():
+                        rows = hit.nonzero().squeeze(1)
+                        ys[rows, p + 1 - drop[rows]] = self.end_idx
+                        # inference와 동일하게 반복 토큰들을 지운 위치에 eos
+                        saved_steps += int(budgets[rows].sum()) - rows.numel() * p if budgets is not None else rows.numel() * (max_pred_len - p)
+                        looped |= hit
+                        stop_pos[rows] = p
+                        finished |= hit
+                    done |= hit | (token == self.end_idx)
+                # @@@ 위치 p의 토큰은 p - 1까지 끝나지 않은 문장만 검사 (inference의 step별 finished 갱신과 같은 순서)
+
+            for cache in caches:
+                cache.truncate(cur_len + n_accept)
+            # 거절된 draft 토큰의 key/value 제거
+
+            finished |= (ys[:, cur_len:] == self.end_idx).any(dim=1)
+            if budgets is not None:
+                finished |= ys.size(1) - 1 >= budgets
+                # 길이 제한만큼 토큰을 생성한 문장도 종료
+
+        if finished.all():
+            # greedy decoding과 같은 길이가 되도록 마지막으로 eos가 나온 문장의 eos 뒤 토큰 제거
+            last = (ys == self.end_idx).int().argmax(dim=1)
+            if budgets is not None:
+                last = torch.where((ys == self.end_idx).any(dim=1), last, budgets)
+                # eos 전에 길이 제한에 도달한 문장은 마지막 생성 토큰 위치까지 (eos는 _finalize_preds에서 추가)
+            if repeat is not None:
+                last = torch.maximum(last, stop_pos)
+                # 반복 루프로 끝난 문장은 판정된 위치까지 (inference도 그 step에서 종료)
+            ys = ys[:, :int(last.max()) + 1]
+
+        if repeat is not None:
+            repeat.record(n_batch, int(looped.sum()), saved_steps)
+            if repeat_flags is not None:
+                repeat_flags.extend(looped.tolist())
+
+        return self._finalize_preds(ys), stats
+
+    def beam_search(self, x, x_mask, max_pred_len, beam_size=4, length_penalty=0.6):
+        # Beam search decoding
+        # # batch 안의 모든 문장의 beam들을 (b * beam_size) 하나의 batch로 묶어서 KV cache incremental decoding
+        # # ==> hypothesis마다 python 루프를 돌지 않고 step마다 decoder 1번 실행
+        # length_penalty: GNMT length normalization의 alpha ((5 + len) / 6) ** alpha
+        # # 0이면 정규화 없이 누적 log 확률만으로 hypothesis 비교
+
+        # x는 embed 되기전 seq token id들을 담은 long tensor
+        # (b, seq_len)
+
+        device = x.device
+
+        n_batch = x.size(0)
+        k = beam_size
+        n_vocab = self.tgt_len_vocab
+
+        src_mask = self.make_pad_mask(x_mask)
+
+        assert src_mask.size(-1) == x.size(-1)
+
+        out_en = self.encode(x, src_mask)
+        # (b, seq_len, q_dim)
+
+        cross_kvs = [
+            (K_.repeat_interleave(k, dim=0), V_.repeat_interleave(k, dim=0))
+            for K_, V_ in self.decoder.precompute_cross_kv(out_en)
+        ]
+        # block별 (K_, V_): (b * k, head_num, seq_len, head_dim)
+        # @@@ encoder-decoder attention의 K, V projection은 문장당 1번만 계산하고 beam 수만큼 복사해서 재사용
+        src_mask = src_mask.repeat_interleave(k, dim=0)
+        # (b * k, 1, 1, seq_len)
+        # @@@ repeat_interleave이므로 문장 i의 beam들은 [i * k, (i + 1) * k) 행에 위치
+
+        caches = self.init_decoder_cache()
+
+        ys = torch.zeros(n_batch * k, 1, device=device).fill_(self.start_idx).type_as(x)
+        # (b * k, 1)
+
+        scores = torch.zeros(n_batch, k, device=device)
+        scores[:, 1:] = float("-inf")
+        # 처음에는 모든 beam이 같은 start 토큰이므로 첫번째 beam만 살려서 중복 hypothesis 방지
+        scores = scores.view(-1)
+        # (b * k) 각 hypothesis의 누적 log 확률
+
+        finished = torch.zeros(n_batch * k, dtype=torch.bool, device=device)
+        # eos 토큰을 생성한 hypothesis
+        lengths = torch.zeros(n_batch * k, dtype=torch.long, device=device)
+        # eos 토큰 포함 생성된 토큰 수 (length penalty 계산용)
+
+        batch_idx = torch.arange(n_batch, device=device)
+        # 아직 decoding 중인 문장들의 원래 batch 번호
+        results = [None] * n_batch
+
+        for i in range(max_pred_len):
+            n_active = batch_idx.size(0)
+
+            tgt_mask = self.make_pad_mask_inference(ys, self.padding_idx)
+            # (n_active * k, 1, 1, seq_len)
+
+            logits = self.decode_step(ys[:, -1:], i, caches, cross_kvs, tgt_mask, src_mask)
+            # (n_active * k, tgt_len_vocab)
+
+            log_probs = F.log_softmax(logits.float(), dim=-1)
+            # (n_active * k, tgt_len_vocab)
+
+            # 이미 eos가 나온 hypothesis는 pad 토큰만 log 확률 0으로 두어서
+            # 점수 변화 없이 beam 안에 후보 1개로 유지
+            log_probs.masked_fill_(finished.unsqueeze(1), float("-inf"))
+            log_probs[:, self.padding_idx].masked_fill_(finished, 0.0)
+
+            candidates = (scores.unsqueeze(1) + log_probs).view(n_active, k * n_vocab)
+            # (n_active, k * tgt_len_vocab) 문장별로 모든 beam의 다음 토큰 후보들을 펼치기
+
+            top_scores, top_idx = candidates.topk(k, dim=-1)
+            # (n_active, k)
+
+            origin = torch.div(top_idx, n_vocab, rounding_mode="floor")
+            # 각 후보가 이어진 beam 번호
+            next_token = top_idx % n_vocab
+
+            origin = (origin + torch.arange(n_active, device=device).unsqueeze(1) * k).view(-1)
+            # (n_active * k) 펼쳐진 batch 안에서의 행 번호
+
+            ys = torch.cat([ys.index_select(0, origin), next_token.view(-1, 1)], dim=1)
+            for cache in caches:
+                cache.reorder(origin)
+
+            finished = finished.index_select(0, origin)
+            lengths = lengths.index_select(0, origin) + (~finished).long()
+            finished = finished | (next_token.view(-1) == self.end_idx)
+            scores = top_scores.view(-1)
+
+            # 문장별 early stopping
+            # # 모든 beam이 끝났거나, 끝난 hypothesis 중 최고 정규화 점수가
+            # # 살아있는 beam의 현재 점수를 지금 길이로 정규화한 값보다 높으면 해당 문장 decoding 종료
+            norm_scores = (scores / self._length_penalty(lengths, length_penalty)).view(n_active, k)
+            fin = finished.view(n_active, k)
+            best_finished = norm_scores.masked_fill(~fin, float("-inf")).max(dim=-1).values
+            best_alive = scores.view(n_active, k).masked_fill(fin, float("-inf")).max(dim=-1).values
+            best_alive = best_alive / self._length_penalty(lengths.new_full((1,), i + 1), length_penalty)
+            done = fin.all(dim=-1) | (best_finished >= best_alive)
+            # (n_active)
+
+            if i == max_pred_len - 1:
+                done[:] = True
+
+            if done.any():
+                best = self._select_best_hypotheses(ys, norm_scores, fin, done)
+                for j, row in zip(batch_idx[done].tolist(), best):
+                    results[j] = row
+
+                keep = (~done).repeat_interleave(k).nonzero().squeeze(1)
+                # 끝난 문장들의 beam 행은 batch에서 제거해서 이후 step 계산량 감소
+                if keep.numel() == 0:
+                    break
+
+                ys = ys.index_select(0, keep)
+                scores = scores.index_select(0, keep)
+                finished = finished.index_select(0, keep)
+                lengths = lengths.index_select(0, keep)
+                src_mask = src_mask.index_select(0, keep)
+                cross_kvs = [(K_.index_select(0, keep), V_.index_select(0, keep)) for K_, V_ in cross_kvs]
+                for cache in caches:
+                    cache.reorder(keep)
+                batch_idx = batch_idx[~done]
+
+        # 문장별로 길이가 다른 결과를 pad로 채워 (b, pred_seq_len)로 합치기
+        pred_len = max(row.size(0) for row in results)
+        preds = torch.full((n_batch, pred_len), self.padding_idx, dtype=x.dtype, device=device)
+        for j, row in enumerate(results):
+            preds[j, :row.size(0)] = row
+
+        # 모든 문장이 eos 없이 최대길이에 도달한 경우 greedy decoding과 동일하게 eos 추가
+        if not (preds == self.end_idx).any():
+            eos = torch.zeros(n_batch, 1, device=device).fill_(self.end_idx).type_as(x)
+            preds = torch.cat([preds, eos], dim=1)
+
+        return preds
+
+    def _length_penalty(self, lengths, alpha):
+        # GNMT length penalty: ((5 + len) / 6) ** alpha
+        return ((5.0 + lengths.clamp(min=1).float()) / 6.0) ** alpha
+
+    def _select_best_hypotheses(self, ys, norm_scores, finished, done):
+        # done인 문장별로 정규화 점수가 가장 높은 hypothesis 선택
+        # # eos로 끝난 hypothesis가 있으면 그 중에서만 선택
+        # ys: (n_active * k, seq_len), norm_scores, finished: (n_active, k), done: (n_active)
+        n_active, k = norm_scores.size()
+
+        has_finished = finished.any(dim=-1, keepdim=True)
+        norm_scores = norm_scores.masked_fill(has_finished & ~finished, float("-inf"))
+
+        best_beam = norm_scores.argmax(dim=-1)
+        rows = best_beam + torch.arange(n_active, device=ys.device) * k
+        rows = rows[done]
+
+        # start 토큰 제외
+        return list(ys.index_select(0, rows)[:, 1:].unbind(0))
+
     def make_pad_mask(self, x_mask):
         # x_mask: (n_batch, key_seq_len)
 
-        mask = x_mask.unsqueeze(1).unsqueeze(2)  # (n_batch, 1, 1, key_seq_len)
+        mask = x_mask.bool().unsqueeze(1).unsqueeze(2)  # (n_batch, 1, 1, key_seq_len)
+        # @@@ attention 호출(block 수 x 2)마다 (mask==1)로 변환하지 않도록 1번만 bool로 변환
 
         # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
         # MHA에서 Q는 (n_batch, n_head, query_seq_len, d_k), K는 (n_batch, n_head, key_seq_len, d_k)인 상태에서
@@ -364,21 +1147,31 @@ class Transformer(nn.Module):
         # @@@ ex: 학습 과정에서 query는 SOS I am a student EOS로 전체 정답 문장이 입력된다
         # @@@ 첫번째 단어 SOS의 attention score 계산 시, SOS는 SOS 자기 자신과만 attention score 계산
         # @@@ 두번째로 I의 attention score 계산 시, I 는 SOS와 I와만 attention score 계산
-        tril = torch.tril(torch.ones(query_seq_len, query_seq_len, device=query.device))
-        # @@@ 텐서 생성 시에 query와 동일한 device에 있도록 반드시 명시
-        mask = tril.bool()
+        # tril = torch.tril(torch.ones(query_seq_len, query_seq_len, device=query.device))
+        # mask = tril.bool()
+        # @@@ 매번 새로 만드는 대신 미리 만들어둔 causal buffer를 잘라서 사용
+        mask = blocks.causal_mask(query_seq_len, query_seq_len, 0, query.device)
         return mask
     
     def make_tgt_mask(self, tgt, tgt_mask):
         pad_mask = self.make_pad_mask(tgt_mask)
         # pad_mask는 (n_batch, 1, 1, tgt_seq_len)꼴
-        seq_mask = self.make_subsequent_mask(tgt) 
-        # seq_mask는 (tgt_seq_len, tgt_seq_len)꼴
 
-        # pad 부분 mask와 subsequent mask &(and) 연산
-        mask = pad_mask & seq_mask
-        # @@@ pad_mask와 seq_mask가 (n_batch, 1, tgt_seq_len, tgt_seq_len) 형태로 broadcasting된 뒤 and 연산이 된다
-        return mask
+        # seq_mask = self.make_subsequent_mask(tgt)
+        # mask = pad_mask & seq_mask
+        # @@@ pad_mask와 seq_mask를 (n_batch, 1, tgt_seq_len, tgt_seq_len)로 broadcasting해서 만드는 대신
+        # @@@ pad_mask와 causal 여부만 전달하고 attention에서 shape에 맞는 방식으로 처리 (blocks.MultiHeadAttention._dispatch_mask)
+        return blocks.CausalMask(pad_mask)
+
+    def make_tgt_mask_cached(self, tgt, n_new):
+        # KV cache 뒤에 n_new개 토큰을 한번에 decoder에 넣을 때의 self-attention mask
+        # tgt: cache에 들어있는 토큰 + 새 토큰 (n_batch, key_seq_len)
+        key_seq_len = tgt.size(1)
+        pad_mask = self.make_pad_mask_inference(tgt, self.padding_idx)
+        # (n_batch, 1, 1, key_seq_len)
+
+        return blocks.CausalMask(pad_mask, offset=key_seq_len - n_new)
+        # 새 토큰은 자기 위치까지의 key만 보도록 masking (attention에서 causal buffer와 합쳐서 (n_batch, 1, n_new, key_seq_len))
 
     # inference에서는 ys 마스크 생성에 필요
     def make_pad_mask_inference(self, key, pad_idx=2):
@@ -402,10 +1195,6 @@ class Transformer(nn.Module):
     def make_tgt_mask_inference(self, tgt, pad_idx):
         pad_mask = self.make_pad_mask_inference(tgt, pad_idx)
         # pad_mask는 (n_batch, 1, 1, tgt_seq_len)꼴
-        seq_mask = self.make_subsequent_mask(tgt) 
-        # seq_mask는 (tgt_seq_len, tgt_seq_len)꼴
 
-        # pad 부분 mask와 subsequent mask &(and) 연산
-        mask = pad_mask & seq_mask
-        # @@@ pad_mask와 seq_mask가 (n_batch, 1, tgt_seq_len, tgt_seq_len) 형태로 broadcasting된 뒤 and 연산이 된다
-        return mask
\ No newline at end of file
+        # pad가 없으면 key padding mask 없이 is_causal로 attention 실행 (make_tgt_mask 참고)
+        return blocks.CausalMask(None if pad_mask.all() else pad_mask)
\ No newline at end of file
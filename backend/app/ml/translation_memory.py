@@ -0,0 +1,96 @@
+# app/ml/translation_memory.py
+# 이전 번역 결과를 source 토큰 id 기준으로 저장하고 비슷한 source 문장의 번역을 찾아주는 번역 메모리
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# UI 문자열, 템플릿 문장처럼 거의 같은 문장이 반복해서 들어오는 경우
+# # 저장된 번역을 Transformer.memory_inference의 draft로 사용하면
+# # 전체 decoder 1번 실행으로 draft를 검증하고 어긋난 위치부터만 일반 decoding
+# ==> 번역 결과는 항상 모델의 greedy decoding 결과이고 메모리는 속도에만 영향
+# 검색: 완전히 같은 source는 dict로 바로 찾고
+# # 아니면 source 토큰을 많이 공유하는 후보들 중 difflib 유사도가 min_similarity 이상인 가장 비슷한 문장 선택
+# # @@@ 모든 문장에 들어가는 eos 등 special 토큰은 inverted index에 넣지 않고
+# #     max_posting개보다 많은 문장에 나오는 흔한 토큰(구두점, 조사 등)은 후보 검색에 사용하지 않는다
+# #     ==> lookup 1번에 lock 안에서 저장된 문장 전체를 훑지 않고 짧은 posting list들만 확인
+# @@@ 추론 executor 스레드 여러 개에서 동시에 접근할 수 있으므로 lock 사용
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import threading
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+
+from typing import Iterable, List, Optional, Tuple
+
+
+class TranslationMemory:
+    def __init__(self, max_entries: int = 10000, min_similarity: float = 0.8, n_candidates: int = 8, ignore_ids: Iterable[int] = (), max_posting: int = 256):
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self.n_candidates = n_candidates
+        # 유사도를 계산할 후보 문장 수 (공유 토큰이 많은 순)
+        self.ignore_ids = frozenset(ignore_ids)
+        # inverted index에서 제외할 토큰 id (pad, eos, unk, 시작 토큰)
+        self.max_posting = max_posting
+        # 후보 검색에 사용할 토큰의 최대 출현 문장 수 (이보다 흔한 토큰은 건너뜀)
+
+        self._entries: "OrderedDict[Tuple[int, ...], List[int]]" = OrderedDict()
+        # source 토큰 id tuple -> 번역 토큰 id 리스트 (eos 포함), 오래 쓰이지 않은 항목부터 삭제 (LRU)
+        self._index = {}
+        # source 토큰 id -> 그 토큰을 포함한 source tuple 집합 (후보 검색용 inverted index)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, src_ids: List[int]) -> Optional[List[int]]:
+        """src_ids와 같거나 비슷한 source 문장의 저장된 번역 토큰 id 리스트 반환 (없으면 None)"""
+        key = tuple(src_ids)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            shared = Counter()
+            for token in set(key) - self.ignore_ids:
+                keys = self._index.get(token, ())
+                if len(keys) <= self.max_posting:
+                    shared.update(keys)
+
+            best, best_score = None, self.min_similarity
+            for candidate, _ in shared.most_common(self.n_candidates):
+                score = SequenceMatcher(None, key, candidate, autojunk=False).ratio()
+                if score >= best_score:
+                    best, best_score = candidate, score
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best]
+
+    def add(self, src_ids: List[int], tgt_ids: List[int]):
+        """source 토큰 id 리스트와 번역 토큰 id 리스트(eos 포함) 저장"""
+        key = tuple(src_ids)
+
+        with self._lock:
+            if key not in self._entries:
+                for token in set(key) - self.ignore_ids:
+                    self._index.setdefault(token, set()).add(key)
+
+            self._entries[key] = list(tgt_ids)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                for token in set(old_key) - self.ignore_ids:
+                    keys = self._index.get(token)
+                    if keys is not None:
+                        keys.discard(old_key)
+                        if not keys:
+                            del self._index[token]
@@ -1,14 +1,23 @@
 # app/models/translator.py
 # 번역에 사용되는 모델을 초기화하고 추론을 진행하는 코드 
 
-import torch
+import asyncio
+import math
+import random
+import time
 
-from transformers import AutoTokenizer
+import torch
 
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 # typing.List와 Tuple은 함수 매개변수/반환값이 리스트나 튜플일 때 내부 요소의 타입까지 명시할 수 있도록 해준다
 
-from app.ml.transformer import Transformer
+from app.ml.mips import MipsIndex
+from app.ml.model_loader import load_model, load_tokenizer
+from app.ml.engine import ContinuousBatchingEngine
+from app.ml.onnx_backend import OnnxGreedyDecoder
+from app.ml.repetition import RepetitionDetector
+from app.ml.shortlist import VocabShortlist
+from app.ml.translation_memory import TranslationMemory
 from app.ml.visualize import visualize
 from app.core.config import settings
 
@@ -18,73 +27,419 @@ class TranslatorService:
         self.model = None
         self.tokenizer = None
         self.device = settings.DEVICE
+        self.engine = None
+        self.memory = None
+        self.onnx = None
+        self.shortlist = None
+        self.mips = None
+        self.remap = None
+        self.shortlist_stats = {"batches": 0, "candidates": 0, "steps": 0, "mismatches": 0}
+        # vocabulary shortlist 누적 통계 (steps / mismatches는 SHORTLIST_CHECK_RATE로 검사한 batch만)
+        self.spec_stats = {"proposed": 0, "accepted": 0, "verify_steps": 0}
+        # speculative decoding 누적 통계 (acceptance rate = accepted / proposed)
+        self.repeat = None
+        if settings.REPEAT_MAX_PERIOD > 0:
+            self.repeat = RepetitionDetector(settings.REPEAT_MAX_PERIOD, min_repeats=settings.REPEAT_MIN_REPEATS, min_span=settings.REPEAT_MIN_SPAN)
+            # greedy decoding 중 n-gram 반복 루프에 빠진 문장을 일찍 종료 (누적 통계는 self.repeat.stats_summary())
         self._load_model()
+
+        if settings.TRANSLATION_MEMORY:
+            self.memory = TranslationMemory(
+                max_entries=settings.TM_MAX_ENTRIES,
+                min_similarity=settings.TM_MIN_SIMILARITY,
+                ignore_ids=[settings.PADDING_IDX, settings.END_IDX, settings.UNK_IDX, settings.START_IDX],
+                max_posting=settings.TM_MAX_POSTING,
+            )
+
+        if settings.CONTINUOUS_BATCHING and not (settings.SPECULATIVE_DECODING or settings.TRANSLATION_MEMORY or self.onnx is not None or self.shortlist is not None or self.mips is not None):
+            self.engine = ContinuousBatchingEngine(self.model, self.device, max_batch_rows=settings.ENGINE_MAX_ROWS, repeat=self.repeat)
+    
+    def start_engine(self):
+        """continuous batching 엔진 스레드 시작 (서버 시작 시 호출)"""
+        if self.engine is not None:
+            self.engine.start()
+
+    def stop_engine(self):
+        """continuous batching 엔진 스레드 종료 (서버 종료 시 호출)"""
+        if self.engine is not None:
+            self.engine.stop()
     
     def _load_model(self):
         """애플리케이션 시작 시 1회 모델 로드"""
         try:
-            self.model = Transformer(
-                src_len_vocab=settings.LEN_VOCAB,
-                tgt_len_vocab=settings.LEN_VOCAB,
-                start_idx=settings.START_IDX,
-                end_idx=settings.END_IDX,
-                padding_idx=settings.PADDING_IDX,
-                unk_idx=settings.UNK_IDX,
-                q_dim=settings.Q_DIM,
-                k_dim=settings.Q_DIM,
-                v_dim=settings.Q_DIM,
-                h_dim=(settings.Q_DIM * 4),
-                visualization=settings.VISUALIZATION,
-                weight_tying=settings.WEIGHT_TYING,
-            )
-            load_dict = None
-            load_dict = torch.load(
-                settings.MODEL_PATH, map_location="cpu"
+            self.model = load_model(
+                self.device, quantization=settings.QUANTIZATION, precision=settings.PRECISION, embed_quantization=settings.EMBED_QUANTIZATION
             )
-            self.model.load_state_dict(load_dict["model_state_dict"])
+            # settings.QUANTIZATION이 "dynamic_int8"이면 nn.Linear들을 dynamic int8로 변환 (CPU 전용)
+            # settings.PRECISION이 "bf16"이면 weight를 bf16으로 로드하고 추론은 autocast 안에서 실행
+            # settings.EMBED_QUANTIZATION이 "int8" / "int4"이면 embedding table을 행별 양자화해서 저장
+
+            if settings.COMPILE_MODEL:
+                self.model.compile_inference(mode=settings.COMPILE_MODE)
+                # encoder와 decoding step을 torch.compile (실제 컴파일은 warmup에서 실행)
+
+            if settings.INFERENCE_BACKEND == "onnx":
+                self.onnx = OnnxGreedyDecoder(
+                    settings.ONNX_ENCODER_PATH,
+                    settings.ONNX_DECODER_PATH,
+                    start_idx=self.model.start_idx,
+                    end_idx=settings.END_IDX,
+                    padding_idx=settings.PADDING_IDX,
+                    n_threads=settings.ONNX_THREADS,
+                )
+                # greedy decoding은 ONNX Runtime으로 실행 (beam search, 시각화는 PyTorch 모델 사용)
+            elif settings.INFERENCE_BACKEND != "torch":
+                raise ValueError(f"Unknown INFERENCE_BACKEND: {settings.INFERENCE_BACKEND} (choose from torch, onnx)")
+
+            self.remap = self.model.vocab_remap
+            # tools/trim_vocab.py로 vocab을 줄인 체크포인트면 tokenizer id <==> 모델 id 변환 (아니면 None)
+
+            if settings.VOCAB_SHORTLIST_PATH:
+                self.shortlist = VocabShortlist.load(
+                    settings.VOCAB_SHORTLIST_PATH,
+                    special_ids=[settings.START_IDX, settings.END_IDX, settings.PADDING_IDX, settings.UNK_IDX],
+                )
+                # greedy decoding의 ffc를 source 토큰별 후보 토큰들에 대해서만 계산 (tools/build_shortlist.py로 생성)
+
+            if settings.MIPS_INDEX:
+                self.mips = MipsIndex.build(
+                    *self.model.ffc_parameters(),
+                    n_clusters=settings.MIPS_CLUSTERS,
+                    n_probe=settings.MIPS_PROBE,
+                    tolerance=settings.MIPS_TOLERANCE,
+                ).to(self.device)
+                # greedy decoding의 다음 토큰을 전체 ffc 대신 ffc 행 clustering index로 검색 (검증 실패 시 전체 ffc)
 
-            self.model.to(self.device)
-            self.model.eval()
-            
             # tokenizer 로드
-            self.tokenizer = AutoTokenizer.from_pretrained(settings.TOKENIZER_NAME)
-            special_tokens_dict = {'bos_token': '<s>'}
-            self.tokenizer.add_special_tokens(special_tokens_dict)
+            self.tokenizer = load_tokenizer()
             
-            print(f"Model loaded on {self.device}")
+            print(f"Model loaded on {self.device} (backend: {settings.INFERENCE_BACKEND}, shortlist: {self.shortlist is not None}, mips: {self.mips is not None}, precision: {settings.PRECISION}, quantization: {settings.QUANTIZATION}, compiled: {self.model.compiled})")
         except Exception as e:
             print(f"Model loading failed: {e}")
             raise
 
     @torch.no_grad()
-    def translate(self, texts: List[str], inference_max_length:int, viz: bool, user_name: str) -> List[str]:
-        """greedy decoding"""
+    def warmup(self):
+        """서버 시작 시 대표 shape bucket들로 추론을 미리 실행해서 첫 요청이 컴파일/초기화 비용을 내지 않도록 함"""
+        if not settings.WARMUP_BATCH_SIZES or not settings.WARMUP_SRC_LENS:
+            return
+
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        # torch.compile은 첫 호출 때 컴파일하므로 warmup 없이 서버를 열면 첫 요청들이 수십 초씩 걸린다
+        # # dynamic shape graph도 batch 크기/길이가 1인 경우는 따로 특수화되므로 batch 1과 2 이상을 모두 실행
+        # # continuous batching 엔진은 bool src mask, 일반 추론은 long src mask를 사용하므로 둘 다 실행
+        # @@@ 컴파일하지 않은 경우에도 메모리 할당, oneDNN 커널 선택 등 첫 실행 비용이 줄어든다
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        t0 = time.perf_counter()
+
+        try:
+            with self.model.autocast():
+                for batch_size in settings.WARMUP_BATCH_SIZES:
+                    for src_len in settings.WARMUP_SRC_LENS:
+                        x, x_mask = self._dummy_batch(batch_size, src_len)
+                        for mask in (x_mask, x_mask.bool()):
+                            self.model.inference(x, mask, settings.WARMUP_DECODE_STEPS, use_cache=True)
+                        if self.shortlist is not None:
+                            self.model.inference(x, x_mask, settings.WARMUP_DECODE_STEPS, use_cache=True, vocab=self._shortlist_candidates(x))
+                            # 후보 토큰 수가 다른 ffc projection graph도 미리 컴파일
+                        if self.mips is not None:
+                            self.model.inference(x, x_mask, settings.WARMUP_DECODE_STEPS, use_cache=True, index=self.mips)
+                        if self.onnx is not None:
+                            self.onnx.inference(x.cpu().numpy(), x_mask.cpu().numpy(), settings.WARMUP_DECODE_STEPS)
+        except Exception as e:
+            if not self.model.compiled:
+                raise
+            # 컴파일 실패 시 (컴파일러 미설치 등) eager 실행으로 서비스
+            print(f"Compiled warmup failed, falling back to eager: {e}")
+            self.model.disable_compiled()
+
+        print(f"Warmup finished in {time.perf_counter() - t0:.1f}s (compiled: {self.model.compiled})")
+
+    def _dummy_batch(self, batch_size: int, src_len: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """warmup용 임의 토큰 batch (앞쪽 절반 row는 절반 길이로 padding)"""
+        x = torch.randint(3, self.model.src_len_vocab - 1, (batch_size, src_len), device=self.device)
+        x[:, -1] = settings.END_IDX
+        x_mask = torch.ones_like(x)
+
+        if batch_size > 1:
+            half = batch_size // 2
+            short = max(1, src_len // 2)
+            x[:half, short:] = settings.PADDING_IDX
+            x[:half, short - 1] = settings.END_IDX
+            x_mask[:half, short:] = 0
+
+        return x, x_mask
+
+    @torch.no_grad()
+    def translate(self, texts: List[str], inference_max_length:int, viz: bool, user_name: str, use_cache: Optional[bool] = None, beam_size: Optional[int] = None, repeat_flags: Optional[List[bool]] = None) -> List[str]:
+        """greedy decoding (beam_size > 1이면 beam search)"""
+
+        # repeat_flags: list가 주어지면 문장별 반복 루프 판정 여부를 texts 순서대로 추가
+        # # 반복 검출은 Transformer.inference greedy decoding 경로(shortlist, mips, 번역 메모리, speculative decoding 포함)에만 적용
+
+        # use_cache가 None이면 설정값(settings.USE_KV_CACHE) 사용
+        if use_cache is None:
+            use_cache = settings.USE_KV_CACHE
 
         # 전처리
         encoded = self.tokenizer(
             texts,
-            return_tensors="pt",
-            padding=True, # 복수 문장 중 가장 길게 encoding되는 문장 기준으로 나머지 패딩
             truncation=True,
             max_length=512,
         )
+        # @@@ padding은 bucket별로 따로 하기 위해 여기서는 문장별 토큰 id 리스트로만 인코딩
+
+        if self.remap is not None:
+            encoded['input_ids'] = [self.remap.src_to_model(ids) for ids in encoded['input_ids']]
+            # tokenizer id ==> trim된 모델 id (번역 메모리도 모델 id 기준으로 저장/검색)
 
-        x = encoded['input_ids'].to(self.device)
-        # (batch_size, src_seq_len)
-        x_mask = encoded['attention_mask'].to(self.device)
-        # (batch_size, src_seq_len)
-        
+        lengths = [len(ids) for ids in encoded['input_ids']]
 
-        # 모델 추론
-        preds = self.model.inference(x, x_mask, inference_max_length, viz)
-        # (batch_size, pred_seq_len)
-        # @@@ 최대 추론 길이 단순히 settings.MAX_LENGTH를 대신 사용?
+        # 번역 메모리는 greedy decoding에만 사용 (beam search, 시각화 제외)
+        use_memory = self.memory is not None and not viz and (beam_size is None or beam_size == 1)
+        drafts = [self.memory.lookup(ids) for ids in encoded['input_ids']] if use_memory else None
 
         if viz:
-            # visualize(settings.HTML_PATH, folder_name=user_name, model=self.model, tokenizer=self.tokenizer, inputs=x, preds=preds, n_examples=4)
-            visualize(settings.HTML_PATH, folder_name=user_name, model=self.model, tokenizer=self.tokenizer, inputs=x, preds=preds, n_examples=x.size(0))
-            # @@@ 임시로 전체 문장 시각화
-        
+            # 시각화는 전체 문장을 한 batch로 추론한 attention 값을 사용하므로 bucketing 하지 않음
+            buckets = [list(range(len(texts)))]
+        elif drafts is not None:
+            # 번역 메모리 draft가 있는 문장과 없는 문장은 따로 bucketing
+            # @@@ draft 검증은 batch 안에서 가장 적게 일치한 문장 기준으로 진행되므로 draft 없는 문장과 섞이면 효과가 없다
+            hit = [i for i, d in enumerate(drafts) if d is not None]
+            miss = [i for i, d in enumerate(drafts) if d is None]
+            buckets = self._make_sub_buckets(hit, lengths) + self._make_sub_buckets(miss, lengths)
+        else:
+            buckets = self._make_buckets(lengths, settings.MAX_TOKENS_PER_BATCH)
+
+        decoded_preds = [""] * len(texts)
+        repeated = [False] * len(texts)
+
+        for bucket in buckets:
+            padded = self.tokenizer.pad(
+                {
+                    'input_ids': [encoded['input_ids'][i] for i in bucket],
+                    'attention_mask': [encoded['attention_mask'][i] for i in bucket],
+                },
+                padding=True, # bucket 안에서 가장 긴 문장 기준으로 나머지 패딩
+                return_tensors="pt",
+            )
+
+            x = padded['input_ids'].to(self.device)
+            # (bucket_size, src_seq_len)
+            x_mask = padded['attention_mask'].to(self.device)
+            # (bucket_size, src_seq_len)
+
+            max_length = self._decode_budget(max(lengths[i] for i in bucket), inference_max_length)
+            # bucket에서 가장 긴 문장의 source 길이로 정한 최대 생성 길이
+            # # greedy decoding(inference, 번역 메모리, ONNX, speculative decoding)은 여기에 더해 문장별 길이 제한도 적용 (_budget_kwargs)
+            # # beam search는 bucket 단위 상한만 적용
+
+            bucket_flags = []
+            # 이번 bucket의 문장별 반복 루프 판정 여부 (반복 검출을 하지 않은 경로면 빈 리스트)
+
+            # 모델 추론
+            # @@@ PRECISION이 bf16이면 autocast 안에서 bf16으로 계산 (fp32면 아무 효과 없음)
+            with self.model.autocast():
+                if beam_size is not None and beam_size > 1 and not viz:
+                    preds = self.model.beam_search(x, x_mask, max_length, beam_size=beam_size, length_penalty=settings.LENGTH_PENALTY)
+                elif drafts is not None and drafts[bucket[0]] is not None:
+                    preds = self.model.inference(x, x_mask, max_length, use_cache=use_cache, drafts=[drafts[i] for i in bucket], **self._budget_kwargs(), **self._repeat_kwargs(bucket_flags))
+                    # 저장된 번역을 draft로 한번에 검증 (결과는 greedy decoding과 동일)
+                elif self.onnx is not None and not viz:
+                    budget_kwargs = self._budget_kwargs()
+                    budgets = self.model.decode_budgets(x_mask, max_length, **budget_kwargs).cpu().numpy() if budget_kwargs else None
+                    # Transformer.inference와 같은 문장별 최대 생성 길이
+                    preds = torch.from_numpy(self.onnx.inference(x.cpu().numpy(), x_mask.cpu().numpy(), max_length, budgets=budgets))
+                    # ONNX Runtime(CPU)으로 greedy decoding
+                elif settings.SPECULATIVE_DECODING and not viz:
+                    preds, stats = self.model.speculative_inference(
+                        x, x_mask, max_length, draft_blocks=settings.SPEC_DRAFT_BLOCKS, n_draft=settings.SPEC_NUM_DRAFT,
+                        **self._budget_kwargs(), **self._repeat_kwargs(bucket_flags),
+                    )
+                    self._update_spec_stats(stats)
+                elif self.shortlist is not None and not viz:
+                    preds = self._shortlist_inference(x, x_mask, max_length, use_cache, bucket_flags)
+                    # ffc와 argmax를 source 토큰들의 후보 토큰에 대해서만 계산
+                elif self.mips is not None and not viz:
+                    preds = self.model.inference(x, x_mask, max_length, use_cache=use_cache, index=self.mips, **self._budget_kwargs(), **self._repeat_kwargs(bucket_flags))
+                    # 검색한 cluster의 ffc 행들만 계산하고 상한 검증 (통계는 self.mips.stats_summary())
+                else:
+                    preds = self.model.inference(x, x_mask, max_length, viz, use_cache=use_cache, **self._budget_kwargs(), **self._repeat_kwargs(bucket_flags))
+            # (bucket_size, pred_seq_len)
+            # @@@ 시각화는 greedy decoding의 attention 값만 지원하므로 viz=True이면 beam_size 무시
+            # @@@ 최대 추론 길이 단순히 settings.MAX_LENGTH를 대신 사용?
+            # @@@ viz=True이면 use_cache와 관계없이 전체 ys를 다시 계산하는 방식으로 추론 (attention 시각화용)
+
+            if use_memory:
+                self._remember([encoded['input_ids'][i] for i in bucket], preds)
+
+            if self.remap is not None:
+                x, preds = self.remap.src_to_vocab(x), self.remap.tgt_to_vocab(preds)
+                # 시각화 / decode는 tokenizer id 기준
+
+            if viz:
+                # visualize(settings.HTML_PATH, folder_name=user_name, model=self.model, tokenizer=self.tokenizer, inputs=x, preds=preds, n_examples=4)
+                visualize(settings.HTML_PATH, folder_name=user_name, model=self.model, tokenizer=self.tokenizer, inputs=x, preds=preds, n_examples=x.size(0))
+                # @@@ 임시로 전체 문장 시각화
+
+            # 후처리
+            # bucket 결과를 원래 문장 순서 위치에 저장
+            for i, pred in zip(bucket, self.tokenizer.batch_decode(preds, skip_special_tokens=True)):
+                decoded_preds[i] = pred.strip()
+            for i, flag in zip(bucket, bucket_flags):
+                repeated[i] = flag
+            self._report_repeats(bucket_flags)
+
+        if repeat_flags is not None:
+            repeat_flags.extend(repeated)
+
+        return decoded_preds
+
+    def _decode_budget(self, src_len: int, max_length: int) -> int:
+        """source 토큰 수로 정한 최대 생성 길이 (eos 제외 토큰 수, DECODE_LEN_RATIO가 0 이하면 max_length 그대로)"""
+        if settings.DECODE_LEN_RATIO <= 0:
+            return max_length
+        return max(1, min(max_length, math.ceil(src_len * settings.DECODE_LEN_RATIO) + settings.DECODE_LEN_OFFSET))
+
+    def _budget_kwargs(self) -> dict:
+        """Transformer.inference에 문장별 최대 생성 길이를 적용하는 인자"""
+        if settings.DECODE_LEN_RATIO <= 0:
+            return {}
+        return {"len_ratio": settings.DECODE_LEN_RATIO, "len_offset": settings.DECODE_LEN_OFFSET}
+
+    def _repeat_kwargs(self, repeat_flags: List[bool]) -> dict:
+        """Transformer.inference에 n-gram 반복 루프 검출을 적용하는 인자 (REPEAT_MAX_PERIOD가 0이면 적용 안함)"""
+        if self.repeat is None:
+            return {}
+        return {"repeat": self.repeat, "repeat_flags": repeat_flags}
+
+    def _report_repeats(self, flags: List[bool]):
+        """반복 루프로 종료된 문장이 있으면 누적 통계와 함께 출력"""
+        if not any(flags):
+            return
+        summary = self.repeat.stats_summary()
+        print(
+            f"repetition loop: {sum(flags)} / {len(flags)} sentences stopped early "
+            f"(total {summary['detected']} / {summary['rows']}, saved steps {summary['saved_steps']})"
+        )
+
+    def _make_sub_buckets(self, indices: List[int], lengths: List[int]) -> List[List[int]]:
+        """indices에 해당하는 문장들만 _make_buckets로 나눈 원래 index 리스트들 반환"""
+        buckets = self._make_buckets([lengths[i] for i in indices], settings.MAX_TOKENS_PER_BATCH)
+        return [[indices[j] for j in bucket] for bucket in buckets]
+
+    def _remember(self, src_ids: List[List[int]], preds: torch.Tensor):
+        """greedy decoding 결과를 번역 메모리에 저장 (eos까지 생성된 문장만)"""
+        for ids, pred in zip(src_ids, preds.tolist()):
+            if self.model.end_idx in pred:
+                self.memory.add(ids, pred[:pred.index(self.model.end_idx) + 1])
+
+    def _shortlist_inference(self, x: torch.Tensor, x_mask: torch.Tensor, inference_max_length: int, use_cache: bool, repeat_flags: List[bool]) -> torch.Tensor:
+        """vocabulary shortlist greedy decoding (SHORTLIST_CHECK_RATE 비율의 batch는 전체 vocab argmax와 불일치 비율 측정)"""
+        vocab = self._shortlist_candidates(x)
+        check = random.random() < settings.SHORTLIST_CHECK_RATE
+        stats = {"steps": 0, "mismatches": 0} if check else None
+
+        preds = self.model.inference(x, x_mask, inference_max_length, use_cache=use_cache, vocab=vocab, vocab_stats=stats, **self._budget_kwargs(), **self._repeat_kwargs(repeat_flags))
+
+        self.shortlist_stats["batches"] += 1
+        self.shortlist_stats["candidates"] += vocab.numel()
+        if stats is not None:
+            for key, value in stats.items():
+                self.shortlist_stats[key] += value
+            print(
+                f"vocab shortlist: {vocab.numel()} candidates, mismatch rate {self._mismatch_rate(stats):.4f} "
+                f"(total {self._mismatch_rate(self.shortlist_stats):.4f})"
+            )
+
+        return preds
+
+    def _shortlist_candidates(self, x: torch.Tensor) -> torch.Tensor:
+        """batch x (모델 id)의 shortlist 후보 target 모델 id (shortlist 파일은 tokenizer id 기준)"""
+        if self.remap is None:
+            return self.shortlist.candidates(x)
+        return self.remap.tgt_to_model(self.shortlist.candidates(self.remap.src_to_vocab(x)))
+
+    def shortlist_stats_summary(self) -> dict:
+        """누적 vocabulary shortlist 통계 (평균 후보 수, 검사한 step 중 전체 vocab argmax와 다른 비율)"""
+        batches = self.shortlist_stats["batches"]
+        return {
+            **self.shortlist_stats,
+            "mean_candidates": self.shortlist_stats["candidates"] / batches if batches > 0 else 0.0,
+            "mismatch_rate": self._mismatch_rate(self.shortlist_stats),
+        }
+
+    @staticmethod
+    def _mismatch_rate(stats: dict) -> float:
+        return stats["mismatches"] / stats["steps"] if stats["steps"] > 0 else 0.0
+
+    def _update_spec_stats(self, stats: dict):
+        """speculative decoding 통계 누적 후 이번 batch와 누적 acceptance rate 출력"""
+        for key, value in stats.items():
+            self.spec_stats[key] += value
+
+        print(
+            f"speculative decoding: acceptance rate {self._acceptance_rate(stats):.3f} "
+            f"(total {self.spec_stats_summary()['acceptance_rate']:.3f}), "
+            f"verify steps {stats['verify_steps']}"
+        )
+
+    def spec_stats_summary(self) -> dict:
+        """누적 speculative decoding 통계와 acceptance rate"""
+        return {**self.spec_stats, "acceptance_rate": self._acceptance_rate(self.spec_stats)}
+
+    @staticmethod
+    def _acceptance_rate(stats: dict) -> float:
+        return stats["accepted"] / stats["proposed"] if stats["proposed"] > 0 else 0.0
+
+    def _make_buckets(self, lengths: List[int], max_tokens: int) -> List[List[int]]:
+        """문장들을 토큰 길이순으로 정렬한 뒤 (문장 수 x 최대 길이)가 max_tokens를 넘지 않도록 나눈 index 리스트들 반환"""
+
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        # 길이가 크게 다른 문장들을 한 batch로 padding하면 짧은 문장들도 가장 긴 문장 길이만큼
+        # encoder와 encoder-decoder attention 계산을 해야 한다
+        # ==> 길이순으로 정렬해서 비슷한 길이끼리 묶으면 padding 낭비가 줄어든다
+        # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+        buckets = []
+        bucket = []
+        for i in order:
+            # 오름차순 정렬이므로 새로 넣는 문장 길이가 bucket의 padding 길이가 된다
+            if bucket and (len(bucket) + 1) * lengths[i] > max_tokens:
+                buckets.append(bucket)
+                bucket = []
+            bucket.append(i)
+
+        if bucket:
+            buckets.append(bucket)
+
+        return buckets
+
+    async def translate_continuous(self, texts: List[str], inference_max_length: int, repeat_flags: Optional[List[bool]] = None) -> List[str]:
+        """continuous batching 엔진을 통한 greedy decoding (repeat_flags는 translate와 동일)"""
+
+        # 전처리
+        # @@@ 엔진이 문장별로 batch에 합류시키므로 padding 없이 문장별 토큰 id 리스트로 인코딩
+        encoded = self.tokenizer(
+            texts,
+            truncation=True,
+            max_length=512,
+        )
+        if self.remap is not None:
+            encoded['input_ids'] = [self.remap.src_to_model(ids) for ids in encoded['input_ids']]
+
+        futures = [self.engine.submit(ids, self._decode_budget(len(ids), inference_max_length)) for ids in encoded['input_ids']]
+        # 엔진은 문장별 최대 생성 길이를 따로 관리하므로 source 길이로 정한 문장별 제한을 그대로 전달
+        # 엔진 스레드의 concurrent.futures.Future를 asyncio Future로 감싸서 event loop를 막지 않고 대기
+        results = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+        preds = [tokens for tokens, _ in results]
+        if self.remap is not None:
+            preds = [self.remap.tgt_to_vocab(torch.tensor(tokens)).tolist() for tokens in preds]
+
+        self._report_repeats([flag for _, flag in results])
+        if repeat_flags is not None:
+            repeat_flags.extend(flag for _, flag in results)
 
         # 후처리
         decoded_preds = self.tokenizer.batch_decode(preds, skip_special_tokens=True)
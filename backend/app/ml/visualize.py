@@ -133,17 +133,11 @@ def visualize_layer(model, layer, getter_fn, j, ntokens, row_tokens, col_tokens)
         )
         for h in range(n_heads)
     ]
-    assert n_heads == 8
+    # @@@ head pruning된 모델은 layer마다 head 수가 다를 수 있으므로 8개 고정 대신 짝수 번째 head들만 표시
 
     combined_chart = alt.vconcat(
-        charts[0]
-        # | charts[1]
-        | charts[2]
-        # | charts[3]
-        | charts[4]
-        # | charts[5]
-        | charts[6]
-        # | charts[7]
+        alt.hconcat(*charts[::2])
+        # charts[0] | charts[2] | charts[4] | charts[6] (head 8개일 때)
         # layer + 1 due to 0-indexing
     ).properties(title="Layer %d" % (layer + 1))
 
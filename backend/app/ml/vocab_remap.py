@@ -0,0 +1,66 @@
+# app/ml/vocab_remap.py
+# vocabulary를 줄인(trim) 체크포인트의 모델 토큰 id <==> tokenizer 토큰 id 변환
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# ke-t5 tokenizer vocab(64101개) 중 한국어 source / 영어 target 코퍼스에 실제로 나오는 토큰은 일부
+# # tools/trim_vocab.py가 코퍼스에 나온 토큰만 남긴 src_embed / tgt_embed / ffc 행으로 체크포인트를 다시 저장
+# # 체크포인트에는 남긴 tokenizer 토큰 id 목록(src_ids, tgt_ids, 오름차순)도 같이 저장
+# # ==> 모델 토큰 id k는 tokenizer 토큰 id src_ids[k] (source) / tgt_ids[k] (target)
+# 추론 시 tokenizer 출력 source id를 모델 id로 바꿔서 넣고 (목록에 없는 토큰은 unk)
+# # 모델이 생성한 target id는 tokenizer id로 바꿔서 decode
+# @@@ 0 ~ 2번 special 토큰(pad, eos, unk)은 항상 남기고 오름차순이므로 모델 id도 그대로
+#     시작 토큰(<s>, 64100)만 target 목록의 마지막 id로 바뀐다 (model_loader가 Transformer.start_idx 설정)
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import torch
+
+from typing import List
+
+
+class VocabRemap:
+    def __init__(self, src_ids: torch.Tensor, tgt_ids: torch.Tensor, len_vocab: int, special_ids: List[int], unk_idx: int):
+        # src_ids: (src 모델 vocab,) / tgt_ids: (tgt 모델 vocab,) 모델 id 순서의 tokenizer 토큰 id (오름차순)
+        # len_vocab: tokenizer vocab 크기, special_ids: 모델 id와 tokenizer id가 같아야 하는 special 토큰 (pad, eos, unk)
+        self.src_ids = src_ids.long()
+        self.tgt_ids = tgt_ids.long()
+
+        self.src_map = torch.full((len_vocab,), unk_idx, dtype=torch.long)
+        self.src_map[self.src_ids] = torch.arange(self.src_ids.numel())
+        # (len_vocab,) tokenizer id ==> source 모델 id (목록에 없는 토큰은 unk)
+        self.tgt_map = torch.full((len_vocab,), -1, dtype=torch.long)
+        self.tgt_map[self.tgt_ids] = torch.arange(self.tgt_ids.numel())
+        # (len_vocab,) tokenizer id ==> target 모델 id (목록에 없는 토큰은 -1)
+
+        for idx in special_ids:
+            if int(self.src_map[idx]) != idx or int(self.tgt_map[idx]) != idx:
+                raise ValueError(f"special token {idx} must keep its id in a trimmed vocabulary")
+
+        self._src_lookup = self.src_map.tolist()
+        # source 토큰 id 리스트 변환용 (tokenizer 출력은 python 리스트)
+
+    @classmethod
+    def from_checkpoint(cls, data: dict, len_vocab: int, special_ids: List[int], unk_idx: int) -> "VocabRemap":
+        """체크포인트의 "vocab_remap" 항목 ({"src_ids", "tgt_ids"})으로 생성"""
+        return cls(data["src_ids"], data["tgt_ids"], len_vocab, special_ids, unk_idx)
+
+    def to(self, device) -> "VocabRemap":
+        for name in ("src_ids", "tgt_ids", "src_map", "tgt_map"):
+            setattr(self, name, getattr(self, name).to(device))
+        return self
+
+    def src_to_model(self, ids: List[int]) -> List[int]:
+        """tokenizer source 토큰 id 리스트 ==> 모델 id 리스트"""
+        return [self._src_lookup[i] for i in ids]
+
+    def src_to_vocab(self, x: torch.Tensor) -> torch.Tensor:
+        """모델 source id tensor ==> tokenizer 토큰 id tensor"""
+        return self.src_ids.to(x.device)[x]
+
+    def tgt_to_vocab(self, ys: torch.Tensor) -> torch.Tensor:
+        """모델이 생성한 target id tensor ==> tokenizer 토큰 id tensor"""
+        return self.tgt_ids.to(ys.device)[ys]
+
+    def tgt_to_model(self, ids: torch.Tensor) -> torch.Tensor:
+        """tokenizer target 토큰 id tensor ==> 모델 id tensor (trim된 토큰은 제외)"""
+        model_ids = self.tgt_map.to(ids.device)[ids]
+        return model_ids[model_ids >= 0]
@@ -39,12 +39,17 @@ class TranslationRequest(BaseModel):
     # viz: Optional[bool] = False
     viz: bool = Field(False)
 
+    # beam search beam 개수 (None 또는 1이면 greedy decoding)
+    beam_size: Optional[int] = Field(None, ge=1, le=16)
+
 # 단일 문장 번역 응답
 class TranslationResponse(BaseModel):
     original: str
     translation: str
     status: str = "success"
     viz_url: str = None
+    # 반복 루프로 판정되어 일찍 종료된 번역인지 여부 (settings.REPEAT_FLAG_IN_RESPONSE가 true일 때만 포함)
+    repetition_detected: Optional[bool] = None
 
 # 복수 문장 번역 요청
 class BatchTranslationRequest(BaseModel):
@@ -55,12 +60,15 @@ class BatchTranslationRequest(BaseModel):
 
     viz: bool = Field(False)
 
+    beam_size: Optional[int] = Field(None, ge=1, le=16)
+
 # 복수 문장 번역 응답
 class BatchTranslationResponse(BaseModel):
     original: List[str]
     translation: List[str]
     status: str = "success"
     viz_url: str = None
+    repetition_detected: Optional[List[bool]] = None
 
 class HealthResponse(BaseModel):
     status: str = "healthy"
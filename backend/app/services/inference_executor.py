@@ -0,0 +1,61 @@
+# app/services/inference_executor.py
+# 동기 모델 추론을 asyncio event loop 밖의 전용 스레드 풀에서 실행하고 동시 실행/대기 수를 제한
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# async def 라우터 안에서 CPU를 오래 쓰는 translator.translate를 직접 호출하면
+# # 추론이 끝날 때까지 event loop 전체가 멈춰서 /health, /auth/login 등 다른 요청도 응답하지 못한다
+# ==> 추론은 INFERENCE_WORKERS개 스레드를 가진 전용 executor에서 실행하고
+# ==> 실행 중 + 대기 중인 작업이 INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE개를 넘으면
+#     대기열에 쌓지 않고 바로 InferenceOverloadedError를 발생시켜 503 + Retry-After 응답 (backpressure)
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+
+
+class InferenceOverloadedError(Exception):
+    """추론 대기열이 가득 차서 요청을 받을 수 없을 때 발생"""
+    def __init__(self, retry_after: int):
+        super().__init__("Translation server is busy, please retry later")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int, max_queue: int, retry_after: int):
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        # 실행 중(max_workers) + 대기 중(max_queue) 작업 최대 개수
+        self.retry_after = retry_after
+        self._pending = 0
+        # @@@ event loop 스레드에서만 증감하므로 lock 불필요
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+    def check_capacity(self):
+        """대기열이 가득 찼으면 InferenceOverloadedError 발생"""
+        if self._pending >= self.max_pending:
+            raise InferenceOverloadedError(self.retry_after)
+
+    async def run(self, fn, *args, **kwargs):
+        """동기 함수 fn을 전용 스레드 풀에서 실행하고 결과를 기다린다"""
+        self.check_capacity()
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 전역 싱글톤
+inference_executor = InferenceExecutor(
+    max_workers=settings.INFERENCE_WORKERS,
+    max_queue=settings.INFERENCE_QUEUE_SIZE,
+    retry_after=settings.RETRY_AFTER_SECONDS,
+)
@@ -0,0 +1,165 @@
+# app/services/micro_batcher.py
+# 동시에 들어온 단일 문장 번역 요청들을 모아서 한 번의 batch 추론으로 처리
+
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# /translate 요청마다 translator.translate([text], ...)를 batch 크기 1로 실행하는 대신
+# # asyncio 대기열에 요청을 넣고, 최대 batch 크기(settings.BATCH_SIZE)가 모이거나
+# # 첫 요청 이후 최대 대기 시간(settings.BATCH_MAX_WAIT_MS)이 지나면 padding된 batch 1번으로 번역 후
+# # 각 요청자에게 결과를 나눠준다
+# @@@ max_length, beam_size가 다른 요청은 같은 batch로 묶지 않는다 (추론 설정이 요청 결과에 영향)
+# @@@ batch 추론은 별도 task로 실행하고 바로 다음 batch를 모은다
+#     동시에 실행되는 batch 수는 inference_executor의 스레드 수(INFERENCE_WORKERS)로 제한
+# @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+import asyncio
+
+from typing import List, Optional
+
+from app.ml.translator import translator
+from app.services.inference_executor import inference_executor, InferenceOverloadedError
+from app.core.config import settings
+
+
+class _PendingRequest:
+    def __init__(self, text: str, max_length: int, beam_size: Optional[int], future: asyncio.Future):
+        self.text = text
+        self.max_length = max_length
+        self.beam_size = beam_size
+        self.future = future
+
+
+class MicroBatcher:
+    def __init__(self, max_batch_size: int, max_wait_ms: float, max_queue: int):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        # 대기열에 쌓일 수 있는 최대 요청 수 (넘으면 InferenceOverloadedError)
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        # 동시에 실행 중인 batch 수 제한 (inference_executor 스레드 수)
+        self._tasks = set()
+        # 실행 중인 batch task (참조를 유지하지 않으면 실행 중에 garbage collection될 수 있다)
+
+    @property
+    def enabled(self) -> bool:
+        # BATCH_SIZE가 2 이상이고 batch 처리 task가 실행 중일 때만 사용
+        return self.max_batch_size > 1 and self._worker is not None
+
+    async def start(self):
+        """event loop 안에서 대기열과 batch 처리 task 생성 (서버 시작 시 호출)"""
+        if self.max_batch_size <= 1 or self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(inference_executor.max_workers)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """batch 처리 task 종료 후 남은 요청 정리 (서버 종료 시 호출)"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        while not self._queue.empty():
+            r = self._queue.get_nowait()
+            if not r.future.done():
+                r.future.set_exception(RuntimeError("Micro batcher stopped"))
+
+    async def translate(self, text: str, max_length: int, beam_size: Optional[int] = None, repeat_flags: Optional[List[bool]] = None) -> str:
+        """대기열에 문장을 넣고 batch 번역 결과를 기다린다 (repeat_flags가 주어지면 반복 루프 판정 여부 추가)"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_PendingRequest(text, max_length, beam_size, future))
+        except asyncio.QueueFull:
+            raise InferenceOverloadedError(inference_executor.retry_after)
+
+        translation, repeated = await future
+        if repeat_flags is not None:
+            repeat_flags.append(repeated)
+        return translation
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            # 최대 batch 크기가 되거나 대기 시간이 끝날 때까지 요청 모으기
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # 추론 설정이 같은 요청끼리 묶어서 실행
+            groups = {}
+            for r in batch:
+                groups.setdefault((r.max_length, r.beam_size), []).append(r)
+
+            for (max_length, beam_size), requests in groups.items():
+                await self._slots.acquire()
+                # 모든 추론 스레드가 사용 중이면 하나가 끝날 때까지 대기 (그동안 새 요청은 대기열에 쌓인다)
+                task = asyncio.create_task(self._run_group(requests, max_length, beam_size))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                # @@@ 추론이 끝나기를 기다리지 않고 다음 batch를 모은다
+
+    async def _run_group(self, requests: List[_PendingRequest], max_length: int, beam_size: Optional[int]):
+        try:
+            await self._translate_group(requests, max_length, beam_size)
+        except asyncio.CancelledError:
+            for r in requests:
+                if not r.future.done():
+                    r.future.set_exception(RuntimeError("Micro batcher stopped"))
+            raise
+        finally:
+            self._slots.release()
+
+    async def _translate_group(self, requests: List[_PendingRequest], max_length: int, beam_size: Optional[int]):
+        # 연결이 끊겨 취소된 요청은 제외
+        requests = [r for r in requests if not r.future.done()]
+        if not requests:
+            return
+
+        flags = []
+        try:
+            results = await inference_executor.run(
+                translator.translate,
+                [r.text for r in requests],
+                max_length,
+                viz=False,
+                user_name="micro_batch",
+                beam_size=beam_size,
+                repeat_flags=flags,
+            )
+            # @@@ 동기 함수인 translator.translate를 전용 executor 스레드에서 실행해 event loop가 멈추지 않도록 함
+        except Exception as e:
+            for r in requests:
+                if not r.future.done():
+                    r.future.set_exception(e)
+            return
+
+        for r, result, repeated in zip(requests, results, flags):
+            if not r.future.done():
+                r.future.set_result((result, repeated))
+
+
+# 전역 싱글톤
+micro_batcher = MicroBatcher(
+    max_batch_size=settings.BATCH_SIZE,
+    max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+    max_queue=settings.BATCH_SIZE * settings.INFERENCE_QUEUE_SIZE,
+)
@@ -13,38 +13,79 @@
 
 
 from app.ml.translator import translator
+from app.services.micro_batcher import micro_batcher
+from app.services.inference_executor import inference_executor, InferenceOverloadedError
 from app.schemas.translation import TranslationRequest, TranslationResponse, BatchTranslationRequest, BatchTranslationResponse
+from app.core.config import settings
 from typing import Optional
 
+def _use_engine(viz: bool, beam_size: Optional[int]) -> bool:
+    # 시각화와 beam search는 continuous batching 엔진(greedy 전용)을 사용하지 않는다
+    return translator.engine is not None and not viz and (beam_size is None or beam_size == 1)
+
+def _check_engine_capacity(n_texts: int):
+    # 엔진 대기열에 쌓인 문장이 너무 많으면 backpressure
+    if translator.engine.queued() + n_texts > settings.ENGINE_MAX_QUEUE:
+        raise InferenceOverloadedError(inference_executor.retry_after)
+
 class TranslationService:
     # 단일 문장 번역  
     @staticmethod
-    def translate_ko_to_en(request: TranslationRequest, user_name="test") -> TranslationResponse:
+    async def translate_ko_to_en(request: TranslationRequest, user_name="test") -> TranslationResponse:
         try:
             if not request.text.strip():
                 raise ValueError("Text cannot be empty")
+
+            flags = [] if settings.REPEAT_FLAG_IN_RESPONSE else None
+            # 반복 루프 판정 여부를 받을 리스트 (응답에 포함하지 않으면 None)
             
-            result = translator.translate([request.text], request.max_length, viz=request.viz, user_name=user_name)
+            if _use_engine(request.viz, request.beam_size):
+                _check_engine_capacity(1)
+                result = await translator.translate_continuous([request.text], request.max_length, repeat_flags=flags)
+            elif micro_batcher.enabled and not request.viz:
+                # 동시에 들어온 단일 문장 요청들과 묶어서 batch 번역
+                result = [await micro_batcher.translate(request.text, request.max_length, request.beam_size, repeat_flags=flags)]
+            else:
+                # 동기 추론은 전용 executor 스레드에서 실행 (event loop 블로킹 방지)
+                result = await inference_executor.run(
+                    translator.translate, [request.text], request.max_length, viz=request.viz, user_name=user_name, beam_size=request.beam_size, repeat_flags=flags
+                )
+
+            repetition_detected = flags[0] if flags else None
 
             if request.viz:
-                return TranslationResponse(original=request.text, translation=result[0] if len(result) != 0 else "", viz_url=f"/api/v1/viz/{user_name}")
+                return TranslationResponse(original=request.text, translation=result[0] if len(result) != 0 else "", viz_url=f"/api/v1/viz/{user_name}", repetition_detected=repetition_detected)
 
-            return TranslationResponse(original=request.text, translation=result[0] if len(result) != 0 else "")
+            return TranslationResponse(original=request.text, translation=result[0] if len(result) != 0 else "", repetition_detected=repetition_detected)
+        except InferenceOverloadedError:
+            raise
+            # @@@ 과부하 에러는 ValueError(400)로 감싸지 않고 그대로 올려서 라우터에서 503 처리
         except Exception as e:
             raise ValueError(f"Translation failed: {str(e)}")
 
     # 복수 문장 번역 
     @staticmethod
-    def batch_translate_ko_to_en(request: BatchTranslationRequest, user_name="test") -> BatchTranslationResponse:
+    async def batch_translate_ko_to_en(request: BatchTranslationRequest, user_name="test") -> BatchTranslationResponse:
         try:
             # if not request.texts.strip():
             #     raise ValueError("Text cannot be empty")
+
+            flags = [] if settings.REPEAT_FLAG_IN_RESPONSE else None
             
-            results = translator.translate(request.texts, request.max_length, viz=request.viz, user_name=user_name)
+            if _use_engine(request.viz, request.beam_size):
+                _check_engine_capacity(len(request.texts))
+                results = await translator.translate_continuous(request.texts, request.max_length, repeat_flags=flags)
+            else:
+                # 동기 추론은 전용 executor 스레드에서 실행 (event loop 블로킹 방지)
+                results = await inference_executor.run(
+                    translator.translate, request.texts, request.max_length, viz=request.viz, user_name=user_name, beam_size=request.beam_size, repeat_flags=flags
+                )
 
             if request.viz:
-                return BatchTranslationResponse(original=request.texts, translation=results, viz_url=f"/api/v1/viz/{user_name}")
+                return BatchTranslationResponse(original=request.texts, translation=results, viz_url=f"/api/v1/viz/{user_name}", repetition_detected=flags)
 
-            return BatchTranslationResponse(original=request.texts, translation=results)
+            return BatchTranslationResponse(original=request.texts, translation=results, repetition_detected=flags)
+        except InferenceOverloadedError:
+            raise
         except Exception as e:
             raise ValueError(f"Translation failed: {str(e)}")
@@ -0,0 +1,89 @@
+# tests/conftest.py
+# 작은 랜덤 Transformer로 decoding / state_dict 로드 동작을 확인하는 테스트 공통 설정
+#
+# 사용법 (backend 폴더에서):
+#   uv run pytest tests
+#
+# @@@ app.core.config는 import 시 현재 폴더의 config.yaml을 읽으므로
+#     config.yaml이 없으면 config_ex.yaml을 복사한 임시 폴더로 이동한 뒤 app 모듈을 import
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+import torch
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+if not os.path.exists("config.yaml"):
+    config_dir = tempfile.mkdtemp(prefix="translator-tests-")
+    shutil.copy(os.path.join(BACKEND_DIR, "config_ex.yaml"), os.path.join(config_dir, "config.yaml"))
+    os.chdir(config_dir)
+
+from app.ml.transformer import Transformer  # noqa: E402
+
+
+LEN_VOCAB = 40
+START_IDX = LEN_VOCAB - 1
+END_IDX = 1
+PADDING_IDX = 0
+UNK_IDX = 2
+
+
+def make_model(seed: int = 0, **kwargs) -> Transformer:
+    """seed로 초기화한 작은 Transformer (dropout 없음, eval 모드)"""
+    torch.manual_seed(seed)
+    model = Transformer(
+        src_len_vocab=LEN_VOCAB,
+        tgt_len_vocab=LEN_VOCAB,
+        start_idx=START_IDX,
+        end_idx=END_IDX,
+        padding_idx=PADDING_IDX,
+        unk_idx=UNK_IDX,
+        max_len=64,
+        q_dim=32,
+        k_dim=32,
+        v_dim=32,
+        h_dim=64,
+        head_num=4,
+        en_block_num=2,
+        de_block_num=3,
+        drop_rate=0.0,
+        **kwargs,
+    )
+    return model.eval()
+
+
+def make_batch(seed: int = 0, lengths=(9, 5, 12, 3)):
+    """길이가 다른 문장들을 pad로 맞춘 (x, x_mask) (eos로 끝남)"""
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.full((len(lengths), max(lengths)), PADDING_IDX, dtype=torch.long)
+    for i, n in enumerate(lengths):
+        x[i, :n - 1] = torch.randint(UNK_IDX + 1, START_IDX, (n - 1,), generator=generator)
+        x[i, n - 1] = END_IDX
+    x_mask = (x != PADDING_IDX).long()
+    return x, x_mask
+
+
+def strip_preds(preds: torch.Tensor):
+    """(b, pred_len) 결과 ==> 문장별 토큰 id 리스트 (eos 포함, 뒤쪽 pad 제외)"""
+    rows = []
+    for row in preds.tolist():
+        while row and row[-1] == PADDING_IDX:
+            row.pop()
+        rows.append(row)
+    return rows
+
+
+@pytest.fixture
+def model():
+    return make_model()
+
+
+@pytest.fixture
+def batch():
+    return make_batch()
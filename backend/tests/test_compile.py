@@ -0,0 +1,30 @@
+# tests/test_compile.py
+# compile_inference(torch.compile) 후에도 greedy decoding이 실패 없이 eager와 같은 토큰을 내는지 확인
+
+import pytest
+import torch
+
+from conftest import make_batch, make_model, strip_preds
+
+
+MAX_PRED_LEN = 16
+
+
+@pytest.mark.parametrize("packed_encoder", [False, True])
+@torch.no_grad()
+def test_compiled_inference_matches_eager(packed_encoder):
+    model = make_model()
+    model.packed_encoder = packed_encoder
+    batches = [make_batch(seed=0), make_batch(seed=1, lengths=(6, 11)), make_batch(seed=2, lengths=(4, 8, 2))]
+    # batch 크기 / source 길이가 다른 입력으로 dynamic shape graph 재사용까지 확인
+
+    budgets = [{}, {"len_ratio": 0.5, "len_offset": 1}]
+    # 문장별 길이 제한 (eos 강제) 경로도 같이 확인
+    expected = [[model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True, **kwargs) for kwargs in budgets] for x, x_mask in batches]
+
+    model.compile_inference()
+    assert model.compiled
+    for (x, x_mask), eager in zip(batches, expected):
+        for kwargs, preds in zip(budgets, eager):
+            compiled = model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True, **kwargs)
+            assert strip_preds(compiled) == strip_preds(preds)
@@ -0,0 +1,88 @@
+# tests/test_engine.py
+# continuous batching 엔진(ContinuousBatchingEngine)이 문장별 greedy decoding(inference)과 같은 토큰을 내는지 확인
+
+import pytest
+import torch
+
+from app.ml.engine import ContinuousBatchingEngine
+from conftest import END_IDX, make_batch, strip_preds
+
+
+MAX_PRED_LEN = 16
+TIMEOUT = 60
+
+
+def source_ids(x, x_mask):
+    # padding된 batch ==> 문장별 source 토큰 id 리스트 (translate_continuous 입력과 같은 형태)
+    return [row[:n].tolist() for row, n in zip(x, x_mask.sum(dim=1).tolist())]
+
+
+def greedy(model, src_ids, max_len):
+    # 문장 1개짜리 batch의 greedy decoding 결과 (eos 포함)
+    x = torch.tensor([src_ids], dtype=torch.long)
+    return strip_preds(model.inference(x, torch.ones_like(x), max_len, use_cache=True))[0]
+
+
+@pytest.mark.parametrize("max_batch_rows", [1, 2, 3])
+@torch.no_grad()
+def test_engine_matches_single_row_inference(model, max_batch_rows):
+    # 대기열 / batch 합류 / 중간 종료가 섞이도록 요청을 여러 번에 나눠서 제출
+    sources = source_ids(*make_batch(seed=0)) + source_ids(*make_batch(seed=1, lengths=(7, 2, 10)))
+    max_lens = [MAX_PRED_LEN, 4, MAX_PRED_LEN, 9, 3, MAX_PRED_LEN, 6]
+    # 일부 문장은 짧은 최대 생성 길이로 eos 없이 끝나도록 함
+
+    engine = ContinuousBatchingEngine(model, "cpu", max_batch_rows=max_batch_rows)
+    engine.start()
+    try:
+        futures = [engine.submit(ids, n) for ids, n in zip(sources[:3], max_lens[:3])]
+        futures[0].result(timeout=TIMEOUT)
+        # 첫 요청이 끝난 뒤 나머지를 제출해서 decoding 중인 batch에 합류
+        futures += [engine.submit(ids, n) for ids, n in zip(sources[3:], max_lens[3:])]
+        results = [f.result(timeout=TIMEOUT) for f in futures]
+    finally:
+        engine.stop()
+
+    for (tokens, looped), ids, n in zip(results, sources, max_lens):
+        assert tokens == greedy(model, ids, n)
+        assert tokens[-1] == END_IDX
+        assert not looped
+
+
+@pytest.mark.parametrize("len_ratio, len_offset", [(0.5, 0), (1.0, 2), (4.0, 0)])
+@torch.no_grad()
+def test_engine_matches_inference_budgets(model, len_ratio, len_offset):
+    # 문장별 길이 제한(decode_budgets)을 엔진의 최대 생성 길이로 준 결과가 inference(len_ratio=...)와 같아야 함
+    # # 두 경로 모두 길이 제한은 eos를 제외한 생성 토큰 수 (마지막 (4.0, 0)은 모든 문장이 MAX_PRED_LEN으로 제한되는 경우)
+    x, x_mask = make_batch()
+    budgets = model.decode_budgets(x_mask, MAX_PRED_LEN, len_ratio, len_offset).tolist()
+    expected = strip_preds(model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True, len_ratio=len_ratio, len_offset=len_offset))
+
+    engine = ContinuousBatchingEngine(model, "cpu", max_batch_rows=2)
+    engine.start()
+    try:
+        futures = [engine.submit(ids, n) for ids, n in zip(source_ids(x, x_mask), budgets)]
+        results = [f.result(timeout=TIMEOUT)[0] for f in futures]
+    finally:
+        engine.stop()
+
+    assert results == expected
+    for tokens, budget in zip(results, budgets):
+        assert len(tokens) <= budget + 1 and tokens[-1] == END_IDX
+
+
+@torch.no_grad()
+def test_engine_stop_fails_queued_requests(model):
+    # 종료 시 batch에 있는 요청과 대기열에 남은 요청 모두 예외로 끝나야 함
+    engine = ContinuousBatchingEngine(model, "cpu", max_batch_rows=1)
+    futures = [engine.submit(ids, MAX_PRED_LEN) for ids in source_ids(*make_batch())]
+    engine.start()
+    engine.stop()
+
+    for f in futures:
+        assert f.done()
+        if f.exception() is None:
+            assert f.result()[0][-1] == END_IDX
+
+    late = engine.submit([5, 6, END_IDX], MAX_PRED_LEN)
+    with pytest.raises(RuntimeError):
+        late.result(timeout=0)
@@ -0,0 +1,52 @@
+# tests/test_fused_qkv.py
+# make_Q/make_K/make_V로 저장된 (기존) state_dict가 fused make_QKV 모듈에 그대로 로드되는지 확인
+
+import torch
+
+from app.ml.blocks import MultiHeadAttention
+from conftest import PADDING_IDX, START_IDX, make_batch, make_model, strip_preds
+
+
+def split_qkv(state_dict):
+    # make_QKV.weight / bias를 Q, K, V 순서로 나눠서 기존 체크포인트 형식의 state_dict로 변환
+    old = {}
+    for key, value in state_dict.items():
+        if ".make_QKV." in key:
+            for x, part in zip("QKV", value.chunk(3, dim=0)):
+                old[key.replace(".make_QKV.", f".make_{x}.")] = part.clone()
+        else:
+            old[key] = value.clone()
+    return old
+
+
+@torch.no_grad()
+def test_mha_loads_separate_projections():
+    torch.manual_seed(0)
+    unfused = MultiHeadAttention(q_dim=32, k_dim=32, v_dim=32, head_num=4, drop_rate=0.0).eval()
+    fused = MultiHeadAttention(q_dim=32, k_dim=32, v_dim=32, head_num=4, drop_rate=0.0, fused_qkv=True).eval()
+    fused.load_state_dict(unfused.state_dict())
+
+    x = torch.randn(3, 7, 32)
+    mask = torch.ones(3, 1, 1, 7, dtype=torch.bool)
+    mask[1, ..., 4:] = False
+    mask[2, ..., 2:] = False
+
+    torch.testing.assert_close(fused(x, x, x, mask), unfused(x, x, x, mask))
+
+
+@torch.no_grad()
+def test_transformer_loads_separate_projections():
+    model = make_model(seed=0)
+    old = split_qkv(model.state_dict())
+    assert not any(".make_QKV." in key for key in old)
+
+    loaded = make_model(seed=1)
+    loaded.load_state_dict(old)
+    # strict 로드 (missing / unexpected key 없음)
+
+    x, x_mask = make_batch()
+    gt = torch.cat([torch.full((x.size(0), 1), START_IDX, dtype=torch.long), x[:, :-1]], dim=1)
+    gt_mask = (gt != PADDING_IDX).long()
+    torch.testing.assert_close(loaded(x, gt, x_mask, gt_mask), model(x, gt, x_mask, gt_mask))
+
+    assert strip_preds(loaded.inference(x, x_mask, 16, use_cache=True)) == strip_preds(model.inference(x, x_mask, 16, use_cache=True))
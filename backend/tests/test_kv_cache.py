@@ -0,0 +1,26 @@
+# tests/test_kv_cache.py
+# KV cache incremental decoding(use_cache=True)이 매 step ys 전체를 다시 계산하는 경로(use_cache=False)와 같은 토큰을 내는지 확인
+
+import pytest
+import torch
+
+from conftest import END_IDX, make_batch, make_model, strip_preds
+
+
+MAX_PRED_LEN = 20
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("eos_bias", [0.0, 2.0, 4.0])
+# eos_bias: ffc의 eos logit bias를 올려서 batch 안의 문장들이 서로 다른 위치에서 eos로 끝나도록 함
+@torch.no_grad()
+def test_cached_greedy_matches_uncached(seed, eos_bias):
+    model = make_model(seed=seed)
+    model.ffc.bias[END_IDX] += eos_bias
+    x, x_mask = make_batch(seed=seed, lengths=(9, 5, 12, 3, 7))
+    # 길이가 다른 문장들을 pad로 맞춘 batch
+
+    cached = model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True)
+    uncached = model.inference(x, x_mask, MAX_PRED_LEN, use_cache=False)
+
+    assert strip_preds(cached) == strip_preds(uncached)
@@ -0,0 +1,25 @@
+# tests/test_packed_encoder.py
+# pad 토큰을 제거한 packed encoder(packed_encoder=True) 출력이 mask만 쓰는 기존 encoder 출력과 같은지 확인
+
+import pytest
+import torch
+
+from conftest import make_batch, make_model
+
+
+@pytest.mark.parametrize("lengths", [(9, 5, 12, 3), (6, 6), (1, 10, 4)])
+@torch.no_grad()
+def test_packed_encoder_matches_masked(lengths):
+    model = make_model()
+    x, x_mask = make_batch(lengths=lengths)
+    src_mask = model.make_pad_mask(x_mask)
+
+    model.packed_encoder = False
+    masked = model.encode(x, src_mask)
+    model.packed_encoder = True
+    packed = model.encode(x, src_mask)
+
+    valid = x_mask.bool()
+    torch.testing.assert_close(packed[valid], masked[valid])
+    # @@@ pad 위치 출력은 packed encoder에서 0이고 encoder-decoder attention에서 src_mask로 가려지므로 비교에서 제외
+    assert not packed[~valid].any()
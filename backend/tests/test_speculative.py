@@ -0,0 +1,56 @@
+# tests/test_speculative.py
+# speculative_inference (shallow self-draft)가 greedy decoding(inference)과 같은 토큰을 내는지 확인
+
+import pytest
+import torch
+
+from app.ml.repetition import RepetitionDetector
+from conftest import END_IDX, make_batch, make_model, strip_preds
+
+
+MAX_PRED_LEN = 24
+
+
+@pytest.mark.parametrize("eos_bias", [0.0, 3.0])
+# eos_bias: ffc의 eos logit bias를 올려서 문장마다 다른 위치에서 eos가 나오도록 함
+@pytest.mark.parametrize("draft_blocks, n_draft", [(1, 2), (2, 4), (3, 8)])
+@torch.no_grad()
+def test_speculative_matches_greedy(model, batch, eos_bias, draft_blocks, n_draft):
+    x, x_mask = batch
+    model.ffc.bias[END_IDX] += eos_bias
+
+    expected = model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True)
+    preds, _ = model.speculative_inference(x, x_mask, MAX_PRED_LEN, draft_blocks=draft_blocks, n_draft=n_draft)
+
+    assert strip_preds(preds) == strip_preds(expected)
+
+
+@pytest.mark.parametrize("len_ratio, len_offset", [(0.5, 0), (1.0, 2)])
+@torch.no_grad()
+def test_speculative_matches_greedy_with_budgets(model, batch, len_ratio, len_offset):
+    # 문장별 길이 제한에 도달한 위치에서 greedy와 같이 eos로 끝나야 함
+    x, x_mask = batch
+
+    expected = model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True, len_ratio=len_ratio, len_offset=len_offset)
+    preds, _ = model.speculative_inference(x, x_mask, MAX_PRED_LEN, len_ratio=len_ratio, len_offset=len_offset)
+
+    assert strip_preds(preds) == strip_preds(expected)
+    budgets = model.decode_budgets(x_mask, MAX_PRED_LEN, len_ratio, len_offset)
+    for row, budget in zip(strip_preds(preds), budgets.tolist()):
+        assert len(row) <= budget + 1 and row[-1] == END_IDX
+        # 길이 제한은 eos를 제외한 생성 토큰 수
+
+
+@torch.no_grad()
+def test_speculative_matches_greedy_with_repetition():
+    # 반복 루프로 판정된 문장은 greedy와 같은 위치에서 잘리고 판정 여부도 같아야 함
+    model = make_model(seed=1)
+    x, x_mask = make_batch(seed=1)
+    detector = RepetitionDetector(max_period=4, min_repeats=2, min_span=4)
+
+    expected_flags, flags = [], []
+    expected = model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True, repeat=detector, repeat_flags=expected_flags)
+    preds, _ = model.speculative_inference(x, x_mask, MAX_PRED_LEN, repeat=detector, repeat_flags=flags)
+
+    assert strip_preds(preds) == strip_preds(expected)
+    assert flags == expected_flags
@@ -0,0 +1,108 @@
+# tests/test_translation_memory.py
+# 번역 메모리 검색(TranslationMemory)과 memory_inference가 greedy decoding(inference)과 같은 토큰을 내는지 확인
+
+import pytest
+import torch
+
+from app.ml.repetition import RepetitionDetector
+from app.ml.translation_memory import TranslationMemory
+from conftest import END_IDX, PADDING_IDX, START_IDX, UNK_IDX, strip_preds
+
+
+MAX_PRED_LEN = 24
+
+
+def perturb(tokens, position):
+    # position 위치 토큰만 다른 토큰으로 바꾼 draft
+    tokens = list(tokens)
+    if position < len(tokens) - 1:
+        tokens[position] = UNK_IDX + 1 if tokens[position] != UNK_IDX + 1 else UNK_IDX + 2
+    return tokens
+
+
+def make_drafts(greedy, kind):
+    if kind == "exact":
+        return greedy
+    if kind == "perturbed":
+        # 문장마다 다른 위치에서 greedy와 어긋나는 draft
+        return [perturb(tokens, i) for i, tokens in enumerate(greedy)]
+    if kind == "extended":
+        # greedy 결과 뒤에 토큰이 더 붙은 draft (eos 위치에서 어긋남)
+        return [tokens[:-1] + [UNK_IDX + 1] * 3 + [END_IDX] for tokens in greedy]
+    if kind == "mixed":
+        # draft가 없는 문장과 섞인 batch
+        return [tokens if i % 2 == 0 else None for i, tokens in enumerate(greedy)]
+    raise ValueError(kind)
+
+
+@pytest.mark.parametrize("kind", ["exact", "perturbed", "extended", "mixed"])
+@torch.no_grad()
+def test_memory_inference_matches_greedy(model, batch, kind):
+    x, x_mask = batch
+
+    expected = model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True)
+    drafts = make_drafts(strip_preds(expected), kind)
+    preds, _ = model.memory_inference(x, x_mask, MAX_PRED_LEN, drafts)
+
+    assert strip_preds(preds) == strip_preds(expected)
+    # inference(drafts=...)도 memory_inference 결과를 그대로 반환
+    assert strip_preds(model.inference(x, x_mask, MAX_PRED_LEN, drafts=drafts)) == strip_preds(expected)
+
+
+@pytest.mark.parametrize("kind", ["exact", "perturbed"])
+@torch.no_grad()
+def test_memory_inference_matches_greedy_with_budgets_and_repetition(model, batch, kind):
+    # draft가 문장별 길이 제한보다 길어도 greedy와 같은 위치에서 끝나야 함
+    x, x_mask = batch
+    untrimmed = strip_preds(model.inference(x, x_mask, MAX_PRED_LEN, use_cache=True))
+    detector = RepetitionDetector(max_period=4, min_repeats=2, min_span=4)
+
+    expected_flags, flags = [], []
+    expected = model.inference(
+        x, x_mask, MAX_PRED_LEN, use_cache=True, len_ratio=0.5, len_offset=1, repeat=detector, repeat_flags=expected_flags
+    )
+    preds, _ = model.memory_inference(
+        x, x_mask, MAX_PRED_LEN, make_drafts(untrimmed, kind), len_ratio=0.5, len_offset=1, repeat=detector, repeat_flags=flags
+    )
+
+    assert strip_preds(preds) == strip_preds(expected)
+    assert flags == expected_flags
+
+
+def test_lookup_exact_and_similar():
+    memory = TranslationMemory(max_entries=4, min_similarity=0.7, ignore_ids=[PADDING_IDX, END_IDX, UNK_IDX, START_IDX])
+    memory.add([10, 11, 12, 13, 14, 15, END_IDX], [20, 21, END_IDX])
+
+    assert memory.lookup([10, 11, 12, 13, 14, 15, END_IDX]) == [20, 21, END_IDX]
+    assert memory.lookup([10, 11, 12, 13, 14, 16, END_IDX]) == [20, 21, END_IDX]
+    assert memory.lookup([30, 31, 32, END_IDX]) is None
+    assert (memory.hits, memory.misses) == (2, 1)
+
+
+def test_special_tokens_not_indexed():
+    # pad / eos / unk / 시작 토큰은 모든 문장에 나오므로 inverted index에 넣지 않음
+    special = [PADDING_IDX, END_IDX, UNK_IDX, START_IDX]
+    memory = TranslationMemory(max_entries=4, ignore_ids=special)
+    memory.add([10, 11, UNK_IDX, END_IDX], [20, END_IDX])
+    memory.add([12, 13, END_IDX], [21, END_IDX])
+
+    assert not set(special) & set(memory._index)
+    # 특수 토큰만 공유하는 문장은 후보가 되지 않음
+    assert memory.lookup([30, UNK_IDX, END_IDX]) is None
+
+
+def test_common_tokens_skipped_and_eviction():
+    # max_posting보다 많은 문장에 나오는 토큰은 후보 검색에서 건너뜀
+    memory = TranslationMemory(max_entries=3, min_similarity=0.5, max_posting=2, ignore_ids=[END_IDX])
+    for i in range(3):
+        memory.add([5, 10 + i, END_IDX], [20 + i, END_IDX])
+
+    assert len(memory._index[5]) == 3
+    assert memory.lookup([5, 40, END_IDX]) is None
+    assert memory.lookup([5, 11, 41, END_IDX]) == [21, END_IDX]
+
+    # 가장 오래 쓰이지 않은 항목이 삭제되면 index에서도 빠짐
+    memory.add([50, 51, END_IDX], [60, END_IDX])
+    assert len(memory) == 3
+    assert (5, 10, END_IDX) not in memory._index.get(5, set())
+    assert 10 not in memory._index
@@ -0,0 +1,135 @@
+# tools/benchmark_mips.py
+# 전체 ffc + argmax와 근사 MIPS index(app/ml/mips.py)의 다음 토큰 선택 latency, 결과 일치율을 batch 크기별로 비교
+#
+# 사용법 (backend 폴더에서, config.yaml의 MODEL_PATH 체크포인트 사용):
+#   uv run python -m tools.benchmark_mips --input samples_ko.txt --clusters 256 --probe 8 --output report.md
+#
+# @@@ 샘플 문장들을 greedy decoding하면서 ffc에 들어가는 실제 decoder 출력을 모아서 사용
+# @@@ decoder 실행을 제외한 다음 토큰 선택 단계(ffc / index 검색)만 측정, device는 cpu 고정
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from typing import List
+
+from app.ml.mips import MipsIndex
+from app.ml.model_loader import load_model, load_tokenizer
+from tools.common import read_sentences, percentile, greedy_translate
+
+
+def collect_states(model, tokenizer, sentences: List[str], max_len: int) -> torch.Tensor:
+    """greedy decoding 중 ffc 입력(decoder 마지막 위치 출력)을 모은 (n_states, q_dim) tensor"""
+    states = []
+    handle = model.ffc.register_forward_hook(lambda module, inputs, output: states.append(inputs[0].detach().reshape(-1, inputs[0].size(-1))))
+    try:
+        greedy_translate(model, tokenizer, sentences, max_len, batch_size=8)
+    finally:
+        handle.remove()
+    return torch.cat(states).float()
+
+
+@torch.no_grad()
+def run(model, index: MipsIndex, states: torch.Tensor, batch_sizes: List[int], max_batches: int) -> List[dict]:
+    weight, bias = model.ffc_parameters()
+    weight = weight.float()
+    bias = bias.float() if bias is not None else None
+
+    results = []
+    for batch_size in batch_sizes:
+        batches = [states[i:i + batch_size] for i in range(0, states.size(0) - batch_size + 1, batch_size)][:max_batches]
+        if not batches:
+            continue
+
+        # warmup
+        F.linear(batches[0], weight, bias).argmax(dim=-1)
+        index.argmax(batches[0])
+
+        dense_times, index_times = [], []
+        matched = 0
+        fallbacks_before = index.stats["fallbacks"]
+        scored_before = index.stats["scored_rows"]
+
+        for h in batches:
+            t0 = time.perf_counter()
+            dense = F.linear(h, weight, bias).argmax(dim=-1)
+            dense_times.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            approx = index.argmax(h)
+            index_times.append(time.perf_counter() - t0)
+
+            matched += int((dense == approx).sum())
+
+        n_queries = len(batches) * batch_size
+        results.append({
+            "batch_size": batch_size,
+            "n_batches": len(batches),
+            "dense_p50": percentile(dense_times, 0.5),
+            "index_p50": percentile(index_times, 0.5),
+            "agreement": matched / n_queries,
+            "fallback_rate": (index.stats["fallbacks"] - fallbacks_before) / n_queries,
+            "scored_rows": (index.stats["scored_rows"] - scored_before) / n_queries,
+        })
+        print(f"batch size {batch_size}: done")
+
+    return results
+
+
+def make_report(results: List[dict], n_states: int, n_vocab: int, args) -> str:
+    lines = [
+        f"# MIPS index benchmark ({n_states} decoder states, vocab {n_vocab}, clusters {args.clusters}, probe {args.probe}, tolerance {args.tolerance})",
+        "",
+        "| batch size | batches | dense p50 (ms) | index p50 (ms) | speedup | scored rows / query | fallback rate | agreement |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        lines.append(
+            f"| {r['batch_size']} | {r['n_batches']} | {r['dense_p50'] * 1000:.3f} | {r['index_p50'] * 1000:.3f} "
+            f"| {r['dense_p50'] / max(r['index_p50'], 1e-9):.2f}x | {r['scored_rows']:.0f} | {r['fallback_rate']:.4f} | {r['agreement']:.4f} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the dense ffc projection with the approximate MIPS index")
+    parser.add_argument("--input", required=True, help="한 줄에 한 문장인 한국어 샘플 파일 (decoder 출력 수집용)")
+    parser.add_argument("--limit", type=int, default=200, help="앞에서부터 사용할 문장 수 (0이면 전체)")
+    parser.add_argument("--max-len", type=int, default=64)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--probe", type=int, default=8)
+    parser.add_argument("--tolerance", type=float, default=0.0)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--max-batches", type=int, default=200, help="batch 크기별 최대 측정 batch 수")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU 스레드 수 (0이면 기본값)")
+    parser.add_argument("--output", help="리포트를 저장할 markdown 파일 경로")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    model = load_model("cpu")
+    tokenizer = load_tokenizer()
+
+    states = collect_states(model, tokenizer, read_sentences(args.input, args.limit), args.max_len)
+    print(f"collected {states.size(0)} decoder states")
+
+    t0 = time.perf_counter()
+    index = MipsIndex.build(*model.ffc_parameters(), n_clusters=args.clusters, n_probe=args.probe, tolerance=args.tolerance)
+    print(f"index built in {time.perf_counter() - t0:.1f}s")
+
+    results = run(model, index, states[torch.randperm(states.size(0))], args.batch_sizes, args.max_batches)
+    # @@@ 같은 문장의 연속 step끼리 batch로 묶이지 않도록 섞어서 사용
+
+    report = make_report(results, states.size(0), index.rows.size(0), args)
+    print(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# tools/benchmark_precision.py
+# float 모델과 양자화(int8)/저정밀도(bf16) 모델의 latency, RSS, 번역 결과 일치율 비교 리포트 생성
+#
+# 사용법 (backend 폴더에서, config.yaml의 MODEL_PATH 체크포인트 사용):
+#   uv run python -m tools.benchmark_precision --input samples_ko.txt --variants fp32 int8 bf16 embed_int8 --output report.md
+#
+# @@@ 모델마다 별도 프로세스(spawn)에서 로드/실행해서 RSS가 다른 모델의 메모리에 섞이지 않도록 측정
+# @@@ CPU 서빙 기준 측정이므로 device는 cpu 고정
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import List
+
+from tools.common import read_sentences, rss_mb, percentile, greedy_translate, agreement
+
+
+VARIANTS = {
+    "fp32": {"quantization": "none"},
+    "int8": {"quantization": "dynamic_int8"},
+    "bf16": {"precision": "bf16"},
+    "embed_int8": {"embed_quantization": "int8"},
+    "embed_int4": {"embed_quantization": "int4"},
+    "int8_embed_int8": {"quantization": "dynamic_int8", "embed_quantization": "int8"},
+}
+
+
+def _run_variant(variant: str, sentences: List[str], max_len: int, batch_size: int, n_threads: int) -> dict:
+    # 새 프로세스 안에서 실행됨
+    import torch
+
+    from app.ml.model_loader import load_model, load_tokenizer
+
+    if n_threads > 0:
+        torch.set_num_threads(n_threads)
+
+    tokenizer = load_tokenizer()
+    rss_before = rss_mb()
+
+    t0 = time.perf_counter()
+    model = load_model("cpu", **VARIANTS[variant])
+    load_sec = time.perf_counter() - t0
+    rss_model = rss_mb() - rss_before
+
+    # warmup (첫 실행의 메모리 할당, 커널 선택 비용 제외)
+    greedy_translate(model, tokenizer, sentences[:batch_size], max_len, batch_size)
+
+    outputs, latencies = greedy_translate(model, tokenizer, sentences, max_len, batch_size)
+
+    return {
+        "variant": variant,
+        "load_sec": load_sec,
+        "rss_model_mb": rss_model,
+        "rss_total_mb": rss_mb(),
+        "latencies": latencies,
+        "outputs": outputs,
+    }
+
+
+def run(variants: List[str], sentences: List[str], max_len: int, batch_size: int, n_threads: int) -> List[dict]:
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for variant in variants:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results.append(pool.submit(_run_variant, variant, sentences, max_len, batch_size, n_threads).result())
+        print(f"{variant}: done")
+    return results
+
+
+def make_report(results: List[dict], n_sentences: int, batch_size: int) -> str:
+    reference = results[0]
+    lines = [
+        f"# precision benchmark ({n_sentences} sentences, batch size {batch_size}, reference: {reference['variant']})",
+        "",
+        "| variant | model RSS (MB) | total RSS (MB) | load (s) | batch p50 (ms) | batch p95 (ms) | total (s) | speedup | exact match | token agreement |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+
+    ref_total = sum(reference["latencies"])
+    for r in results:
+        total = sum(r["latencies"])
+        exact, token = agreement(reference["outputs"], r["outputs"])
+        lines.append(
+            f"| {r['variant']} | {r['rss_model_mb']:.0f} | {r['rss_total_mb']:.0f} | {r['load_sec']:.1f} "
+            f"| {percentile(r['latencies'], 0.5) * 1000:.1f} | {percentile(r['latencies'], 0.95) * 1000:.1f} "
+            f"| {total:.2f} | {ref_total / max(total, 1e-9):.2f}x | {exact:.3f} | {token:.3f} |"
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency, RSS and output agreement of model precision variants")
+    parser.add_argument("--input", required=True, help="한 줄에 한 문장인 한국어 샘플 파일")
+    parser.add_argument("--variants", nargs="+", default=["fp32", "int8"], choices=list(VARIANTS), help="첫 번째 variant가 일치율 기준")
+    parser.add_argument("--limit", type=int, default=0, help="앞에서부터 사용할 문장 수 (0이면 전체)")
+    parser.add_argument("--max-len", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU 스레드 수 (0이면 기본값)")
+    parser.add_argument("--output", help="리포트를 저장할 markdown 파일 경로")
+    args = parser.parse_args()
+
+    sentences = read_sentences(args.input, args.limit)
+    results = run(args.variants, sentences, args.max_len, args.batch_size, args.threads)
+
+    report = make_report(results, len(sentences), args.batch_size)
+    print(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
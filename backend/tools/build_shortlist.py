@@ -0,0 +1,119 @@
+# tools/build_shortlist.py
+# 한국어-영어 병렬 코퍼스에서 source 토큰별 target 후보 토큰 목록(vocabulary shortlist) 생성
+#
+# 사용법 (backend 폴더에서, 두 파일은 같은 줄끼리 번역 쌍):
+#   uv run python -m tools.build_shortlist --src corpus.ko --tgt corpus.en --output models/shortlist.pt
+# ==> config.yaml에 VOCAB_SHORTLIST_PATH: "models/shortlist.pt" 설정
+#
+# @@@ 코퍼스 전체 target 토큰 출현 문장 수 상위 --n-frequent개는 항상 후보에 포함하고
+#     source 토큰별로는 그 외 토큰 중 같은 문장 쌍에 함께 나온 횟수 상위 --top-k개를 저장
+# @@@ 마지막에 코퍼스 앞쪽 문장들로 정답 target 토큰이 shortlist에 포함되는 비율(coverage)과 평균 후보 수 출력
+
+import argparse
+import os
+
+from collections import Counter, defaultdict
+
+import torch
+
+from typing import Dict, List, Tuple
+
+from app.ml.model_loader import load_tokenizer
+from app.ml.shortlist import VocabShortlist
+from app.core.config import settings
+from tools.common import read_sentences
+
+
+def tokenize(tokenizer, sentences: List[str], batch_size: int = 1000) -> List[List[int]]:
+    ids = []
+    for start in range(0, len(sentences), batch_size):
+        ids.extend(tokenizer(sentences[start:start + batch_size], truncation=True, max_length=512)['input_ids'])
+    return ids
+
+
+def count_pairs(src_ids: List[List[int]], tgt_ids: List[List[int]]) -> Tuple[Dict[int, Counter], Counter]:
+    """(source 토큰별 함께 나온 target 토큰 문장 수, target 토큰별 출현 문장 수)"""
+    cooc = defaultdict(Counter)
+    tgt_freq = Counter()
+
+    for src, tgt in zip(src_ids, tgt_ids):
+        tgt_set = set(tgt)
+        tgt_freq.update(tgt_set)
+        for s in set(src):
+            cooc[s].update(tgt_set)
+
+    return cooc, tgt_freq
+
+
+def build(cooc: Dict[int, Counter], tgt_freq: Counter, n_vocab: int, top_k: int, n_frequent: int, min_count: int) -> dict:
+    frequent = [t for t, _ in tgt_freq.most_common(n_frequent)]
+    frequent_set = set(frequent)
+
+    # source 토큰 id 순서대로 후보를 이어붙인 CSR 형태로 저장
+    offsets = [0]
+    targets = []
+    for s in range(n_vocab):
+        candidates = [t for t, c in cooc[s].most_common() if c >= min_count and t not in frequent_set][:top_k] if s in cooc else []
+        targets.extend(sorted(candidates))
+        offsets.append(len(targets))
+
+    return {
+        "offsets": torch.tensor(offsets, dtype=torch.long),
+        "targets": torch.tensor(targets, dtype=torch.long),
+        "frequent": torch.tensor(sorted(frequent), dtype=torch.long),
+        "top_k": top_k,
+        "n_frequent": n_frequent,
+    }
+
+
+def evaluate(data: dict, src_ids: List[List[int]], tgt_ids: List[List[int]]) -> Tuple[float, float]:
+    """문장 1개 batch 기준 (정답 target 토큰 coverage, 평균 후보 수)"""
+    shortlist = VocabShortlist(data["offsets"], data["targets"], data["frequent"], [settings.START_IDX, settings.END_IDX, settings.PADDING_IDX, settings.UNK_IDX])
+
+    covered = 0
+    total = 0
+    n_candidates = 0
+    for src, tgt in zip(src_ids, tgt_ids):
+        vocab = set(shortlist.candidates(torch.tensor([src])).tolist())
+        covered += sum(t in vocab for t in tgt)
+        total += len(tgt)
+        n_candidates += len(vocab)
+
+    return covered / max(1, total), n_candidates / max(1, len(src_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a source-conditioned target vocabulary shortlist from a parallel corpus")
+    parser.add_argument("--src", required=True, help="한 줄에 한 문장인 한국어 코퍼스 파일")
+    parser.add_argument("--tgt", required=True, help="--src와 같은 줄끼리 번역 쌍인 영어 코퍼스 파일")
+    parser.add_argument("--output", default="models/shortlist.pt")
+    parser.add_argument("--top-k", type=int, default=100, help="source 토큰별 후보 target 토큰 수")
+    parser.add_argument("--n-frequent", type=int, default=2000, help="항상 후보에 포함할 자주 나오는 target 토큰 수")
+    parser.add_argument("--min-count", type=int, default=2, help="후보로 저장할 최소 동시 출현 문장 수")
+    parser.add_argument("--limit", type=int, default=0, help="앞에서부터 사용할 문장 쌍 수 (0이면 전체)")
+    parser.add_argument("--eval-limit", type=int, default=1000, help="coverage를 측정할 문장 쌍 수")
+    args = parser.parse_args()
+
+    src_sentences = read_sentences(args.src, args.limit)
+    tgt_sentences = read_sentences(args.tgt, args.limit)
+    if len(src_sentences) != len(tgt_sentences):
+        raise ValueError(f"--src and --tgt have different numbers of sentences ({len(src_sentences)} != {len(tgt_sentences)})")
+
+    tokenizer = load_tokenizer()
+    src_ids = tokenize(tokenizer, src_sentences)
+    tgt_ids = tokenize(tokenizer, tgt_sentences)
+    print(f"tokenized {len(src_ids)} sentence pairs")
+
+    cooc, tgt_freq = count_pairs(src_ids, tgt_ids)
+    data = build(cooc, tgt_freq, settings.LEN_VOCAB, args.top_k, args.n_frequent, args.min_count)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    torch.save(data, args.output)
+    print(f"shortlist saved to {args.output} ({data['targets'].numel()} source-target entries, {data['frequent'].numel()} frequent tokens)")
+
+    coverage, mean_candidates = evaluate(data, src_ids[:args.eval_limit], tgt_ids[:args.eval_limit])
+    print(f"reference token coverage: {coverage:.4f}, mean candidates per sentence: {mean_candidates:.0f} / {settings.LEN_VOCAB}")
+
+
+if __name__ == "__main__":
+    main()
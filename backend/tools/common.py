@@ -0,0 +1,113 @@
+# tools/common.py
+# 오프라인 도구들이 공통으로 사용하는 입출력/측정 함수
+
+import math
+import os
+import resource
+import time
+
+from collections import Counter
+
+import torch
+
+from typing import List, Tuple
+
+
+def read_sentences(path: str, limit: int = 0) -> List[str]:
+    """한 줄에 한 문장인 텍스트 파일을 읽어 빈 줄을 제외한 문장 리스트 반환 (limit > 0이면 앞에서 limit개)"""
+    with open(path, "r", encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+    return sentences[:limit] if limit > 0 else sentences
+
+
+def rss_mb() -> float:
+    """현재 프로세스의 resident set size (MB)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # /proc이 없는 환경(macOS 등)에서는 최대 RSS로 대체 (macOS는 byte, linux는 KB 단위)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if os.uname().sysname == "Darwin" else maxrss / 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    """values의 q 분위수 (0 <= q <= 1, 가장 가까운 순위 방식)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@torch.no_grad()
+def greedy_translate(model, tokenizer, sentences: List[str], max_len: int, batch_size: int, device: str = "cpu") -> Tuple[List[List[int]], List[float]]:
+    """sentences를 batch_size씩 greedy decoding (KV cache 사용)
+    반환: (문장별 생성 토큰 id 리스트 (eos 이후 pad 제거, tokenizer id 기준), batch별 실행 시간(초) 리스트)"""
+    remap = model.vocab_remap
+    # vocab을 줄인 체크포인트면 입력은 모델 id로, 출력은 tokenizer id로 변환
+    outputs = []
+    latencies = []
+
+    for start in range(0, len(sentences), batch_size):
+        batch = tokenizer(sentences[start:start + batch_size], padding=True, truncation=True, max_length=512, return_tensors="pt")
+        x = batch['input_ids'].to(device)
+        x_mask = batch['attention_mask'].to(device)
+        if remap is not None:
+            x = remap.src_map.to(device)[x]
+
+        t0 = time.perf_counter()
+        with model.autocast():
+            preds = model.inference(x, x_mask, max_len, use_cache=True)
+        latencies.append(time.perf_counter() - t0)
+
+        if remap is not None:
+            preds = remap.tgt_to_vocab(preds)
+
+        for pred in preds.tolist():
+            while pred and pred[-1] == model.padding_idx:
+                pred.pop()
+            outputs.append(pred)
+
+    return outputs, latencies
+
+
+def agreement(reference: List[List[int]], candidate: List[List[int]]) -> Tuple[float, float]:
+    """(문장 단위 완전 일치 비율, 토큰 단위 위치별 일치 비율)"""
+    exact = sum(r == c for r, c in zip(reference, candidate))
+
+    matched = 0
+    total = 0
+    for r, c in zip(reference, candidate):
+        matched += sum(a == b for a, b in zip(r, c))
+        total += max(len(r), len(c))
+
+    return exact / max(1, len(reference)), matched / max(1, total)
+
+
+def corpus_bleu(hypotheses: List[str], references: List[str], max_n: int = 4) -> float:
+    """공백 단위 토큰 기준 corpus BLEU (0 ~ 100, 참조 번역 1개, smoothing 없음)"""
+    matches = [0] * max_n
+    totals = [0] * max_n
+    hyp_len = ref_len = 0
+
+    for hyp, ref in zip(hypotheses, references):
+        hyp, ref = hyp.split(), ref.split()
+        hyp_len += len(hyp)
+        ref_len += len(ref)
+        for n in range(1, max_n + 1):
+            hyp_ngrams = Counter(tuple(hyp[i:i + n]) for i in range(len(hyp) - n + 1))
+            ref_ngrams = Counter(tuple(ref[i:i + n]) for i in range(len(ref) - n + 1))
+            matches[n - 1] += sum((hyp_ngrams & ref_ngrams).values())
+            # 참조 번역에 나온 횟수까지만 일치로 인정 (clipping)
+            totals[n - 1] += max(0, len(hyp) - n + 1)
+
+    if hyp_len == 0 or min(matches) == 0:
+        return 0.0
+
+    log_precision = sum(math.log(m / t) for m, t in zip(matches, totals)) / max_n
+    brevity = min(0.0, 1 - ref_len / hyp_len)
+    # 번역이 참조보다 짧으면 brevity penalty
+    return 100 * math.exp(log_precision + brevity)
@@ -0,0 +1,182 @@
+# tools/export_onnx.py
+# 체크포인트(settings.MODEL_PATH)에서 encoder와 incremental decoder step을 ONNX로 export
+#
+# 사용법 (backend 폴더에서, onnx / onnxruntime 설치 필요):
+#   uv run python -m tools.export_onnx --output-dir models/onnx
+# ==> models/onnx/encoder.onnx, models/onnx/decoder_step.onnx 생성 후
+#     config.yaml에 INFERENCE_BACKEND: "onnx", ONNX_ENCODER_PATH, ONNX_DECODER_PATH 설정
+#
+# @@@ export 후 같은 입력으로 PyTorch와 ONNX Runtime의 greedy decoding 결과를 비교해서 출력
+# @@@ float32 모델 기준으로 export (QUANTIZATION, PRECISION, COMPILE_MODEL 설정은 무시)
+
+import argparse
+import os
+
+import torch
+import torch.nn as nn
+
+from app.ml import blocks
+from app.ml.model_loader import load_model
+from app.ml.onnx_backend import ENCODER_INPUTS, ENCODER_OUTPUTS, DECODER_INPUTS, DECODER_OUTPUTS, OnnxGreedyDecoder
+from app.core.config import settings
+
+
+class EncoderExport(nn.Module):
+    # source 토큰 ==> decoding block별 encoder-decoder attention key/value (block 수, b, head_num, src_seq_len, head_dim)
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, src_ids, src_mask):
+        out_en = self.model.encoder(self.model.src_embed(src_ids), self.model.make_pad_mask(src_mask))
+        # @@@ ONNX graph에서는 packed encoder 대신 pad를 포함한 일반 encoder 사용
+        cross_kvs = self.model.decoder.precompute_cross_kv(out_en)
+        return torch.stack([K_ for K_, _ in cross_kvs]), torch.stack([V_ for _, V_ in cross_kvs])
+
+
+class DecoderStepExport(nn.Module):
+    # Transformer.decode_step을 cache tensor 입출력 형태로 감싼 모듈
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens, positions, self_k, self_v, self_mask, cross_k, cross_v, src_mask):
+        # tokens: (b, 1), positions: (b,), self_k/self_v: (block 수, b, head_num, cache_len, head_dim)
+        # self_mask: (b, cache_len + 1) bool, cross_k/cross_v: (block 수, b, head_num, src_seq_len, head_dim), src_mask: (b, src_seq_len) bool
+        n_blocks = self_k.size(0)
+
+        caches = []
+        for i in range(n_blocks):
+            cache = blocks.KVCache()
+            cache.K = self_k[i]
+            cache.V = self_v[i]
+            caches.append(cache)
+
+        cross_kvs = [(cross_k[i], cross_v[i]) for i in range(n_blocks)]
+
+        logits = self.model._decode_step(
+            tokens, positions, caches, cross_kvs, self_mask.unsqueeze(1).unsqueeze(2), src_mask.unsqueeze(1).unsqueeze(2)
+        )
+        # @@@ 컴파일된 decode_step이 아닌 eager _decode_step을 trace
+
+        return logits, torch.stack([c.K for c in caches]), torch.stack([c.V for c in caches])
+
+
+def export(model, output_dir: str, opset: int):
+    os.makedirs(output_dir, exist_ok=True)
+    encoder_path = os.path.join(output_dir, "encoder.onnx")
+    decoder_path = os.path.join(output_dir, "decoder_step.onnx")
+
+    n_blocks = len(model.decoder.blocks)
+    for name in ("decoder_self", "decoder_cross"):
+        if len(set(model.head_counts()[name])) > 1:
+            raise ValueError(f"{name} attention head counts differ between blocks {model.head_counts()[name]} (cache tensors are stacked per block)")
+    # @@@ tools/prune_heads.py로 block별 head 수를 다르게 줄인 체크포인트는 block별 cache를 하나의 tensor로 쌓을 수 없다
+    head_num = model.decoder.blocks[0].MMHA.head_num
+    head_dim = model.decoder.blocks[0].MMHA.head_dim
+
+    # 예시 입력 (dynamic axis는 1이 아닌 크기로 trace해야 상수로 고정되지 않는다)
+    b, src_len, cache_len = 2, 7, 3
+    src_ids = torch.randint(3, model.src_len_vocab - 1, (b, src_len))
+    src_mask = torch.ones(b, src_len, dtype=torch.long)
+    src_mask[0, -2:] = 0
+    src_ids[0, -2:] = settings.PADDING_IDX
+
+    torch.onnx.export(
+        EncoderExport(model),
+        (src_ids, src_mask),
+        encoder_path,
+        input_names=ENCODER_INPUTS,
+        output_names=ENCODER_OUTPUTS,
+        dynamic_axes={
+            "src_ids": {0: "batch", 1: "src_len"},
+            "src_mask": {0: "batch", 1: "src_len"},
+            "cross_k": {1: "batch", 3: "src_len"},
+            "cross_v": {1: "batch", 3: "src_len"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    print(f"encoder exported to {encoder_path}")
+
+    with torch.no_grad():
+        cross_k, cross_v = EncoderExport(model)(src_ids, src_mask)
+
+    decoder_args = (
+        torch.randint(3, model.tgt_len_vocab - 1, (b, 1)),
+        torch.full((b,), cache_len, dtype=torch.long),
+        torch.randn(n_blocks, b, head_num, cache_len, head_dim),
+        torch.randn(n_blocks, b, head_num, cache_len, head_dim),
+        torch.ones(b, cache_len + 1, dtype=torch.bool),
+        cross_k,
+        cross_v,
+        src_mask.bool(),
+    )
+
+    torch.onnx.export(
+        DecoderStepExport(model),
+        decoder_args,
+        decoder_path,
+        input_names=DECODER_INPUTS,
+        output_names=DECODER_OUTPUTS,
+        dynamic_axes={
+            "tokens": {0: "batch"},
+            "positions": {0: "batch"},
+            "self_k": {1: "batch", 3: "cache_len"},
+            "self_v": {1: "batch", 3: "cache_len"},
+            "self_mask": {0: "batch", 1: "new_cache_len"},
+            "cross_k": {1: "batch", 3: "src_len"},
+            "cross_v": {1: "batch", 3: "src_len"},
+            "src_mask": {0: "batch", 1: "src_len"},
+            "logits": {0: "batch"},
+            "new_self_k": {1: "batch", 3: "new_cache_len"},
+            "new_self_v": {1: "batch", 3: "new_cache_len"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    print(f"decoder step exported to {decoder_path}")
+
+    return encoder_path, decoder_path
+
+
+@torch.no_grad()
+def verify(model, encoder_path: str, decoder_path: str, max_len: int):
+    # 같은 입력으로 PyTorch greedy decoding과 ONNX Runtime greedy decoding 결과 비교
+    onnx_decoder = OnnxGreedyDecoder(encoder_path, decoder_path, model.start_idx, model.end_idx, model.padding_idx)
+
+    src_ids = torch.randint(3, model.src_len_vocab - 1, (4, 12))
+    src_ids[:, -1] = settings.END_IDX
+    src_mask = torch.ones_like(src_ids)
+    src_ids[:2, 8:] = settings.PADDING_IDX
+    src_ids[:2, 7] = settings.END_IDX
+    src_mask[:2, 8:] = 0
+
+    torch_preds = model.inference(src_ids, src_mask, max_len, use_cache=True).numpy()
+    onnx_preds = onnx_decoder.inference(src_ids.numpy(), src_mask.numpy(), max_len)
+
+    same_shape = torch_preds.shape == onnx_preds.shape
+    print(f"greedy outputs identical: {same_shape and bool((torch_preds == onnx_preds).all())}")
+    if same_shape:
+        print(f"token agreement: {(torch_preds == onnx_preds).mean():.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the encoder and an incremental decoder step to ONNX")
+    parser.add_argument("--output-dir", default="models/onnx")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--skip-verify", action="store_true", help="ONNX Runtime 결과 비교 생략")
+    parser.add_argument("--verify-max-len", type=int, default=32)
+    args = parser.parse_args()
+
+    model = load_model("cpu")
+    model.packed_encoder = False
+
+    encoder_path, decoder_path = export(model, args.output_dir, args.opset)
+
+    if not args.skip_verify:
+        verify(model, encoder_path, decoder_path, args.verify_max_len)
+
+
+if __name__ == "__main__":
+    main()
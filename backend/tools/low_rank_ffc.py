@@ -0,0 +1,156 @@
+# tools/low_rank_ffc.py
+# ffc를 SVD로 rank r의 Linear 2개로 바꿨을 때 rank별 번역 품질(BLEU) / ffc latency / greedy decoding latency 비교 리포트 생성
+#
+# 사용법 (backend 폴더에서, config.yaml의 MODEL_PATH 체크포인트 사용):
+#   uv run python -m tools.low_rank_ffc --input samples_ko.txt --reference samples_en.txt --ranks 64 128 256 --output report.md
+# ==> 리포트로 rank를 고른 뒤 --save-rank 128 --save-path models/ko_en_ffc_r128.pth로 저장하고
+#     config.yaml의 MODEL_PATH를 바꾸면 TranslatorService가 저랭크 ffc로 로드 (app/ml/low_rank.py)
+#
+# @@@ --reference가 없으면 BLEU 대신 원래 ffc의 greedy decoding 결과와의 일치율만 출력
+# @@@ ffc latency는 greedy decoding 중 모은 실제 decoder 출력으로 ffc만 실행한 batch별 p50, device는 cpu 고정
+
+import argparse
+import os
+import time
+
+import torch
+
+from typing import List, Optional
+
+from app.ml import low_rank
+from app.ml.model_loader import load_model, load_tokenizer
+from tools.benchmark_mips import collect_states
+from tools.common import read_sentences, percentile, greedy_translate, agreement, corpus_bleu
+
+
+@torch.no_grad()
+def ffc_latency(ffc, states: torch.Tensor, batch_size: int, max_batches: int) -> float:
+    """decoder 출력 batch별 ffc 실행 시간 p50 (초)"""
+    batches = [states[i:i + batch_size] for i in range(0, states.size(0) - batch_size + 1, batch_size)][:max_batches]
+    ffc(batches[0])
+    # warmup
+
+    times = []
+    for h in batches:
+        t0 = time.perf_counter()
+        ffc(h)
+        times.append(time.perf_counter() - t0)
+    return percentile(times, 0.5)
+
+
+def evaluate(model, tokenizer, sentences: List[str], references: Optional[List[str]], args) -> dict:
+    """현재 model.ffc로 greedy decoding한 (토큰 id 결과, 문장당 decoding 시간, BLEU)"""
+    outputs, latencies = greedy_translate(model, tokenizer, sentences, args.max_len, batch_size=args.batch_size)
+    translations = [t.strip() for t in tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+    return {
+        "outputs": outputs,
+        "decode_ms": 1000 * sum(latencies) / max(1, len(sentences)),
+        "bleu": corpus_bleu(translations, references) if references is not None else None,
+    }
+
+
+def make_report(rows: List[dict], n_sentences: int, args) -> str:
+    lines = [
+        f"# Low-rank ffc ({n_sentences} sentences, batch size {args.batch_size})",
+        "",
+        "| rank | ffc params (M) | relative error | ffc p50 (ms) | decode ms / sentence | BLEU | exact match | token agreement |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for r in rows:
+        bleu = f"{r['bleu']:.2f}" if r["bleu"] is not None else "-"
+        lines.append(
+            f"| {r['rank']} | {r['params'] / 1e6:.2f} | {r['error']:.4f} | {r['ffc_p50'] * 1000:.3f} "
+            f"| {r['decode_ms']:.1f} | {bleu} | {r['exact']:.4f} | {r['token']:.4f} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare low-rank factorizations of the output projection (ffc)")
+    parser.add_argument("--input", required=True, help="한 줄에 한 문장인 한국어 샘플 파일")
+    parser.add_argument("--reference", help="--input과 같은 줄끼리 번역 쌍인 영어 참조 번역 파일 (BLEU 계산)")
+    parser.add_argument("--limit", type=int, default=200, help="앞에서부터 사용할 문장 수 (0이면 전체)")
+    parser.add_argument("--ranks", type=int, nargs="+", default=[32, 64, 128, 192, 256, 384])
+    parser.add_argument("--max-len", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-batches", type=int, default=200, help="ffc latency 측정 최대 batch 수")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU 스레드 수 (0이면 기본값)")
+    parser.add_argument("--output", help="리포트를 저장할 markdown 파일 경로")
+    parser.add_argument("--save-rank", type=int, default=0, help="0보다 크면 이 rank의 저랭크 ffc 체크포인트 저장")
+    parser.add_argument("--save-path", default="models/ko_en_ffc_low_rank.pth")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    model = load_model("cpu")
+    tokenizer = load_tokenizer()
+    if isinstance(model.ffc, low_rank.LowRankLinear):
+        raise ValueError("the checkpoint already has a low-rank ffc")
+
+    sentences = read_sentences(args.input, args.limit)
+    references = read_sentences(args.reference, args.limit) if args.reference else None
+    if references is not None and len(references) != len(sentences):
+        raise ValueError(f"--input and --reference have different numbers of sentences ({len(sentences)} != {len(references)})")
+
+    states = collect_states(model, tokenizer, sentences, args.max_len)
+    states = states[torch.randperm(states.size(0))]
+    print(f"collected {states.size(0)} decoder states")
+
+    dense = model.ffc
+    weight, bias = model.ffc_parameters()
+    t0 = time.perf_counter()
+    svd = low_rank.svd(weight)
+    print(f"svd finished in {time.perf_counter() - t0:.1f}s")
+
+    # 원래 ffc 기준
+    base = evaluate(model, tokenizer, sentences, references, args)
+    rows = [{
+        "rank": "full",
+        "params": sum(p.numel() for p in dense.parameters()),
+        "error": 0.0,
+        "ffc_p50": ffc_latency(dense, states, args.batch_size, args.max_batches),
+        "decode_ms": base["decode_ms"],
+        "bleu": base["bleu"],
+        "exact": 1.0,
+        "token": 1.0,
+    }]
+
+    for rank in sorted(args.ranks):
+        ffc = model.use_low_rank_ffc(rank, svd=svd, bias=bias)
+        result = evaluate(model, tokenizer, sentences, references, args)
+        exact, token = agreement(base["outputs"], result["outputs"])
+        rows.append({
+            "rank": rank,
+            "params": sum(p.numel() for p in ffc.parameters()),
+            "error": low_rank.relative_error(svd[1], rank),
+            "ffc_p50": ffc_latency(ffc, states, args.batch_size, args.max_batches),
+            "decode_ms": result["decode_ms"],
+            "bleu": result["bleu"],
+            "exact": exact,
+            "token": token,
+        })
+        print(f"rank {rank}: done")
+
+    report = make_report(rows, len(sentences), args)
+    print(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+
+    if args.save_rank > 0:
+        model.use_low_rank_ffc(args.save_rank, svd=svd, bias=bias)
+        checkpoint = {"model_state_dict": model.state_dict(), "ffc_rank": args.save_rank, "head_counts": model.head_counts()}
+        # tools/prune_heads.py로 head를 줄인 체크포인트면 block별 head 수도 유지
+        if model.vocab_remap is not None:
+            checkpoint["vocab_remap"] = {"src_ids": model.vocab_remap.src_ids.cpu(), "tgt_ids": model.vocab_remap.tgt_ids.cpu()}
+            # tools/trim_vocab.py로 vocab을 줄인 체크포인트면 토큰 id 목록도 유지
+
+        os.makedirs(os.path.dirname(args.save_path) or ".", exist_ok=True)
+        torch.save(checkpoint, args.save_path)
+        print(f"rank {args.save_rank} checkpoint saved to {args.save_path}")
+
+
+if __name__ == "__main__":
+    main()
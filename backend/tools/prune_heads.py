@@ -0,0 +1,229 @@
+# tools/prune_heads.py
+# attention head별 중요도를 측정하고 중요도가 낮은 head를 실제로 제거한(make_Q/K/V/O 축소) 체크포인트 생성 (재학습 없음)
+#
+# 사용법 (backend 폴더에서, config.yaml의 MODEL_PATH 체크포인트 사용):
+#   uv run python -m tools.prune_heads --input samples_ko.txt --reference samples_en.txt --prune-ratio 0.25 --output report.md
+# ==> 리포트를 확인한 뒤 --save-path models/ko_en_pruned.pth로 저장하고
+#     config.yaml의 MODEL_PATH를 바꾸면 TranslatorService가 block별 head 수로 로드 (Transformer head_counts)
+#
+# @@@ head 중요도 = 해당 head 출력을 0으로 masking했을 때 --input / --reference 쌍의 teacher forcing loss 증가량
+#     (make_O 입력 중 그 head 부분을 0으로 바꾸는 forward pre-hook 사용, head 1개씩 모든 attention에 대해 측정)
+# @@@ 전체 head 중 중요도가 낮은 순서로 --prune-ratio 비율만큼 제거하되 attention마다 최소 --min-heads개는 남긴다
+# @@@ block별 decoder head 수가 다르면 tools/export_onnx.py로 export할 수 없다 (block별 cache를 하나의 tensor로 쌓기 때문)
+
+import argparse
+import os
+
+import torch
+import torch.nn.functional as F
+
+from typing import Dict, List, Tuple
+
+from app.ml.low_rank import LowRankLinear
+from app.ml.model_loader import load_model, load_tokenizer
+from tools.common import read_sentences, greedy_translate, agreement, corpus_bleu
+
+
+def make_batches(model, tokenizer, sentences: List[str], references: List[str], batch_size: int) -> List[Tuple[torch.Tensor, ...]]:
+    """teacher forcing loss 계산용 (x, x_mask, gt, gt_mask, labels) batch 리스트
+    gt = [시작 토큰] + target 토큰 (eos 제외), labels = target 토큰 + eos (pad 위치는 padding_idx)"""
+    remap = model.vocab_remap
+    batches = []
+
+    for start in range(0, len(sentences), batch_size):
+        src = tokenizer(sentences[start:start + batch_size], padding=True, truncation=True, max_length=512, return_tensors="pt")
+        tgt = tokenizer(references[start:start + batch_size], padding=True, truncation=True, max_length=512, return_tensors="pt")
+        x, x_mask = src['input_ids'], src['attention_mask']
+        labels = tgt['input_ids']
+        # tokenizer 출력은 eos로 끝나고 뒤에 pad
+
+        if remap is not None:
+            x = remap.src_map[x]
+            labels = remap.tgt_map[labels]
+            labels = labels.masked_fill(labels < 0, model.unk_idx)
+            # trim된 target 토큰은 unk로 취급
+
+        gt = torch.cat([torch.full((labels.size(0), 1), model.start_idx, dtype=torch.long), labels[:, :-1]], dim=1)
+        gt = gt.masked_fill(gt == model.end_idx, model.padding_idx)
+        # 가장 긴 문장의 eos는 잘려나가고 짧은 문장들의 eos는 pad로 바꿔서 decoder 입력에서 제외
+        gt_mask = (gt != model.padding_idx).long()
+        batches.append((x, x_mask, gt, gt_mask, labels))
+
+    return batches
+
+
+@torch.no_grad()
+def eval_loss(model, batches) -> float:
+    """batches 전체의 토큰당 평균 cross entropy (pad 제외)"""
+    total = 0.0
+    n_tokens = 0
+    for x, x_mask, gt, gt_mask, labels in batches:
+        with model.autocast():
+            logits = model(x, gt, x_mask, gt_mask)
+        total += float(F.cross_entropy(logits.float().flatten(0, 1), labels.flatten(), ignore_index=model.padding_idx, reduction="sum"))
+        n_tokens += int((labels != model.padding_idx).sum())
+    return total / max(1, n_tokens)
+
+
+def head_importance(model, batches, base_loss: float) -> Dict[str, List[List[float]]]:
+    """attention 종류별 block별 head별 masking 시 loss 증가량"""
+    scores = {}
+    for name, modules in model.attention_modules().items():
+        scores[name] = []
+        for i, m in enumerate(modules):
+            block_scores = []
+            for h in range(m.head_num):
+                cols = slice(h * m.head_dim, (h + 1) * m.head_dim)
+
+                def mask_head(module, inputs, cols=cols):
+                    out = inputs[0].clone()
+                    out[..., cols] = 0
+                    return (out,)
+
+                handle = m.make_O.register_forward_pre_hook(mask_head)
+                try:
+                    block_scores.append(eval_loss(model, batches) - base_loss)
+                finally:
+                    handle.remove()
+            scores[name].append(block_scores)
+            print(f"{name} block {i}: {' '.join(f'{s:+.4f}' for s in block_scores)}")
+    return scores
+
+
+def select_heads(scores: Dict[str, List[List[float]]], prune_ratio: float, min_heads: int) -> Dict[str, List[List[int]]]:
+    """중요도가 낮은 head부터 전체의 prune_ratio 비율만큼 제거한 뒤 attention별 남길 head 번호 리스트"""
+    ranked = sorted(
+        (score, name, i, h)
+        for name, block_scores in scores.items()
+        for i, heads in enumerate(block_scores)
+        for h, score in enumerate(heads)
+    )
+    n_prune = int(len(ranked) * prune_ratio)
+
+    keep = {name: [list(range(len(heads))) for heads in block_scores] for name, block_scores in scores.items()}
+    pruned = 0
+    for _, name, i, h in ranked:
+        if pruned >= n_prune:
+            break
+        if len(keep[name][i]) <= min_heads:
+            continue
+        keep[name][i].remove(h)
+        pruned += 1
+    return keep
+
+
+def evaluate(model, tokenizer, sentences: List[str], references: List[str], args) -> dict:
+    outputs, latencies = greedy_translate(model, tokenizer, sentences, args.max_len, batch_size=args.batch_size)
+    translations = [t.strip() for t in tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+    return {
+        "outputs": outputs,
+        "decode_ms": 1000 * sum(latencies) / max(1, len(sentences)),
+        "bleu": corpus_bleu(translations, references),
+    }
+
+
+def make_report(scores, keep, rows: List[dict], n_sentences: int, args) -> str:
+    lines = [
+        f"# Attention head pruning ({n_sentences} sentences, prune ratio {args.prune_ratio}, min heads {args.min_heads})",
+        "",
+        "## Head importance (loss increase when masked, pruned heads in brackets)",
+        "",
+        "| attention | block | " + " | ".join(f"head {h}" for h in range(max(len(h) for b in scores.values() for h in b))) + " |",
+        "|---|---|" + "---|" * max(len(h) for b in scores.values() for h in b),
+    ]
+    for name, block_scores in scores.items():
+        for i, heads in enumerate(block_scores):
+            cells = [f"{s:+.4f}" if h in keep[name][i] else f"[{s:+.4f}]" for h, s in enumerate(heads)]
+            lines.append(f"| {name} | {i} | " + " | ".join(cells) + " |")
+
+    lines += [
+        "",
+        "## Before / after",
+        "",
+        "| model | heads | attention params (M) | loss | decode ms / sentence | BLEU | exact match | token agreement |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for r in rows:
+        lines.append(
+            f"| {r['name']} | {r['heads']} | {r['params'] / 1e6:.2f} | {r['loss']:.4f} | {r['decode_ms']:.1f} "
+            f"| {r['bleu']:.2f} | {r['exact']:.4f} | {r['token']:.4f} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def attention_stats(model) -> Tuple[int, int]:
+    """(전체 head 수, attention projection parameter 수)"""
+    modules = [m for ms in model.attention_modules().values() for m in ms]
+    return sum(m.head_num for m in modules), sum(p.numel() for m in modules for p in m.parameters())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score attention heads and save a checkpoint with the least important heads removed")
+    parser.add_argument("--input", required=True, help="한 줄에 한 문장인 한국어 샘플 파일")
+    parser.add_argument("--reference", required=True, help="--input과 같은 줄끼리 번역 쌍인 영어 참조 번역 파일 (loss / BLEU 계산)")
+    parser.add_argument("--limit", type=int, default=200, help="앞에서부터 사용할 문장 수 (0이면 전체)")
+    parser.add_argument("--prune-ratio", type=float, default=0.25, help="전체 head 중 제거할 비율")
+    parser.add_argument("--min-heads", type=int, default=1, help="attention마다 남길 최소 head 수")
+    parser.add_argument("--max-len", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU 스레드 수 (0이면 기본값)")
+    parser.add_argument("--output", help="리포트를 저장할 markdown 파일 경로")
+    parser.add_argument("--save-path", help="주어지면 head를 제거한 체크포인트 저장")
+    args = parser.parse_args()
+
+    if not 0 <= args.prune_ratio < 1:
+        raise ValueError("--prune-ratio must be in [0, 1)")
+    if args.min_heads < 1:
+        raise ValueError("--min-heads must be at least 1")
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    model = load_model("cpu")
+    tokenizer = load_tokenizer()
+
+    sentences = read_sentences(args.input, args.limit)
+    references = read_sentences(args.reference, args.limit)
+    if len(references) != len(sentences):
+        raise ValueError(f"--input and --reference have different numbers of sentences ({len(sentences)} != {len(references)})")
+
+    batches = make_batches(model, tokenizer, sentences, references, args.batch_size)
+    base_loss = eval_loss(model, batches)
+    print(f"base loss {base_loss:.4f}")
+
+    scores = head_importance(model, batches, base_loss)
+    keep = select_heads(scores, args.prune_ratio, args.min_heads)
+
+    rows = []
+    base = evaluate(model, tokenizer, sentences, references, args)
+    heads, params = attention_stats(model)
+    rows.append({"name": "original", "heads": heads, "params": params, "loss": base_loss, **base, "exact": 1.0, "token": 1.0})
+
+    model.prune_heads(keep)
+    pruned = evaluate(model, tokenizer, sentences, references, args)
+    exact, token = agreement(base["outputs"], pruned["outputs"])
+    heads, params = attention_stats(model)
+    rows.append({"name": "pruned", "heads": heads, "params": params, "loss": eval_loss(model, batches), **pruned, "exact": exact, "token": token})
+
+    report = make_report(scores, keep, rows, len(sentences), args)
+    print(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+
+    if args.save_path:
+        checkpoint = {"model_state_dict": model.state_dict(), "head_counts": model.head_counts()}
+        if model.vocab_remap is not None:
+            checkpoint["vocab_remap"] = {"src_ids": model.vocab_remap.src_ids.cpu(), "tgt_ids": model.vocab_remap.tgt_ids.cpu()}
+            # tools/trim_vocab.py로 vocab을 줄인 체크포인트면 토큰 id 목록도 유지
+        if isinstance(model.ffc, LowRankLinear):
+            checkpoint["ffc_rank"] = model.ffc.rank
+            # tools/low_rank_ffc.py로 저장한 저랭크 ffc 유지
+
+        os.makedirs(os.path.dirname(args.save_path) or ".", exist_ok=True)
+        torch.save(checkpoint, args.save_path)
+        print(f"pruned checkpoint saved to {args.save_path}")
+
+
+if __name__ == "__main__":
+    main()
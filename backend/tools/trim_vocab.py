@@ -0,0 +1,107 @@
+# tools/trim_vocab.py
+# 코퍼스에 나오는 토큰만 남긴 src_embed / tgt_embed / ffc로 vocab을 줄인 체크포인트 생성 (재학습 없음)
+#
+# 사용법 (backend 폴더에서, config.yaml의 MODEL_PATH 체크포인트를 읽어서 --output에 저장):
+#   uv run python -m tools.trim_vocab --src corpus.ko --tgt corpus.en --output models/ko_en_trimmed.pth
+# ==> config.yaml의 MODEL_PATH를 --output 경로로 바꾸면 TranslatorService가 그대로 로드 (app/ml/vocab_remap.py)
+#
+# @@@ source 쪽은 --src 코퍼스, target 쪽은 --tgt 코퍼스에서 --min-count 문장 이상 나온 토큰 + special 토큰만 남긴다
+#     embedding을 공유하는 weight tying(TYINGALL, TYINGSRCTGT, TYINGSRCFFC)이면 source / target 모두 두 목록의 합집합 사용
+# @@@ source 목록에 없는 토큰은 unk로 바뀌고 target 목록에 없는 토큰은 생성되지 않으므로
+#     마지막에 --src 앞쪽 문장들로 원래 체크포인트와 greedy decoding 결과 일치율 출력
+
+import argparse
+import os
+
+from collections import Counter
+
+import torch
+
+from typing import List
+
+from app.ml.model_loader import load_model, load_tokenizer
+from app.core.config import settings, WeightTying
+from tools.build_shortlist import tokenize
+from tools.common import read_sentences, greedy_translate, agreement
+
+
+SHARED_SRC_TGT = (WeightTying.TYINGALL, WeightTying.TYINGSRCTGT, WeightTying.TYINGSRCFFC)
+# source 쪽 embedding과 target 쪽 embedding / ffc가 같은 weight를 쓰는 tying 방식
+
+
+def kept_ids(token_ids: List[List[int]], min_count: int, special_ids: List[int]) -> List[int]:
+    """min_count 문장 이상 나온 토큰 id + special 토큰 id (오름차순)"""
+    counts = Counter()
+    for ids in token_ids:
+        counts.update(set(ids))
+    return sorted({t for t, c in counts.items() if c >= min_count} | set(special_ids))
+
+
+def trim_state_dict(state_dict: dict, src_ids: torch.Tensor, tgt_ids: torch.Tensor) -> dict:
+    """embedding / ffc 행을 남길 토큰 id 순서로 골라낸 state_dict"""
+    rows = {
+        "src_embed.0.embed.weight": src_ids,
+        "tgt_embed.0.embed.weight": tgt_ids,
+        "ffc.weight": tgt_ids,
+        "ffc.bias": tgt_ids,
+        "ffc.up.weight": tgt_ids,
+        "ffc.up.bias": tgt_ids,
+        # tools/low_rank_ffc.py로 저장한 저랭크 ffc (down은 vocab과 무관)
+    }
+    return {
+        key: value.index_select(0, rows[key]).clone() if key in rows else value
+        for key, value in state_dict.items()
+    }
+    # @@@ clone하지 않으면 원래 크기 storage를 공유한 view가 그대로 저장된다
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trim the embedding and output layers to the tokens used by a corpus")
+    parser.add_argument("--src", required=True, help="한 줄에 한 문장인 한국어 코퍼스 파일")
+    parser.add_argument("--tgt", required=True, help="한 줄에 한 문장인 영어 코퍼스 파일")
+    parser.add_argument("--output", default="models/ko_en_trimmed.pth")
+    parser.add_argument("--min-count", type=int, default=1, help="남길 토큰의 최소 출현 문장 수")
+    parser.add_argument("--limit", type=int, default=0, help="앞에서부터 사용할 문장 수 (0이면 전체)")
+    parser.add_argument("--eval-limit", type=int, default=200, help="결과 일치율을 측정할 --src 문장 수 (0이면 생략)")
+    parser.add_argument("--max-len", type=int, default=128)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer()
+    src_sentences = read_sentences(args.src, args.limit)
+    src_tokens = tokenize(tokenizer, src_sentences)
+    tgt_tokens = tokenize(tokenizer, read_sentences(args.tgt, args.limit))
+    print(f"tokenized {len(src_tokens)} source / {len(tgt_tokens)} target sentences")
+
+    special_ids = [settings.PADDING_IDX, settings.END_IDX, settings.UNK_IDX, settings.START_IDX]
+    src_ids = kept_ids(src_tokens, args.min_count, special_ids)
+    tgt_ids = kept_ids(tgt_tokens, args.min_count, special_ids)
+
+    if settings.WEIGHT_TYING in SHARED_SRC_TGT:
+        src_ids = tgt_ids = sorted(set(src_ids) | set(tgt_ids))
+
+    src_ids = torch.tensor(src_ids, dtype=torch.long)
+    tgt_ids = torch.tensor(tgt_ids, dtype=torch.long)
+    print(f"kept {src_ids.numel()} source / {tgt_ids.numel()} target tokens of {settings.LEN_VOCAB}")
+
+    checkpoint = torch.load(settings.MODEL_PATH, map_location="cpu")
+    if "vocab_remap" in checkpoint:
+        raise ValueError(f"{settings.MODEL_PATH} is already trimmed")
+
+    state_dict = trim_state_dict(checkpoint.pop("model_state_dict"), src_ids, tgt_ids)
+    checkpoint = {key: value for key, value in checkpoint.items() if key in ("ffc_rank", "head_counts")}
+    # 저랭크 ffc / head pruning 정보만 유지 (optimizer 상태 등 학습용 항목은 저장하지 않음)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    torch.save({**checkpoint, "model_state_dict": state_dict, "vocab_remap": {"src_ids": src_ids, "tgt_ids": tgt_ids}}, args.output)
+    print(f"trimmed checkpoint saved to {args.output} ({os.path.getsize(args.output) / 2 ** 20:.1f} MB, original {os.path.getsize(settings.MODEL_PATH) / 2 ** 20:.1f} MB)")
+
+    if args.eval_limit > 0:
+        sentences = src_sentences[:args.eval_limit]
+        reference, _ = greedy_translate(load_model("cpu"), tokenizer, sentences, args.max_len, batch_size=8)
+        trimmed, _ = greedy_translate(load_model("cpu", path=args.output), tokenizer, sentences, args.max_len, batch_size=8)
+        exact, token = agreement(reference, trimmed)
+        print(f"greedy outputs vs original checkpoint: sentence exact match {exact:.4f}, token agreement {token:.4f}")
+
+
+if __name__ == "__main__":
+    main()
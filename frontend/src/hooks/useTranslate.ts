@@ -16,6 +16,7 @@ export const translateText = async (data: TranslateRequest): Promise<TranslateRe
     text: data.text,
     max_length: data.max_length ?? 512,  // ?? 512 없으면 해당 필드가 undefined -> backend 에러를 막기 위해 512 변환
     viz: data.viz ?? false,
+    beam_size: data.beam_size,  // undefined면 JSON에서 필드가 생략되어 backend 기본값(None, greedy) 사용
   });
   return response.data;
 };
@@ -25,6 +26,7 @@ export const translateBatch = async (data: TranslateBatchRequest): Promise<Trans
     texts: data.texts,
     max_length: data.max_length ?? 512,  // ?? 512 없으면 해당 필드가 undefined -> backend 에러를 막기 위해 512 변환
     viz: data.viz ?? false,
+    beam_size: data.beam_size,  // undefined면 JSON에서 필드가 생략되어 backend 기본값(None, greedy) 사용
   });
   return response.data;
 };
@@ -56,12 +56,14 @@ export interface TranslateRequest {
   text: string;
   max_length?: number;
   viz?: boolean;
+  beam_size?: number; // 생략하면 greedy decoding
 }
 
 export interface TranslateBatchRequest {
   texts: string[];
   max_length?: number;
   viz?: boolean;
+  beam_size?: number; // 생략하면 greedy decoding
 }
 
 export interface TranslateResponse {